@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Local stub of the Emergent Auth session-data API for AIRA backend
+Injects latency and errors so the auth provider circuit breaker can be
+exercised without the real provider.
+
+    python auth_provider_stub.py --port 8099 --latency 5 --error-rate 0.5
+    EMERGENT_AUTH_SESSION_API=http://localhost:8099/session-data uvicorn server:app
+
+Every session id maps to a deterministic test user.
+"""
+
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(latency, error_rate):
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+
+            if random.random() < error_rate:
+                self.send_response(502)
+                self.end_headers()
+                return
+
+            session_id = self.headers.get("X-Session-ID")
+            if not session_id:
+                self.send_response(401)
+                self.end_headers()
+                return
+
+            body = json.dumps({
+                "id": f"stub-{session_id}",
+                "email": f"stub.{session_id}@example.com",
+                "name": "Stub User",
+                "picture": "https://via.placeholder.com/150",
+                "session_token": f"stub_session_{session_id}"
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return StubHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 502")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.latency, args.error_rate))
+    print(f"Auth provider stub on http://127.0.0.1:{args.port} latency={args.latency}s error_rate={args.error_rate}")
+    server.serve_forever()
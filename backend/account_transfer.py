@@ -0,0 +1,286 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+from pydantic import ValidationError
+from bson import ObjectId
+from datetime import datetime, timezone
+from typing import AsyncIterator
+import asyncio
+import json
+import os
+import logging
+
+from models import BusinessProfile, BusinessProfileCreate, BusinessDocument, BUSINESS_TYPES
+from phone_routing import normalize_phone, phone_routes
+from service_suggestions import service_suggestions
+from agent_context import refresh_agent_context
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMAT_VERSION = 1
+TRANSFER_BATCH_SIZE = int(os.environ.get("ACCOUNT_TRANSFER_BATCH_SIZE", 500))
+IMPORT_MAX_LINE_BYTES = 1024 * 1024
+IMPORT_MAX_REPORTED_ERRORS = 20
+
+
+class ImportFormatError(Exception):
+    """
+    Raised when an import stream cannot be applied at all.
+    """
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Cannot export {type(value).__name__}")
+
+
+def _line(record_type: str, data: dict) -> bytes:
+    return (json.dumps({"type": record_type, "data": data}, default=_encode, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+# ==================== Export ====================
+
+async def export_account(db: AsyncIOMotorDatabase, user_id: str) -> AsyncIterator[bytes]:
+    """
+    Stream a user's record, business profiles and document metadata as
+    NDJSON. Businesses are read from a cursor in batches; the documents of
+    each batch are fetched with one indexed query, so memory is bounded by
+    the batch size whatever the size of the account.
+    """
+    yield _line("header", {"version": EXPORT_FORMAT_VERSION, "exported_at": datetime.now(timezone.utc)})
+
+    user = await db.users.find_one({"_id": user_id})
+    if user:
+        yield _line("user", user)
+
+    async def flush(batch: list) -> AsyncIterator[bytes]:
+        for business in batch:
+            yield _line("business", business)
+        documents = db.business_documents.find(
+            {"business_id": {"$in": [str(business["_id"]) for business in batch]}, "user_id": user_id},
+            {"_id": 0, "user_id": 0}
+        ).sort([("business_id", 1), ("id", 1)]).batch_size(TRANSFER_BATCH_SIZE)
+        async for document in documents:
+            yield _line("document", document)
+
+    batch = []
+    cursor = db.business_profiles.find({"user_id": user_id}, {"documents": 0}).batch_size(TRANSFER_BATCH_SIZE)
+    async for business in cursor:
+        batch.append(business)
+        if len(batch) >= TRANSFER_BATCH_SIZE:
+            async for line in flush(batch):
+                yield line
+            batch = []
+    if batch:
+        async for line in flush(batch):
+            yield line
+
+
+# ==================== Import ====================
+
+def _business_key(business_id: str):
+    # Businesses created before string ids were enforced use ObjectIds
+    return ObjectId(business_id) if ObjectId.is_valid(business_id) else business_id
+
+
+class AccountImporter:
+    """
+    Apply an NDJSON export to the account of `user_id`. Business profiles and
+    documents are re-owned by that user and upserted with batched, unordered
+    bulk writes. The user record of the export is not applied: identities
+    come from the auth provider.
+
+    Businesses pass the same checks as when created through the API.
+
+    Exports carry metadata only, so nothing in them may point at files:
+    logos are never imported (an existing business keeps its own), and a
+    document is only accepted when the account already has it with its
+    file; any other document is reported as skipped. Derived fields
+    (normalized phone, document count) are recomputed.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase, user_id: str, batch_size: int = TRANSFER_BATCH_SIZE):
+        self.db = db
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.businesses = []
+        self.documents = []     # (line number, document)
+        # Businesses written by this import; documents of any other business
+        # are refused
+        self.imported = set()
+        self.report = {"businesses": 0, "documents": 0, "skipped": 0, "conflicts": 0, "errors": []}
+
+    def _error(self, line_number: int, message: str):
+        self.report["skipped"] += 1
+        if len(self.report["errors"]) < IMPORT_MAX_REPORTED_ERRORS:
+            self.report["errors"].append({"line": line_number, "error": message})
+
+    async def add_line(self, line_number: int, raw: bytes):
+        if not raw.strip():
+            return
+        try:
+            record = json.loads(raw)
+            record_type, data = record["type"], record["data"]
+        except (ValueError, KeyError, TypeError):
+            self._error(line_number, "Invalid record")
+            return
+
+        if record_type == "header":
+            if data.get("version") != EXPORT_FORMAT_VERSION:
+                raise ImportFormatError(f"Unsupported export version: {data.get('version')}")
+        elif record_type == "business":
+            await self._add_business(line_number, data)
+        elif record_type == "document":
+            await self._add_document(line_number, data)
+        elif record_type != "user":
+            self._error(line_number, f"Unknown record type: {record_type}")
+
+    async def _add_business(self, line_number: int, data: dict):
+        data.pop("documents", None)
+        try:
+            BusinessProfileCreate(**data)
+            business = BusinessProfile(**{**data, "user_id": self.user_id})
+        except ValidationError as e:
+            self._error(line_number, f"Invalid business: {e.errors()[0]['msg']}")
+            return
+        if business.business_type not in BUSINESS_TYPES:
+            self._error(line_number, f"Invalid business_type: {business.business_type}")
+            return
+        business_dict = business.dict(by_alias=True)
+        business_dict["_id"] = _business_key(str(business_dict["_id"]))
+        # A number that is not valid in the numbering plan is kept but not routed
+        business_dict["business_phone_e164"] = normalize_phone(business.business_phone)
+        business_dict["updated_at"] = datetime.now(timezone.utc)
+        self.businesses.append(business_dict)
+        if len(self.businesses) >= self.batch_size:
+            await self._flush_businesses()
+
+    async def _add_document(self, line_number: int, data: dict):
+        business_id = data.get("business_id")
+        try:
+            document = BusinessDocument(**data)
+        except ValidationError as e:
+            self._error(line_number, f"Invalid document: {e.errors()[0]['msg']}")
+            return
+        if not business_id:
+            self._error(line_number, "Document without business_id")
+            return
+        if document.size < 0:
+            self._error(line_number, "Invalid document: negative size")
+            return
+        self.documents.append((line_number, {**document.dict(), "business_id": str(business_id), "user_id": self.user_id}))
+        if len(self.documents) >= self.batch_size:
+            await self._flush_documents()
+
+    async def _bulk_write(self, collection, operations: list) -> tuple[set, set]:
+        """
+        Run an unordered bulk write and return the indexes of operations that
+        hit a unique index and of those that inserted a new record.
+        """
+        try:
+            result = await collection.bulk_write(operations, ordered=False)
+            return set(), set(result.upserted_ids)
+        except BulkWriteError as e:
+            errors = e.details["writeErrors"]
+            if any(err["code"] != 11000 for err in errors):
+                raise
+            return {err["index"] for err in errors}, {upserted["index"] for upserted in e.details["upserted"]}
+
+    async def _document_counts(self, business_ids: list[str]) -> dict:
+        pipeline = [
+            {"$match": {"business_id": {"$in": business_ids}}},
+            {"$group": {"_id": "$business_id", "count": {"$sum": 1}}}
+        ]
+        return {count["_id"]: count["count"] async for count in self.db.business_documents.aggregate(pipeline)}
+
+    async def _flush_businesses(self):
+        batch, self.businesses = self.businesses, []
+        if not batch:
+            return
+
+        # Files are not part of the export: keep the logo the account already
+        # has and count the documents actually stored
+        keys = [business["_id"] for business in batch]
+        existing = {
+            str(business["_id"]): business
+            async for business in self.db.business_profiles.find(
+                {"_id": {"$in": keys}, "user_id": self.user_id},
+                {"logo_url": 1, "logo_id": 1, "logo_size": 1}
+            )
+        }
+        counts = await self._document_counts([str(key) for key in keys])
+        for business in batch:
+            business_id = str(business["_id"])
+            current = existing.get(business_id, {})
+            business["logo_url"] = current.get("logo_url")
+            business["logo_id"] = current.get("logo_id")
+            business["logo_size"] = current.get("logo_size")
+            business["document_count"] = counts.get(business_id, 0)
+
+        operations = [
+            ReplaceOne({"_id": business["_id"], "user_id": self.user_id}, business, upsert=True)
+            for business in batch
+        ]
+        failed, _ = await self._bulk_write(self.db.business_profiles, operations)
+        imported = [business for index, business in enumerate(batch) if index not in failed]
+        for business in imported:
+            self.imported.add(str(business["_id"]))
+            phone_routes.set(str(business["_id"]), business["business_phone_e164"])
+            service_suggestions.set_business(str(business["_id"]), business["business_type"], business["custom_services"])
+        await asyncio.gather(*[refresh_agent_context(self.db, business["_id"]) for business in imported])
+        self.report["businesses"] += len(imported)
+        self.report["conflicts"] += len(failed)
+
+    async def _flush_documents(self):
+        # Documents reference businesses that may still be buffered
+        await self._flush_businesses()
+        batch, self.documents = self.documents, []
+        if not batch:
+            return
+
+        owned = {
+            (document["business_id"], document["id"])
+            async for document in self.db.business_documents.find(
+                {"user_id": self.user_id, "id": {"$in": [document["id"] for _, document in batch]}},
+                {"_id": 0, "business_id": 1, "id": 1}
+            )
+        }
+
+        for line_number, document in batch:
+            business_id = document["business_id"]
+            if business_id not in self.imported:
+                self._error(line_number, "Document of a business that is not part of this import")
+            elif (business_id, document["id"]) in owned:
+                # Already in this account, with its file; nothing to restore
+                self.report["documents"] += 1
+            else:
+                self._error(line_number, "Document file is not part of the export")
+
+    async def finish(self) -> dict:
+        await self._flush_documents()
+        return self.report
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple[int, bytes]]:
+    """
+    Split a byte stream into numbered lines without buffering more than one
+    line (bounded by IMPORT_MAX_LINE_BYTES).
+    """
+    buffer = b""
+    line_number = 0
+    async for chunk in chunks:
+        buffer += chunk
+        while True:
+            end = buffer.find(b"\n")
+            if end < 0:
+                break
+            line_number += 1
+            yield line_number, buffer[:end]
+            buffer = buffer[end + 1:]
+        if len(buffer) > IMPORT_MAX_LINE_BYTES:
+            raise ImportFormatError(f"Line {line_number + 1} exceeds {IMPORT_MAX_LINE_BYTES} bytes")
+    if buffer:
+        yield line_number + 1, buffer
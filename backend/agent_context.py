@@ -0,0 +1,145 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime
+from typing import Optional
+from cache_bus import bus, EvictionTracker
+from models import as_utc
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+HIGHLIGHT_MAX_CHARS = 160
+
+# business_id -> (version, serialized snapshot, cached_at)
+_cache: dict = {}
+# A snapshot read before an eviction of its business may predate the
+# change and is not cached
+_evictions = EvictionTracker()
+
+
+def _serialize(snapshot: dict) -> bytes:
+    return json.dumps(snapshot, separators=(",", ":")).encode("utf-8")
+
+
+def _cache_put(business_id: str, version: datetime, body: bytes, mark: tuple):
+    if _evictions.mark(business_id) != mark:
+        return
+    cached = _cache.get(business_id)
+    if cached is None or cached[0] <= version or not bus.is_fresh(cached[2]):
+        _cache[business_id] = (version, body, time.monotonic())
+
+
+async def build_agent_context(db: AsyncIOMotorDatabase, business: dict) -> dict:
+    """
+    Assemble the compact snapshot the voice agent reads during a call.
+    """
+    business_id = str(business["_id"])
+    highlights = []
+    async for doc in db.document_texts.find(
+        {"business_id": business_id},
+        {"filename": 1, "passages": {"$slice": 1}}
+    ):
+        first_passage = doc["passages"][0] if doc.get("passages") else ""
+        highlights.append({
+            "id": doc["_id"],
+            "filename": doc["filename"],
+            "highlight": first_passage[:HIGHLIGHT_MAX_CHARS]
+        })
+
+    version = as_utc(business["updated_at"])
+    return {
+        "id": business_id,
+        "version": version.isoformat(),
+        "name": business["business_name"],
+        "type": business["business_type"],
+        "phone": business["business_phone"],
+        "services": business.get("custom_services", []),
+        "documents": highlights
+    }
+
+
+async def rebuild_agent_context(db: AsyncIOMotorDatabase, query_id) -> Optional[dict]:
+    """
+    Rebuild and store the snapshot of a business after it changed.
+    Older versions never overwrite newer ones.
+    """
+    mark = _evictions.mark(str(query_id))
+    business = await db.business_profiles.find_one(
+        {"_id": query_id},
+        {"business_name": 1, "business_type": 1, "business_phone": 1, "custom_services": 1, "updated_at": 1}
+    )
+    if not business:
+        return None
+
+    snapshot = await build_agent_context(db, business)
+    version = as_utc(business["updated_at"])
+    business_id = snapshot["id"]
+
+    try:
+        await db.agent_contexts.update_one(
+            {"_id": business_id, "version": {"$lte": version}},
+            {"$set": {"version": version, "snapshot": snapshot}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # A newer snapshot was stored concurrently
+        pass
+
+    _cache_put(business_id, version, _serialize(snapshot), mark)
+    return snapshot
+
+
+async def refresh_agent_context(db: AsyncIOMotorDatabase, query_id):
+    """
+    Rebuild a snapshot on a write path without failing the write.
+    """
+    try:
+        await rebuild_agent_context(db, query_id)
+    except Exception as e:
+        logger.error(f"Failed to rebuild agent context for business {query_id}: {e}")
+
+
+async def get_agent_context(db: AsyncIOMotorDatabase, business_id: str, query_id) -> Optional[tuple]:
+    """
+    Return (version, serialized snapshot) for a business. Served from memory
+    on a hit; falls back to the stored snapshot, then to a rebuild.
+    """
+    cached = _cache.get(business_id)
+    if cached is not None and bus.is_fresh(cached[2]):
+        return cached[:2]
+
+    mark = _evictions.mark(business_id)
+    stored = await db.agent_contexts.find_one({"_id": business_id})
+    if stored:
+        version, body = as_utc(stored["version"]), _serialize(stored["snapshot"])
+        _cache_put(business_id, version, body, mark)
+        return version, body
+
+    snapshot = await rebuild_agent_context(db, query_id)
+    if snapshot is None:
+        return None
+    return as_utc(datetime.fromisoformat(snapshot["version"])), _serialize(snapshot)
+
+
+async def drop_agent_context(db: AsyncIOMotorDatabase, business_id: str):
+    _cache.pop(business_id, None)
+    await db.agent_contexts.delete_one({"_id": business_id})
+
+
+def evict_agent_context(change: dict):
+    """
+    Invalidation bus callback for business_profiles and agent_contexts
+    changes. Writers bump the business before they store its new snapshot,
+    so the business event alone could let a worker reload the old snapshot;
+    the agent_contexts event evicts that again.
+    """
+    business_id = str(change["documentKey"]["_id"])
+    _cache.pop(business_id, None)
+    _evictions.changed(business_id)
+
+
+def clear_agent_contexts():
+    _cache.clear()
+    _evictions.changed_all()
@@ -1,19 +1,304 @@
-from fastapi import Request, HTTPException, status
+from fastapi import Request, HTTPException, Response, status
+from starlette.datastructures import MutableHeaders
 from datetime import datetime, timezone, timedelta
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from models import User, UserSession
+from models import User, UserSession, as_utc
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from collections import OrderedDict
 from typing import Optional
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from request_timing import phase
+from session_store import SessionStore, MongoSessionStore
 import requests
+import asyncio
+import hmac
+import jwt
+import math
+import os
+import time
+import uuid
 import logging
 
 logger = logging.getLogger(__name__)
 
-EMERGENT_AUTH_SESSION_API = "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data"
+EMERGENT_AUTH_SESSION_API = os.environ.get(
+    "EMERGENT_AUTH_SESSION_API",
+    "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data"
+)
+AUTH_PROVIDER_TIMEOUT_SECONDS = float(os.environ.get("AUTH_PROVIDER_TIMEOUT_SECONDS", 10))
 
-async def get_current_user(request: Request, db: AsyncIOMotorDatabase) -> Optional[User]:
+# Fail fast while the auth provider is degraded instead of waiting out the timeout
+provider_breaker = CircuitBreaker(
+    "emergent_auth",
+    failure_rate_threshold=float(os.environ.get("AUTH_BREAKER_FAILURE_RATE", 0.5)),
+    slow_call_seconds=float(os.environ.get("AUTH_BREAKER_SLOW_CALL_SECONDS", 3)),
+    slow_call_rate_threshold=float(os.environ.get("AUTH_BREAKER_SLOW_CALL_RATE", 0.5)),
+    window_seconds=float(os.environ.get("AUTH_BREAKER_WINDOW_SECONDS", 30)),
+    minimum_calls=int(os.environ.get("AUTH_BREAKER_MINIMUM_CALLS", 10)),
+    open_seconds=float(os.environ.get("AUTH_BREAKER_OPEN_SECONDS", 30)),
+    half_open_max_calls=int(os.environ.get("AUTH_BREAKER_HALF_OPEN_CALLS", 3))
+)
+
+# Sliding session expiry: every authenticated request keeps the session alive
+# for SESSION_TTL, but the stored expiry moves at most once per interval.
+SESSION_TTL = timedelta(days=int(os.environ.get("SESSION_TTL_DAYS", 7)))
+SESSION_EXTEND_INTERVAL = timedelta(seconds=int(os.environ.get("SESSION_EXTEND_INTERVAL_SECONDS", 60 * 60)))
+SESSION_FLUSH_INTERVAL_SECONDS = int(os.environ.get("SESSION_FLUSH_INTERVAL_SECONDS", 30))
+
+_session_store: Optional[SessionStore] = None
+
+def configure_session_store(store: SessionStore):
     """
-    Get current authenticated user from session token.
+    Select the backend opaque sessions are stored in (see session_store.py).
+    """
+    global _session_store
+    _session_store = store
+
+def get_session_store(db: AsyncIOMotorDatabase) -> SessionStore:
+    global _session_store
+    if _session_store is None:
+        _session_store = MongoSessionStore(db)
+    return _session_store
+
+class SessionActivityTracker:
+    """
+    Collects session activity in memory and flushes expiry extensions to
+    the session store in periodic batches.
+    """
+
+    def __init__(self):
+        self._pending = {}
+
+    def touch(self, session_token: str, expires_at: datetime) -> Optional[datetime]:
+        """
+        Record activity. Returns the new expiry when the session is due for
+        an extension, None otherwise.
+        """
+        now = datetime.now(timezone.utc)
+        if now + SESSION_TTL - expires_at < SESSION_EXTEND_INTERVAL:
+            return None
+        already_pending = session_token in self._pending
+        self._pending[session_token] = now
+        return None if already_pending else now + SESSION_TTL
+
+    def discard(self, session_token: str):
+        self._pending.pop(session_token, None)
+
+    async def flush(self, db: AsyncIOMotorDatabase) -> int:
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        extensions = {token: (last_seen, last_seen + SESSION_TTL) for token, last_seen in pending.items()}
+        try:
+            return await get_session_store(db).extend_many(extensions)
+        except Exception:
+            # Keep the activity for the next flush
+            for token, last_seen in pending.items():
+                self._pending.setdefault(token, last_seen)
+            raise
+
+    async def run(self, db: AsyncIOMotorDatabase):
+        """
+        Background loop flushing pending extensions.
+        """
+        while True:
+            await asyncio.sleep(SESSION_FLUSH_INTERVAL_SECONDS)
+            try:
+                count = await self.flush(db)
+                if count:
+                    logger.info(f"Extended {count} sessions")
+            except Exception as e:
+                logger.error(f"Failed to flush session activity: {e}")
+
+session_activity = SessionActivityTracker()
+
+NEGATIVE_SESSION_CACHE_SIZE = int(os.environ.get("NEGATIVE_SESSION_CACHE_SIZE", 10000))
+NEGATIVE_SESSION_CACHE_TTL_SECONDS = float(os.environ.get("NEGATIVE_SESSION_CACHE_TTL_SECONDS", 60))
+
+class NegativeSessionCache:
+    """
+    Bounded LRU of session tokens recently found unknown or expired, so
+    repeated requests with a dead token skip the session store lookup.
+    Entries decay after NEGATIVE_SESSION_CACHE_TTL_SECONDS.
+
+    A false positive is a cached token that later turns out to be valid
+    (its session is created after it was cached). Such entries are found
+    when the session is created, and the hits they served are counted.
+    """
+
+    def __init__(self, capacity: int = NEGATIVE_SESSION_CACHE_SIZE, ttl: float = NEGATIVE_SESSION_CACHE_TTL_SECONDS):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries = OrderedDict()   # token -> [expires_at, hits]
+        self.lookups = 0
+        self.hits = 0
+        self.false_positive_hits = 0
+
+    def __contains__(self, session_token: str) -> bool:
+        self.lookups += 1
+        entry = self._entries.get(session_token)
+        if entry is None:
+            return False
+        if entry[0] < time.monotonic():
+            del self._entries[session_token]
+            return False
+        entry[1] += 1
+        self.hits += 1
+        return True
+
+    def add(self, session_token: str):
+        self._entries[session_token] = [time.monotonic() + self.ttl, 0]
+        self._entries.move_to_end(session_token)
+        if len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def discard(self, session_token: str):
+        entry = self._entries.pop(session_token, None)
+        if entry is not None:
+            self.false_positive_hits += entry[1]
+
+    def clear(self):
+        self._entries.clear()
+
+    def apply_change(self, change: dict):
+        """
+        Invalidation bus callback: a session created by any worker makes
+        its token valid.
+        """
+        if change["operationType"] == "insert":
+            self.discard(change["fullDocument"]["session_token"])
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "capacity": self.capacity,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "false_positive_hits": self.false_positive_hits,
+            "false_positive_rate": self.false_positive_hits / self.hits if self.hits else 0.0
+        }
+
+negative_sessions = NegativeSessionCache()
+
+# Optional stateless mode: "signed" issues HS256 tokens that carry the user
+# profile, so requests authenticate without touching the database.
+SESSION_TOKEN_MODE = os.environ.get("SESSION_TOKEN_MODE", "opaque")
+SESSION_SIGNING_KEY = os.environ.get("SESSION_SIGNING_KEY", "")
+SESSION_SIGNING_ALGORITHM = "HS256"
+
+if SESSION_TOKEN_MODE == "signed" and not SESSION_SIGNING_KEY:
+    raise RuntimeError("SESSION_SIGNING_KEY is required when SESSION_TOKEN_MODE=signed")
+
+class RevocationList:
+    """
+    Token ids revoked before their expiry. Entries are dropped once the
+    token would have expired anyway, so the set is bounded by the number
+    of logouts within one token lifetime.
+    """
+
+    def __init__(self):
+        self._revoked = {}
+        self._next_prune = 0.0
+
+    def __len__(self):
+        return len(self._revoked)
+
+    def add(self, jti: str, expires_at: float):
+        self._revoked[jti] = expires_at
+        self._prune()
+
+    def is_revoked(self, jti: str) -> bool:
+        return jti in self._revoked
+
+    def _prune(self):
+        now = time.time()
+        if now < self._next_prune:
+            return
+        self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+        self._next_prune = now + 60
+
+    async def load(self, db: AsyncIOMotorDatabase):
+        self._revoked = {}
+        async for entry in db.revoked_tokens.find({"expires_at": {"$gt": datetime.now(timezone.utc)}}):
+            self.add(entry["_id"], as_utc(entry["expires_at"]).timestamp())
+
+    def apply_change(self, change: dict):
+        """
+        Invalidation bus callback replicating revocations from other workers.
+        """
+        if change["operationType"] == "insert":
+            entry = change["fullDocument"]
+            self.add(entry["_id"], as_utc(entry["expires_at"]).timestamp())
+
+revoked_tokens = RevocationList()
+
+def is_signed_token(session_token: str) -> bool:
+    return SESSION_TOKEN_MODE == "signed" and session_token.count(".") == 2
+
+def issue_signed_token(user: User) -> str:
+    """
+    Issue a signed session token carrying the user id, expiry and profile.
+    """
+    now = datetime.now(timezone.utc)
+    claims = {
+        "sub": user.id,
+        "email": user.email,
+        "name": user.name,
+        "picture": user.picture,
+        "cat": int(user.created_at.timestamp()),
+        "iat": now,
+        "exp": now + SESSION_TTL,
+        "jti": str(uuid.uuid4())
+    }
+    return jwt.encode(claims, SESSION_SIGNING_KEY, algorithm=SESSION_SIGNING_ALGORITHM)
+
+def decode_signed_token(session_token: str) -> Optional[dict]:
+    """
+    Verify a signed token in-process. Returns its claims, or None when it is
+    invalid, expired or revoked.
+    """
+    try:
+        claims = jwt.decode(session_token, SESSION_SIGNING_KEY, algorithms=[SESSION_SIGNING_ALGORITHM])
+    except jwt.PyJWTError as e:
+        logger.warning(f"Invalid signed session token: {e}")
+        return None
+    if revoked_tokens.is_revoked(claims["jti"]):
+        logger.warning("Signed session token revoked")
+        return None
+    return claims
+
+async def revoke_signed_token(db: AsyncIOMotorDatabase, claims: dict):
+    """
+    Revoke a signed token until it expires. Other workers pick the
+    revocation up through the invalidation bus.
+    """
+    revoked_tokens.add(claims["jti"], claims["exp"])
+    # Upsert so a repeated logout of the same token is a no-op
+    await db.revoked_tokens.update_one(
+        {"_id": claims["jti"]},
+        {"$setOnInsert": {"expires_at": datetime.fromtimestamp(claims["exp"], tz=timezone.utc)}},
+        upsert=True
+    )
+
+def verify_service_key(request: Request, header: str, env_var: str) -> bool:
+    """
+    Check a shared-secret header used by internal services (voice agent, admin tools).
+    Always fails when the secret is not configured.
+    """
+    expected = os.environ.get(env_var)
+    provided = request.headers.get(header)
+    if not expected or not provided:
+        return False
+    return hmac.compare_digest(provided.encode(), expected.encode())
+
+async def authenticate_session(request: Request, db: AsyncIOMotorDatabase) -> tuple[Optional[str], Optional[User]]:
+    """
+    Validate the session token of a request.
     Checks cookies first, then Authorization header.
+    
+    Returns (user_id, user). The user is only set when it is known without
+    a database read (signed tokens); both are None when not authenticated.
     """
     session_token = None
     
@@ -28,84 +313,196 @@ async def get_current_user(request: Request, db: AsyncIOMotorDatabase) -> Option
             session_token = auth_header.replace("Bearer ", "")
     
     if not session_token:
-        return None
+        return None, None
+    
+    # Signed tokens are verified without any database access
+    if is_signed_token(session_token):
+        claims = decode_signed_token(session_token)
+        if not claims:
+            return None, None
+        user = User(
+            id=claims["sub"],
+            email=claims["email"],
+            name=claims["name"],
+            picture=claims["picture"],
+            created_at=datetime.fromtimestamp(claims["cat"], tz=timezone.utc)
+        )
+        return user.id, user
+    
+    # Tokens recently found dead are rejected without a lookup
+    if session_token in negative_sessions:
+        return None, None
     
-    # Find session in database
-    session_data = await db.user_sessions.find_one({"session_token": session_token})
+    # Find session in the session store
+    store = get_session_store(db)
+    session_data = await store.get(session_token)
     if not session_data:
-        logger.warning("Session not found in database")
-        return None
+        logger.warning("Session not found in session store")
+        negative_sessions.add(session_token)
+        return None, None
     
-    # Check if session expired
-    expires_at = session_data["expires_at"]
-    # Handle timezone-naive datetime from MongoDB
-    if expires_at.tzinfo is None:
-        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    # Check if session expired (stores purge expired sessions lazily)
+    expires_at = as_utc(session_data["expires_at"])
     
     if expires_at < datetime.now(timezone.utc):
         logger.warning("Session expired")
-        await db.user_sessions.delete_one({"session_token": session_token})
-        return None
+        negative_sessions.add(session_token)
+        await store.delete(session_token)
+        return None, None
     
-    # Get user data
-    user_data = await db.users.find_one({"_id": session_data["user_id"]})
+    # Slide the expiry; the cookie is refreshed by middleware when it moves
+    if session_activity.touch(session_token, expires_at):
+        request.state.extended_session_token = session_token
+    
+    return session_data["user_id"], None
+
+def session_cookie_header(session_token: str) -> str:
+    """
+    Set-Cookie value of the session cookie, as set on login.
+    """
+    response = Response()
+    response.set_cookie(
+        key="session_token",
+        value=session_token,
+        httponly=True,
+        secure=True,
+        samesite="none",
+        max_age=int(SESSION_TTL.total_seconds()),
+        path="/"
+    )
+    return response.headers["set-cookie"]
+
+class SessionCookieMiddleware:
+    """
+    Re-issue the session cookie when authentication slid the session
+    expiry. Plain ASGI: the cookie is added to the response start message
+    and the body passes through untouched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start":
+                # Request.state lives in the scope
+                session_token = scope.get("state", {}).get("extended_session_token")
+                if session_token and Request(scope).cookies.get("session_token") == session_token:
+                    MutableHeaders(scope=message).append("set-cookie", session_cookie_header(session_token))
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+async def load_user(db: AsyncIOMotorDatabase, user_id: str) -> Optional[User]:
+    """
+    Load a user by id.
+    """
+    user_data = await db.users.find_one({"_id": user_id})
     if not user_data:
-        logger.error(f"User not found for session: {session_data['user_id']}")
+        logger.error(f"User not found for session: {user_id}")
         return None
     
     # Map MongoDB _id to Pydantic id
     user_data["id"] = user_data.pop("_id")
     return User(**user_data)
 
+async def get_current_user(request: Request, db: AsyncIOMotorDatabase) -> Optional[User]:
+    """
+    Get current authenticated user from session token.
+    """
+    with phase("auth-session"):
+        user_id, user = await authenticate_session(request, db)
+    if user or not user_id:
+        return user
+    with phase("auth-user"):
+        return await load_user(db, user_id)
+
 async def fetch_user_from_emergent(session_id: str) -> dict:
     """
     Fetch user data from Emergent Auth using session_id.
     """
     try:
-        response = requests.get(
+        provider_breaker.before_call()
+    except CircuitOpenError as e:
+        logger.warning("Emergent Auth circuit open, failing fast")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication service unavailable",
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+        )
+    
+    started = time.monotonic()
+    failed = True
+    cancelled = False
+    try:
+        # requests is blocking; keep the event loop free for other logins
+        response = await asyncio.to_thread(
+            requests.get,
             EMERGENT_AUTH_SESSION_API,
             headers={"X-Session-ID": session_id},
-            timeout=10
+            timeout=AUTH_PROVIDER_TIMEOUT_SECONDS
         )
+        # A rejected session_id is a client error, not a provider failure
+        failed = response.status_code >= 500
         response.raise_for_status()
         return response.json()
+    except asyncio.CancelledError:
+        # The client went away; says nothing about the provider
+        cancelled = True
+        raise
     except requests.exceptions.RequestException as e:
         logger.error(f"Error fetching user from Emergent Auth: {e}")
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Authentication service unavailable"
         )
+    finally:
+        if cancelled:
+            provider_breaker.release()
+        else:
+            provider_breaker.record(failed, time.monotonic() - started)
 
 async def create_or_update_user(db: AsyncIOMotorDatabase, user_data: dict) -> User:
     """
     Create a new user or return existing user.
     Does not update existing user data to preserve user information.
-    """
-    existing_user = await db.users.find_one({"email": user_data["email"]})
-    
-    if existing_user:
-        # Return existing user without updating
-        existing_user["id"] = existing_user.pop("_id")
-        return User(**existing_user)
     
-    # Create new user
+    A single upsert on the unique email index, so concurrent first logins
+    for the same email cannot create duplicate users.
+    """
     user = User(
         email=user_data["email"],
         name=user_data["name"],
         picture=user_data["picture"]
     )
     
-    # Insert into database (Pydantic id maps to MongoDB _id)
+    # Insert fields only apply when the user does not exist yet
     user_dict = user.dict(by_alias=True)
-    await db.users.insert_one(user_dict)
+    user_dict.pop("email")
     
-    return user
+    try:
+        stored_user = await db.users.find_one_and_update(
+            {"email": user.email},
+            {"$setOnInsert": user_dict},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Lost an upsert race on the unique index; the winner's user exists now
+        stored_user = await db.users.find_one({"email": user.email})
+    
+    stored_user["id"] = stored_user.pop("_id")
+    return User(**stored_user)
 
 async def create_session(db: AsyncIOMotorDatabase, user_id: str, session_token: str) -> UserSession:
     """
     Create a new session for the user.
     """
-    expires_at = datetime.now(timezone.utc) + timedelta(days=7)
+    expires_at = datetime.now(timezone.utc) + SESSION_TTL
     
     session = UserSession(
         user_id=user_id,
@@ -113,5 +510,14 @@ async def create_session(db: AsyncIOMotorDatabase, user_id: str, session_token:
         expires_at=expires_at
     )
     
-    await db.user_sessions.insert_one(session.dict())
+    await get_session_store(db).create(session)
+    negative_sessions.discard(session_token)
     return session
+
+async def delete_session(db: AsyncIOMotorDatabase, session_token: str) -> bool:
+    """
+    Delete an opaque session. Returns False when it did not exist.
+    """
+    session_activity.discard(session_token)
+    negative_sessions.add(session_token)
+    return await get_session_store(db).delete(session_token)
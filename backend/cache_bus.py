@@ -0,0 +1,155 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import PyMongoError, OperationFailure
+from typing import Callable, Hashable, Optional
+import asyncio
+import inspect
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Max age of cached entries while the change stream is down
+CACHE_FALLBACK_TTL_SECONDS = float(os.environ.get("CACHE_FALLBACK_TTL_SECONDS", 5))
+CHANGE_STREAM_RETRY_SECONDS = float(os.environ.get("CHANGE_STREAM_RETRY_SECONDS", 2))
+CHANGE_STREAM_MAX_RETRY_SECONDS = 60
+
+# Server error code when a resume token is no longer in the oplog
+CHANGE_STREAM_HISTORY_LOST = 286
+EVICTION_TRACKER_MAX_KEYS = int(os.environ.get("EVICTION_TRACKER_MAX_KEYS", 10000))
+
+
+class EvictionTracker:
+    """
+    Tells a cache whether an entry built from database reads may predate a
+    change that arrived while it was being built: take a mark before the
+    reads and only keep the entry if the mark is unchanged afterwards.
+
+    Changes are counted per key. Counts only matter to builds in progress,
+    so beyond max_keys they are all forgotten at once and an epoch bump
+    invalidates the marks taken before.
+    """
+
+    def __init__(self, max_keys: int = EVICTION_TRACKER_MAX_KEYS):
+        self.max_keys = max_keys
+        self._changes = {}
+        self._epoch = 0
+
+    def mark(self, key: Hashable) -> tuple:
+        return self._epoch, self._changes.get(key, 0)
+
+    def changed(self, key: Hashable):
+        self._changes[key] = self._changes.get(key, 0) + 1
+        if len(self._changes) > self.max_keys:
+            self.changed_all()
+
+    def changed_all(self):
+        self._changes.clear()
+        self._epoch += 1
+
+
+class InvalidationBus:
+    """
+    Tails a database change stream and fans changes out to the in-process
+    caches of this worker.
+
+    Every worker runs its own bus, so a write handled by any worker evicts
+    the affected keys everywhere. The resume token survives reconnects; when
+    the stream opens without one, subscribers are reset because events may
+    have been missed. While the stream is down, caches must honour max_age().
+    """
+
+    def __init__(self, collections: list[str], excluded_fields: Optional[list[str]] = None):
+        self.collections = collections
+        # Bulky fields no subscriber reads, kept out of the stream
+        self.excluded_fields = excluded_fields or []
+        self.live = False
+        self._resume_token = None
+        self._subscribers = {name: [] for name in collections}
+        self._reset_callbacks = []
+
+    def subscribe(self, collection: str, callback: Callable):
+        """
+        Register callback(change) for changes on a collection. Callbacks may
+        be plain functions or coroutines.
+        """
+        self._subscribers[collection].append(callback)
+
+    def on_reset(self, callback: Callable):
+        """
+        Register callback() invoked when changes may have been missed.
+        """
+        self._reset_callbacks.append(callback)
+
+    def max_age(self) -> Optional[float]:
+        """
+        None while the stream is live (entries stay valid until evicted),
+        otherwise the fallback TTL in seconds.
+        """
+        return None if self.live else CACHE_FALLBACK_TTL_SECONDS
+
+    def is_fresh(self, cached_at: float) -> bool:
+        max_age = self.max_age()
+        return max_age is None or time.monotonic() - cached_at <= max_age
+
+    async def _call(self, callback: Callable, *args):
+        try:
+            result = callback(*args)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.error(f"Cache invalidation callback failed: {e}")
+
+    async def _reset(self):
+        for callback in self._reset_callbacks:
+            await self._call(callback)
+
+    async def _dispatch(self, change: dict):
+        collection = change.get("ns", {}).get("coll")
+        for callback in self._subscribers.get(collection, []):
+            await self._call(callback, change)
+
+    async def run(self, db: AsyncIOMotorDatabase):
+        pipeline = [{"$match": {"ns.coll": {"$in": self.collections}}}]
+        if self.excluded_fields:
+            pipeline.append({"$project": {f"fullDocument.{field}": 0 for field in self.excluded_fields}})
+        retry_delay = CHANGE_STREAM_RETRY_SECONDS
+        while True:
+            try:
+                async with db.watch(
+                    pipeline,
+                    full_document="updateLookup",
+                    resume_after=self._resume_token
+                ) as stream:
+                    logger.info("Cache invalidation stream connected")
+                    if self._resume_token is None:
+                        # Nothing to resume from, so changes made before the
+                        # stream opened may not have been seen
+                        await self._reset()
+                    self.live = True
+                    retry_delay = CHANGE_STREAM_RETRY_SECONDS
+                    async for change in stream:
+                        self._resume_token = stream.resume_token
+                        await self._dispatch(change)
+            except asyncio.CancelledError:
+                self.live = False
+                raise
+            except OperationFailure as e:
+                self.live = False
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    logger.warning("Change stream resume token expired, resetting caches")
+                    self._resume_token = None
+                else:
+                    logger.error(f"Cache invalidation stream failed: {e}")
+            except PyMongoError as e:
+                self.live = False
+                logger.error(f"Cache invalidation stream dropped: {e}")
+
+            await asyncio.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, CHANGE_STREAM_MAX_RETRY_SECONDS)
+
+
+bus = InvalidationBus(
+    ["business_profiles", "user_sessions", "users", "revoked_tokens", "agent_contexts", "document_texts"],
+    excluded_fields=["snapshot", "passages"]
+)
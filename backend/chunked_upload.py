@@ -0,0 +1,172 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from fastapi import Request
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+import asyncio
+import hashlib
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHUNKED_UPLOAD_MAX_BYTES = int(os.environ.get("CHUNKED_UPLOAD_MAX_BYTES", 50 * 1024 * 1024))
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_SESSION_TTL = timedelta(seconds=int(os.environ.get("UPLOAD_SESSION_TTL_SECONDS", 24 * 60 * 60)))
+UPLOAD_SESSION_GC_INTERVAL_SECONDS = int(os.environ.get("UPLOAD_SESSION_GC_INTERVAL_SECONDS", 15 * 60))
+HASH_READ_SIZE = 1024 * 1024
+# A chunk write or completion not finished within this time (worker crashed
+# mid-way) no longer blocks completing or collecting the upload
+CHUNK_WRITE_LEASE = timedelta(seconds=int(os.environ.get("CHUNK_WRITE_LEASE_SECONDS", 600)))
+
+
+class ChunkSizeError(Exception):
+    """
+    Raised when a chunk body does not have the expected length.
+    """
+
+
+def part_path(partial_dir: Path, upload_id: str) -> Path:
+    return partial_dir / f"{upload_id}.part"
+
+
+def create_part_file(path: Path, size: int):
+    """
+    Preallocate (sparsely) the file chunks are written into, so chunks can
+    arrive in any order and in parallel.
+    """
+    with open(path, "wb") as f:
+        f.truncate(size)
+
+
+def chunk_bounds(upload: dict, index: int) -> tuple[int, int]:
+    """
+    Return (offset, length) of a chunk.
+    """
+    offset = index * upload["chunk_size"]
+    return offset, min(upload["chunk_size"], upload["size"] - offset)
+
+
+async def write_chunk(request: Request, path: Path, offset: int, length: int):
+    """
+    Stream a request body into the part file at the given offset. Memory use
+    is bounded by the size of the pieces the server hands over.
+    """
+    fd = await asyncio.to_thread(os.open, path, os.O_WRONLY)
+    try:
+        written = 0
+        async for piece in request.stream():
+            if not piece:
+                continue
+            if written + len(piece) > length:
+                raise ChunkSizeError(f"Chunk exceeds {length} bytes")
+            await asyncio.to_thread(os.pwrite, fd, piece, offset + written)
+            written += len(piece)
+        if written != length:
+            raise ChunkSizeError(f"Chunk has {written} bytes, expected {length}")
+    finally:
+        await asyncio.to_thread(os.close, fd)
+
+
+def no_writes_in_flight(now: datetime) -> dict:
+    """
+    Query matching upload sessions with no chunk write in progress.
+    """
+    return {"writes": {"$not": {"$elemMatch": {"until": {"$gt": now}}}}}
+
+
+def hash_file(path: Path) -> str:
+    """
+    SHA-256 of a file, read in fixed-size blocks. Runs in a worker thread.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_READ_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def contiguous_offset(upload: dict) -> int:
+    """
+    Number of bytes received without gaps from the start of the file, the
+    offset a sequential client resumes from.
+    """
+    received = set(upload["received"])
+    index = 0
+    while index in received:
+        index += 1
+    if index >= upload["total_chunks"]:
+        return upload["size"]
+    return index * upload["chunk_size"]
+
+
+def upload_status(upload: dict) -> dict:
+    received = sorted(upload["received"])
+    missing = sorted(set(range(upload["total_chunks"])) - set(received))
+    return {
+        "upload_id": upload["_id"],
+        "filename": upload["filename"],
+        "size": upload["size"],
+        "chunk_size": upload["chunk_size"],
+        "total_chunks": upload["total_chunks"],
+        "received_chunks": received,
+        "missing_chunks": missing,
+        "bytes_received": sum(chunk_bounds(upload, i)[1] for i in received),
+        "offset": contiguous_offset(upload),
+        "status": upload["status"],
+        "expires_at": upload["expires_at"]
+    }
+
+
+def collectable_upload(now: datetime) -> dict:
+    """
+    Query matching expired upload sessions that nothing works on any more:
+    open with no chunk write in progress, or left half-completed by a worker
+    that stopped before completing_until.
+    """
+    return {
+        "expires_at": {"$lt": now},
+        "$or": [
+            {"status": "open", **no_writes_in_flight(now)},
+            {"status": "completing", "completing_until": {"$lt": now}}
+        ]
+    }
+
+
+async def collect_expired_uploads(db: AsyncIOMotorDatabase, partial_dir: Path) -> int:
+    """
+    Delete abandoned upload sessions and their part files.
+
+    Each session is claimed by deleting it under the same conditions it was
+    found with, and its part file is only removed once the claim succeeded,
+    so a session resumed or completed meanwhile keeps its chunks.
+    """
+    removed = 0
+    now = datetime.now(timezone.utc)
+    async for upload in db.upload_sessions.find(collectable_upload(now), {"_id": 1}):
+        claimed = await db.upload_sessions.find_one_and_delete(
+            {"_id": upload["_id"], **collectable_upload(now)},
+            projection={"_id": 1}
+        )
+        if claimed is None:
+            continue
+        await asyncio.to_thread(part_path(partial_dir, upload["_id"]).unlink, missing_ok=True)
+        removed += 1
+    if removed:
+        logger.info(f"Collected {removed} abandoned upload sessions")
+    return removed
+
+
+async def run_upload_gc(db: AsyncIOMotorDatabase, partial_dir: Path):
+    """
+    Background loop collecting abandoned upload sessions.
+    """
+    while True:
+        try:
+            await collect_expired_uploads(db, partial_dir)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Upload session GC failed: {e}")
+        await asyncio.sleep(UPLOAD_SESSION_GC_INTERVAL_SECONDS)
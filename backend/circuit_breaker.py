@@ -0,0 +1,153 @@
+from collections import deque
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a dependency while its circuit is open.
+    """
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit {name} is open")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Failure-rate and slow-call circuit breaker for an external dependency.
+
+    Outcomes are kept in a sliding time window. Once at least minimum_calls
+    were seen and either the failure rate or the slow-call rate reaches its
+    threshold, the circuit opens and calls fail fast for open_seconds. It
+    then half-opens and lets up to half_open_max_calls probes through; that
+    many consecutive successful probes close it, any failed probe re-opens it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 2.0,
+        slow_call_rate_threshold: float = 0.5,
+        window_seconds: float = 30.0,
+        minimum_calls: int = 10,
+        open_seconds: float = 30.0,
+        half_open_max_calls: int = 3
+    ):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.window_seconds = window_seconds
+        self.minimum_calls = minimum_calls
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self.state = CLOSED
+        self._window = deque()      # (timestamp, failed, slow)
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+        self.calls = 0
+        self.failures = 0
+        self.slow_calls = 0
+        self.rejected = 0
+        self.transitions = {OPEN: 0, HALF_OPEN: 0, CLOSED: 0}
+
+    def _transition(self, state: str):
+        logger.warning(f"Circuit {self.name}: {self.state} -> {state}")
+        self.state = state
+        self.transitions[state] += 1
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        elif state == CLOSED:
+            self._window.clear()
+
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def before_call(self):
+        """
+        Admit or reject a call. Raises CircuitOpenError when rejected.
+        """
+        if self.state == OPEN:
+            if self.retry_after() > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.retry_after())
+            self._transition(HALF_OPEN)
+
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_max_calls:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, 1.0)
+            self._probes_in_flight += 1
+
+    def release(self):
+        """
+        Give back an admitted call whose outcome says nothing about the
+        dependency (for example cancelled by its caller). A half-open probe
+        slot is freed without counting as a success.
+        """
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def record(self, failed: bool, duration: float):
+        """
+        Record the outcome of an admitted call.
+        """
+        slow = duration >= self.slow_call_seconds
+        self.calls += 1
+        self.failures += failed
+        self.slow_calls += slow
+
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            if failed or slow:
+                self._transition(OPEN)
+            else:
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_max_calls:
+                    self._transition(CLOSED)
+            return
+
+        if self.state == OPEN:
+            # A call admitted before the circuit opened finished late
+            return
+
+        now = time.monotonic()
+        self._window.append((now, failed, slow))
+        while self._window and self._window[0][0] < now - self.window_seconds:
+            self._window.popleft()
+
+        total = len(self._window)
+        if total < self.minimum_calls:
+            return
+        failure_rate = sum(1 for _, f, _ in self._window if f) / total
+        slow_rate = sum(1 for _, _, s in self._window if s) / total
+        if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+            self._transition(OPEN)
+
+    def stats(self) -> dict:
+        total = len(self._window)
+        return {
+            "state": self.state,
+            "window_calls": total,
+            "window_failure_rate": sum(1 for _, f, _ in self._window if f) / total if total else 0.0,
+            "window_slow_rate": sum(1 for _, _, s in self._window if s) / total if total else 0.0,
+            "calls": self.calls,
+            "failures": self.failures,
+            "slow_calls": self.slow_calls,
+            "rejected": self.rejected,
+            "transitions": dict(self.transitions),
+            "retry_after": round(self.retry_after(), 1) if self.state == OPEN else 0
+        }
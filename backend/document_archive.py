@@ -0,0 +1,98 @@
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator
+import zipfile
+import logging
+
+from file_cleanup import document_file_names
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_READ_SIZE = 64 * 1024
+
+# PDF and DOCX are already compressed containers; deflating them again costs
+# CPU and saves next to nothing. Legacy .doc files compress well.
+ARCHIVE_COMPRESSION = {
+    '.pdf': zipfile.ZIP_STORED,
+    '.docx': zipfile.ZIP_STORED,
+    '.doc': zipfile.ZIP_DEFLATED,
+}
+
+
+class _ChunkSink:
+    """
+    Write-only, non-seekable file object for ZipFile. Without tell/seek,
+    zipfile writes sizes and CRCs in data descriptors after each entry, so
+    the archive can be sent while it is being built.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def write(self, data) -> int:
+        self._buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def _archive_name(filename: str, seen: dict) -> str:
+    """
+    Keep entry names unique: the second "report.pdf" becomes "report (2).pdf".
+    """
+    name = Path(filename).name or "document"
+    count = seen.get(name.lower(), 0) + 1
+    seen[name.lower()] = count
+    if count == 1:
+        return name
+    path = Path(name)
+    return f"{path.stem} ({count}){path.suffix}"
+
+
+def _locate(upload_dir: Path, document: dict):
+    for name in document_file_names(document):
+        path = upload_dir / name
+        if path.exists():
+            return path
+    return None
+
+
+def stream_archive(upload_dir: Path, documents: list[dict]) -> Iterator[bytes]:
+    """
+    Build a ZIP of the given documents and yield it piece by piece. Only one
+    read block is held in memory at a time and nothing is written to disk.
+    Blocking file reads are fine here: Starlette iterates sync generators in
+    its thread pool.
+    """
+    sink = _ChunkSink()
+    seen = {}
+    with zipfile.ZipFile(sink, mode="w") as archive:
+        for document in documents:
+            path = _locate(upload_dir, document)
+            if not path:
+                logger.warning(f"Skipping missing document file in archive: {document['id']}")
+                continue
+
+            ext = Path(document["filename"]).suffix.lower()
+            uploaded_at = document.get("uploaded_at") or datetime.fromtimestamp(path.stat().st_mtime)
+            info = zipfile.ZipInfo(_archive_name(document["filename"], seen), uploaded_at.timetuple()[:6])
+            info.compress_type = ARCHIVE_COMPRESSION.get(ext, zipfile.ZIP_DEFLATED)
+            info.file_size = path.stat().st_size
+
+            with open(path, "rb") as source, archive.open(info, mode="w") as entry:
+                for block in iter(lambda: source.read(ARCHIVE_READ_SIZE), b""):
+                    entry.write(block)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            # Data descriptor of the entry
+            yield sink.drain()
+
+    # Central directory
+    yield sink.drain()
@@ -0,0 +1,330 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from collections import OrderedDict, Counter
+from xml.etree import ElementTree
+from pypdf import PdfReader
+from pathlib import Path
+from typing import BinaryIO, Union
+from cache_bus import bus, EvictionTracker
+import io
+import math
+import os
+import re
+import time
+import uuid
+import zipfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+SEARCH_INDEX_MAX_BUSINESSES = int(os.environ.get("SEARCH_INDEX_MAX_BUSINESSES", 500))
+PASSAGE_MAX_CHARS = 400
+SNIPPET_MAX_CHARS = 200
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from",
+    "have", "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "our",
+    "that", "the", "this", "to", "we", "what", "with", "you", "your"
+}
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+DOCX_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+# ==================== Text Extraction ====================
+
+# Legacy .doc text is scraped from raw bytes; only the head of the file is read
+DOC_SCAN_MAX_BYTES = 10 * 1024 * 1024
+
+
+def _extract_pdf(stream: BinaryIO) -> str:
+    reader = PdfReader(stream)
+    return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+def _extract_docx(stream: BinaryIO) -> str:
+    with zipfile.ZipFile(stream) as archive:
+        xml = archive.read("word/document.xml")
+    root = ElementTree.fromstring(xml)
+    paragraphs = []
+    for paragraph in root.iter(f"{DOCX_NS}p"):
+        text = "".join(node.text or "" for node in paragraph.iter(f"{DOCX_NS}t"))
+        if text:
+            paragraphs.append(text)
+    return "\n".join(paragraphs)
+
+
+def _extract_doc(stream: BinaryIO) -> str:
+    """
+    Legacy Word files store their text either as UTF-16LE or as single-byte
+    runs. Pull out the readable runs; good enough for keyword search.
+    """
+    content = stream.read(DOC_SCAN_MAX_BYTES)
+    runs = re.findall(rb"(?:[\x20-\x7e\r\n\t]\x00){4,}", content)
+    if runs:
+        return "\n".join(run.decode("utf-16-le") for run in runs)
+    runs = re.findall(rb"[\x20-\x7e\r\n\t]{4,}", content)
+    return "\n".join(run.decode("latin-1") for run in runs)
+
+
+EXTRACTORS = {
+    ".pdf": _extract_pdf,
+    ".docx": _extract_docx,
+    ".doc": _extract_doc,
+}
+
+
+def extract_text(source: Union[bytes, Path], file_ext: str) -> str:
+    """
+    Extract plain text from an uploaded document, given either its content
+    or the path of the stored file. Returns an empty string when the file
+    cannot be parsed so uploads never fail on extraction.
+    """
+    extractor = EXTRACTORS.get(file_ext)
+    if not extractor:
+        return ""
+    try:
+        if isinstance(source, bytes):
+            return extractor(io.BytesIO(source))
+        with open(source, "rb") as stream:
+            return extractor(stream)
+    except Exception as e:
+        logger.warning(f"Text extraction failed for {file_ext} document: {e}")
+        return ""
+
+
+def split_passages(text: str) -> list[str]:
+    """
+    Split extracted text into passages of roughly PASSAGE_MAX_CHARS. Passages
+    are the unit that is indexed and returned as a snippet.
+    """
+    passages = []
+    current = ""
+    for line in text.splitlines():
+        line = " ".join(line.split())
+        if not line:
+            continue
+        if current and len(current) + len(line) + 1 > PASSAGE_MAX_CHARS:
+            passages.append(current)
+            current = line
+        else:
+            current = f"{current} {line}" if current else line
+    if current:
+        passages.append(current)
+    return passages
+
+
+def tokenize(text: str) -> list[str]:
+    terms = []
+    for word in WORD_RE.findall(text.lower()):
+        if word in STOPWORDS:
+            continue
+        # Light plural folding so "pastas" matches "pasta"
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+# ==================== Inverted Index ====================
+
+class BusinessSearchIndex:
+    """
+    In-memory BM25 index over the document passages of one business.
+    """
+
+    def __init__(self):
+        self.passages = {}        # passage key -> (doc_id, filename, text, length)
+        self.postings = {}        # term -> {passage key: term frequency}
+        self.doc_passages = {}    # doc_id -> [passage keys]
+        self.doc_versions = {}    # doc_id -> version of its document_texts record
+        self.total_length = 0
+        self.loaded_at = time.monotonic()
+
+    def add_document(self, doc_id: str, filename: str, passages: list[str], version: str = None):
+        self.remove_document(doc_id)
+        self.doc_versions[doc_id] = version
+        keys = []
+        for position, text in enumerate(passages):
+            key = (doc_id, position)
+            terms = tokenize(text)
+            if not terms:
+                continue
+            for term, frequency in Counter(terms).items():
+                self.postings.setdefault(term, {})[key] = frequency
+            self.passages[key] = (doc_id, filename, text, len(terms))
+            self.total_length += len(terms)
+            keys.append(key)
+        self.doc_passages[doc_id] = keys
+
+    def remove_document(self, doc_id: str):
+        self.doc_versions.pop(doc_id, None)
+        for key in self.doc_passages.pop(doc_id, []):
+            _, _, text, length = self.passages.pop(key)
+            self.total_length -= length
+            for term in set(tokenize(text)):
+                postings = self.postings.get(term)
+                if postings is None:
+                    continue
+                postings.pop(key, None)
+                if not postings:
+                    del self.postings[term]
+
+    def search(self, query: str, limit: int = 5) -> list[dict]:
+        terms = set(tokenize(query))
+        if not terms or not self.passages:
+            return []
+
+        passage_count = len(self.passages)
+        average_length = self.total_length / passage_count
+        scores = {}
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (passage_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for key, frequency in postings.items():
+                length = self.passages[key][3]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                scores[key] = scores.get(key, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        results = []
+        for key, score in ranked:
+            doc_id, filename, text, _ = self.passages[key]
+            results.append({
+                "document_id": doc_id,
+                "filename": filename,
+                "snippet": _snippet(text, terms),
+                "score": round(score, 4)
+            })
+        return results
+
+
+def _snippet(text: str, terms: set) -> str:
+    """
+    Cut a window of SNIPPET_MAX_CHARS around the first matching term.
+    """
+    if len(text) <= SNIPPET_MAX_CHARS:
+        return text
+    lowered = text.lower()
+    positions = [lowered.find(term) for term in terms if lowered.find(term) >= 0]
+    start = max(0, min(positions) - SNIPPET_MAX_CHARS // 4) if positions else 0
+    snippet = text[start:start + SNIPPET_MAX_CHARS]
+    if start > 0:
+        snippet = "…" + snippet
+    if start + SNIPPET_MAX_CHARS < len(text):
+        snippet = snippet + "…"
+    return snippet
+
+
+# Loaded indexes, least recently used first
+_indexes: "OrderedDict[str, BusinessSearchIndex]" = OrderedDict()
+# An index built from reads that overlap a change of its business is not kept
+_evictions = EvictionTracker()
+
+
+async def get_business_index(db: AsyncIOMotorDatabase, business_id: str) -> BusinessSearchIndex:
+    """
+    Return the index for a business, building it from document_texts on
+    first use.
+    """
+    index = _indexes.get(business_id)
+    if index is not None and bus.is_fresh(index.loaded_at):
+        _indexes.move_to_end(business_id)
+        return index
+
+    mark = _evictions.mark(business_id)
+    index = BusinessSearchIndex()
+    async for doc in db.document_texts.find({"business_id": business_id}):
+        index.add_document(doc["_id"], doc["filename"], doc["passages"], doc.get("version"))
+
+    if _evictions.mark(business_id) != mark:
+        return index
+    _indexes[business_id] = index
+    if len(_indexes) > SEARCH_INDEX_MAX_BUSINESSES:
+        _indexes.popitem(last=False)
+    return index
+
+
+async def index_document(db: AsyncIOMotorDatabase, business_id: str, doc_id: str, filename: str, text: str):
+    """
+    Store the extracted passages of a document and add them to the loaded
+    index of its business, if any. Each write gets a new version, so the
+    change event of this write does not make the workers that already
+    applied it read the passages again.
+    """
+    passages = split_passages(text)
+    version = str(uuid.uuid4())
+    await db.document_texts.replace_one(
+        {"_id": doc_id},
+        {"_id": doc_id, "business_id": business_id, "filename": filename, "passages": passages, "version": version},
+        upsert=True
+    )
+    index = _indexes.get(business_id)
+    if index is not None:
+        index.add_document(doc_id, filename, passages, version)
+
+
+async def unindex_document(db: AsyncIOMotorDatabase, business_id: str, doc_id: str):
+    await db.document_texts.delete_one({"_id": doc_id})
+    index = _indexes.get(business_id)
+    if index is not None:
+        index.remove_document(doc_id)
+
+
+async def drop_business_index(db: AsyncIOMotorDatabase, business_id: str):
+    await db.document_texts.delete_many({"business_id": business_id})
+    _indexes.pop(business_id, None)
+
+
+def _evict(business_id: str):
+    _indexes.pop(business_id, None)
+    _evictions.changed(business_id)
+
+
+def evict_business_index(change: dict):
+    """
+    Invalidation bus callback for business_profiles changes. The index only
+    depends on document_texts, so only a deleted business is dropped.
+    """
+    if change["operationType"] == "delete":
+        _evict(str(change["documentKey"]["_id"]))
+
+
+async def apply_document_text(db: AsyncIOMotorDatabase, change: dict):
+    """
+    Invalidation bus callback for document_texts changes, applied to the
+    loaded indexes as deltas. Passages are not part of the event; they are
+    read only when a loaded index does not have this version yet, which
+    skips the echo of this worker's own writes. Indexes being built when
+    the event arrives are discarded, as their reads may predate it.
+    """
+    doc_id = change["documentKey"]["_id"]
+    document = change.get("fullDocument")
+    if document is None:
+        # Delete events carry only the document id
+        _evictions.changed_all()
+        for index in _indexes.values():
+            if doc_id in index.doc_passages:
+                index.remove_document(doc_id)
+        return
+
+    business_id = document["business_id"]
+    _evictions.changed(business_id)
+    index = _indexes.get(business_id)
+    if index is None or (doc_id in index.doc_versions and index.doc_versions[doc_id] == document.get("version")):
+        return
+    current = await db.document_texts.find_one({"_id": doc_id})
+    if current is None:
+        index.remove_document(doc_id)
+    elif current["business_id"] == business_id:
+        index.add_document(doc_id, current["filename"], current["passages"], current.get("version"))
+
+
+def clear_business_indexes():
+    _indexes.clear()
+    _evictions.changed_all()
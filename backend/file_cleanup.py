@@ -0,0 +1,163 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+import asyncio
+import os
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_EXTENSIONS = ['.pdf', '.doc', '.docx']
+LOGO_EXTENSIONS = ['.png', '.jpg', '.jpeg']
+
+CLEANUP_BATCH_SIZE = int(os.environ.get("FILE_CLEANUP_BATCH_SIZE", 100))
+CLEANUP_MAX_ATTEMPTS = int(os.environ.get("FILE_CLEANUP_MAX_ATTEMPTS", 8))
+CLEANUP_LEASE_SECONDS = int(os.environ.get("FILE_CLEANUP_LEASE_SECONDS", 300))
+CLEANUP_POLL_SECONDS = int(os.environ.get("FILE_CLEANUP_POLL_SECONDS", 30))
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="file-cleanup")
+_wakeup = asyncio.Event()
+
+
+def document_file_names(document: dict) -> list[str]:
+    """
+    Document files keep the extension of their original filename, so their
+    name is known exactly; fall back to every candidate otherwise.
+    """
+    ext = Path(document.get("filename", "")).suffix.lower()
+    if ext in DOCUMENT_EXTENSIONS:
+        return [f"{document['id']}{ext}"]
+    return [f"{document['id']}{e}" for e in DOCUMENT_EXTENSIONS]
+
+
+def business_file_names(business: dict, documents: list[dict]) -> list[str]:
+    """
+    Resolve the upload file names owned by a business record and its
+    documents. The logo extension is not recorded, so every candidate is
+    listed; missing candidates are skipped at unlink time.
+    """
+    names = []
+    for doc in documents:
+        names.extend(document_file_names(doc))
+
+    if business.get("logo_url"):
+        logo_id = business["logo_url"].split("/")[-1]
+        names.extend(f"{logo_id}{ext}" for ext in LOGO_EXTENSIONS)
+
+    return names
+
+
+async def enqueue_file_cleanup(db: AsyncIOMotorDatabase, business_id: str, file_names: list[str]):
+    """
+    Persist a cleanup job for the given files and wake the worker.
+    """
+    if not file_names:
+        return
+
+    now = datetime.now(timezone.utc)
+    await db.file_cleanup_jobs.insert_one({
+        "_id": str(uuid.uuid4()),
+        "business_id": business_id,
+        "files": file_names,
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "created_at": now
+    })
+    _wakeup.set()
+
+
+def _unlink_batch(upload_dir: Path, names: list[str]) -> list[str]:
+    """
+    Unlink a batch of files and return the names that failed.
+    """
+    failed = []
+    for name in names:
+        try:
+            (upload_dir / name).unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning(f"Failed to delete upload {name}: {e}")
+            failed.append(name)
+    return failed
+
+
+async def _claim_job(db: AsyncIOMotorDatabase):
+    """
+    Lease the next due job. Jobs whose lease ran out (worker crashed
+    mid-run) become claimable again.
+    """
+    now = datetime.now(timezone.utc)
+    return await db.file_cleanup_jobs.find_one_and_update(
+        {
+            "$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                {"status": "running", "lease_until": {"$lte": now}}
+            ]
+        },
+        {"$set": {"status": "running", "lease_until": now + timedelta(seconds=CLEANUP_LEASE_SECONDS)}},
+        sort=[("next_attempt_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def _process_job(db: AsyncIOMotorDatabase, upload_dir: Path, job: dict):
+    loop = asyncio.get_running_loop()
+    files = job["files"]
+    batches = [files[i:i + CLEANUP_BATCH_SIZE] for i in range(0, len(files), CLEANUP_BATCH_SIZE)]
+    results = await asyncio.gather(*[
+        loop.run_in_executor(_executor, _unlink_batch, upload_dir, batch) for batch in batches
+    ])
+    failed = [name for batch_failed in results for name in batch_failed]
+
+    if not failed:
+        await db.file_cleanup_jobs.delete_one({"_id": job["_id"]})
+        logger.info(f"File cleanup done for business: {job['business_id']}, files: {len(files)}")
+        return
+
+    attempts = job["attempts"] + 1
+    if attempts >= CLEANUP_MAX_ATTEMPTS:
+        await db.file_cleanup_jobs.update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": "failed", "files": failed, "attempts": attempts}}
+        )
+        logger.error(f"File cleanup gave up for business: {job['business_id']}, remaining files: {len(failed)}")
+        return
+
+    # Exponential backoff, capped at one hour
+    delay = min(2 ** attempts * 10, 3600)
+    await db.file_cleanup_jobs.update_one(
+        {"_id": job["_id"]},
+        {"$set": {
+            "status": "pending",
+            "files": failed,
+            "attempts": attempts,
+            "next_attempt_at": datetime.now(timezone.utc) + timedelta(seconds=delay)
+        }}
+    )
+    logger.warning(f"File cleanup retry {attempts} scheduled for business: {job['business_id']}, files: {len(failed)}")
+
+
+async def run_file_cleanup_worker(db: AsyncIOMotorDatabase, upload_dir: Path):
+    """
+    Background loop draining file_cleanup_jobs. Wakes immediately when a job
+    is enqueued by this worker and polls for jobs enqueued by other workers.
+    """
+    while True:
+        try:
+            job = await _claim_job(db)
+            if job:
+                await _process_job(db, upload_dir, job)
+                continue
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"File cleanup worker error: {e}")
+
+        _wakeup.clear()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=CLEANUP_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,233 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from fastapi import HTTPException, UploadFile, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Optional
+import asyncio
+import hashlib
+import os
+import uuid
+import logging
+
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL = timedelta(seconds=int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", 24 * 60 * 60)))
+# A claim not renewed for this long is considered abandoned (worker crashed
+# mid-request); the holder renews it every third of that while it runs
+IDEMPOTENCY_LEASE_SECONDS = int(os.environ.get("IDEMPOTENCY_LEASE_SECONDS", 120))
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get("IDEMPOTENCY_WAIT_SECONDS", 30))
+IDEMPOTENCY_POLL_SECONDS = 0.2
+IDEMPOTENCY_MEMO_SECONDS = float(os.environ.get("IDEMPOTENCY_MEMO_SECONDS", 300))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+FINGERPRINT_READ_SIZE = 1024 * 1024
+
+
+def request_fingerprint(method: str, path: str, *parts: str) -> str:
+    """
+    Hash identifying a request body, stored with its idempotency key so a
+    key reused for a different request is refused instead of replayed.
+    """
+    digest = hashlib.sha256()
+    for part in (method, path, *parts):
+        encoded = part.encode("utf-8")
+        digest.update(len(encoded).to_bytes(8, "big"))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+
+async def hash_upload(file: UploadFile) -> str:
+    """
+    SHA-256 of an uploaded file, read in blocks in a worker thread. The file
+    is rewound for the handler.
+    """
+    def digest() -> str:
+        sha256 = hashlib.sha256()
+        file.file.seek(0)
+        for block in iter(lambda: file.file.read(FINGERPRINT_READ_SIZE), b""):
+            sha256.update(block)
+        file.file.seek(0)
+        return sha256.hexdigest()
+
+    return await asyncio.to_thread(digest)
+
+
+def _check_fingerprint(stored: Optional[str], fingerprint: str):
+    # Records stored before fingerprints existed have none
+    if stored not in (None, fingerprint):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used for a different request"
+        )
+
+
+class IdempotencyStore:
+    """
+    Replays the stored response of a request retried with the same
+    Idempotency-Key instead of executing it again.
+
+    Keys are scoped to the user and the operation. Completed responses live
+    in idempotency_keys until their TTL runs out; a SingleFlight in front of
+    it makes concurrent duplicates in this worker wait for the first request
+    and answers recent repeats from memory. Duplicates arriving at another
+    worker wait on the stored claim, which its holder keeps renewing however
+    long the handler takes. Only successful responses are stored: a failed
+    request releases its key so the retry runs again.
+    """
+
+    def __init__(self):
+        self._flight = SingleFlight(memo_ttl=IDEMPOTENCY_MEMO_SECONDS)
+        self.replays = 0
+
+    async def run(
+        self,
+        db: AsyncIOMotorDatabase,
+        user_id: str,
+        scope: str,
+        key: Optional[str],
+        fingerprint: Optional[str],
+        handler: Callable[[], Awaitable]
+    ):
+        """
+        `fingerprint` (see request_fingerprint) is only needed with a key.
+        """
+        if not key:
+            return await handler()
+        if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Idempotency-Key must be at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters"
+            )
+
+        record_id = f"{user_id}:{scope}:{key}"
+        executed = False
+
+        async def execute():
+            nonlocal executed
+            executed = True
+            return await self._execute(db, record_id, fingerprint, handler)
+
+        body, replayed, stored_fingerprint = await self._flight.do(record_id, execute)
+        # Concurrent or recent requests of this worker share the outcome of
+        # the first one, whatever their body
+        _check_fingerprint(stored_fingerprint, fingerprint)
+        if replayed or not executed:
+            self.replays += 1
+            return JSONResponse(content=body, headers={"Idempotent-Replayed": "true"})
+        return body
+
+    async def _execute(self, db: AsyncIOMotorDatabase, record_id: str, fingerprint: str, handler: Callable[[], Awaitable]) -> tuple:
+        """
+        Returns (body, replayed, fingerprint of the request that produced it).
+        """
+        holder = await self._claim(db, record_id, fingerprint)
+        if holder is None:
+            record, holder = await self._wait(db, record_id, fingerprint)
+            if record is not None:
+                _check_fingerprint(record.get("fingerprint"), fingerprint)
+                return record["body"], True, record.get("fingerprint")
+
+        heartbeat = asyncio.create_task(self._heartbeat(db, record_id, holder))
+        try:
+            result = await handler()
+        except BaseException:
+            await db.idempotency_keys.delete_one({"_id": record_id, "status": "pending", "holder": holder})
+            raise
+        finally:
+            heartbeat.cancel()
+
+        body = jsonable_encoder(result)
+        await db.idempotency_keys.update_one(
+            {"_id": record_id},
+            {"$set": {"status": "done", "body": body}, "$unset": {"lease_until": "", "holder": ""}}
+        )
+        return body, False, fingerprint
+
+    async def _claim(self, db: AsyncIOMotorDatabase, record_id: str, fingerprint: str) -> Optional[str]:
+        """
+        Insert the claim of a key. Returns the holder token of the claim, or
+        None when the key is already claimed.
+        """
+        now = datetime.now(timezone.utc)
+        holder = str(uuid.uuid4())
+        try:
+            await db.idempotency_keys.insert_one({
+                "_id": record_id,
+                "fingerprint": fingerprint,
+                "status": "pending",
+                "holder": holder,
+                "lease_until": now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS),
+                "created_at": now,
+                "expires_at": now + IDEMPOTENCY_TTL
+            })
+            return holder
+        except DuplicateKeyError:
+            return None
+
+    async def _heartbeat(self, db: AsyncIOMotorDatabase, record_id: str, holder: str):
+        """
+        Renew the lease of a claim while its handler runs. Stops once the
+        claim is completed, released or taken over.
+        """
+        while True:
+            await asyncio.sleep(IDEMPOTENCY_LEASE_SECONDS / 3)
+            try:
+                renewed = await db.idempotency_keys.update_one(
+                    {"_id": record_id, "status": "pending", "holder": holder},
+                    {"$set": {"lease_until": datetime.now(timezone.utc) + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)}}
+                )
+            except Exception as e:
+                logger.warning(f"Failed to renew idempotency claim {record_id}: {e}")
+                continue
+            if renewed.matched_count == 0:
+                return
+
+    async def _wait(self, db: AsyncIOMotorDatabase, record_id: str, fingerprint: str) -> tuple[Optional[dict], Optional[str]]:
+        """
+        Wait for the request holding the claim in another worker. Returns
+        (completed record, None), or (None, holder token) once this request
+        owns the claim (the holder failed or stopped renewing its lease).
+        """
+        deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            record = await db.idempotency_keys.find_one({"_id": record_id})
+            if record is None:
+                holder = await self._claim(db, record_id, fingerprint)
+                if holder is not None:
+                    return None, holder
+                continue
+            if record["status"] == "done" or record.get("fingerprint") not in (None, fingerprint):
+                # A different request holds the key; refused without waiting
+                return record, None
+
+            now = datetime.now(timezone.utc)
+            holder = str(uuid.uuid4())
+            taken_over = await db.idempotency_keys.find_one_and_update(
+                {"_id": record_id, "status": "pending", "lease_until": {"$lt": now}},
+                {"$set": {
+                    "lease_until": now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS),
+                    "fingerprint": fingerprint,
+                    "holder": holder
+                }},
+                return_document=ReturnDocument.AFTER
+            )
+            if taken_over:
+                logger.warning(f"Took over abandoned idempotency claim: {record_id}")
+                return None, holder
+
+            if asyncio.get_running_loop().time() > deadline:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="A request with this Idempotency-Key is still in progress"
+                )
+            await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+
+    def stats(self) -> dict:
+        return {"replays": self.replays, **self._flight.stats()}
+
+
+idempotency = IdempotencyStore()
@@ -0,0 +1,27 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timezone, timedelta
+import uuid
+
+# Identifies this process as the holder of a lease
+WORKER_ID = str(uuid.uuid4())
+
+
+async def acquire_lease(db: AsyncIOMotorDatabase, name: str, seconds: float) -> bool:
+    """
+    Take or renew the lease of a periodic job so only one worker runs it.
+
+    The holder renews its own lease on every run; another worker only gets
+    it once it ran out (holder stopped or crashed). Losing the race to
+    insert the lease document surfaces as a duplicate key.
+    """
+    now = datetime.now(timezone.utc)
+    try:
+        await db.job_leases.update_one(
+            {"_id": name, "$or": [{"holder": WORKER_ID}, {"lease_until": {"$lte": now}}]},
+            {"$set": {"holder": WORKER_ID, "lease_until": now + timedelta(seconds=seconds)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
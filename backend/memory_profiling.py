@@ -0,0 +1,186 @@
+from datetime import datetime, timezone
+from typing import Optional
+import asyncio
+import itertools
+import random
+import time
+import tracemalloc
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+MEMORY_PROFILING = os.environ.get("MEMORY_PROFILING", "").lower() in ("1", "true", "yes")
+# Fraction of requests whose peak allocation is measured
+MEMORY_SAMPLE_RATE = float(os.environ.get("MEMORY_PROFILE_SAMPLE_RATE", 0.1))
+# Stack depth recorded per allocation; 1 keeps tracemalloc overhead lowest
+MEMORY_TRACE_FRAMES = int(os.environ.get("MEMORY_PROFILE_FRAMES", 1))
+MEMORY_MAX_DURATION_SECONDS = 3600
+MEMORY_MAX_SNAPSHOTS = 5
+
+# Allocations of the profiler itself are noise in the reports
+SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+class MemoryProfiler:
+    """
+    Opt-in tracemalloc instrumentation.
+
+    While active, a sample of requests has its peak traced allocation
+    recorded per route. tracemalloc keeps a single global peak, so only one
+    request is measured at a time; allocations of requests running
+    concurrently are included in that peak, making the numbers an upper
+    bound. Response bodies streamed after the endpoint returned are not
+    counted. Tracing stops by itself after the requested duration.
+    """
+
+    def __init__(self):
+        self.sample_rate = MEMORY_SAMPLE_RATE
+        self.started_at: Optional[datetime] = None
+        self.stop_at: Optional[float] = None
+        self.routes = {}
+        self.snapshots = {}
+        self._snapshot_ids = itertools.count(1)
+        self._measuring = False
+
+    @property
+    def active(self) -> bool:
+        if not tracemalloc.is_tracing():
+            return False
+        if self.stop_at is not None and time.monotonic() >= self.stop_at:
+            self.stop()
+            return False
+        return True
+
+    def start(self, duration_seconds: Optional[int] = None, sample_rate: Optional[float] = None, frames: int = MEMORY_TRACE_FRAMES):
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self.started_at = datetime.now(timezone.utc)
+            self.routes = {}
+        self.stop_at = time.monotonic() + duration_seconds if duration_seconds else None
+        logger.warning(f"Memory profiling started: sample_rate={self.sample_rate}, frames={frames}, duration={duration_seconds}")
+
+    def stop(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            logger.warning("Memory profiling stopped")
+        self.stop_at = None
+        # Snapshots reference traces of a session that no longer exists
+        self.snapshots = {}
+
+    def should_measure(self) -> bool:
+        return self.active and not self._measuring and random.random() < self.sample_rate
+
+    def begin(self) -> int:
+        self._measuring = True
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        return current
+
+    def end(self, route: str, baseline: int):
+        self._measuring = False
+        if not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        peak_bytes = max(0, peak - baseline)
+        stats = self.routes.setdefault(route, {"samples": 0, "peak_bytes_max": 0, "peak_bytes_total": 0, "retained_bytes_total": 0})
+        stats["samples"] += 1
+        stats["peak_bytes_max"] = max(stats["peak_bytes_max"], peak_bytes)
+        stats["peak_bytes_total"] += peak_bytes
+        stats["retained_bytes_total"] += current - baseline
+
+    async def take_snapshot(self) -> dict:
+        if not self.active:
+            raise RuntimeError("Memory profiling is not active")
+        snapshot = await asyncio.to_thread(lambda: tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS))
+        snapshot_id = next(self._snapshot_ids)
+        self.snapshots[snapshot_id] = (datetime.now(timezone.utc), snapshot)
+        while len(self.snapshots) > MEMORY_MAX_SNAPSHOTS:
+            del self.snapshots[min(self.snapshots)]
+        current, peak = tracemalloc.get_traced_memory()
+        return {"snapshot_id": snapshot_id, "traced_bytes": current, "peak_bytes": peak}
+
+    async def diff(self, base_id: int, target_id: Optional[int] = None, limit: int = 20, group_by: str = "lineno") -> dict:
+        """
+        Top allocation sites by growth between two snapshots.
+        """
+        if target_id is None:
+            target_id = max(self.snapshots, default=None)
+        if base_id not in self.snapshots or target_id not in self.snapshots:
+            raise KeyError("Unknown snapshot")
+        base_at, base = self.snapshots[base_id]
+        target_at, target = self.snapshots[target_id]
+        differences = await asyncio.to_thread(target.compare_to, base, group_by)
+        return {
+            "base": {"snapshot_id": base_id, "taken_at": base_at.isoformat()},
+            "target": {"snapshot_id": target_id, "taken_at": target_at.isoformat()},
+            "size_diff_bytes": sum(stat.size_diff for stat in differences),
+            "top": [
+                {
+                    "site": " <- ".join(f"{frame.filename}:{frame.lineno}" for frame in stat.traceback),
+                    "size_bytes": stat.size,
+                    "size_diff_bytes": stat.size_diff,
+                    "count": stat.count,
+                    "count_diff": stat.count_diff
+                }
+                for stat in differences[:limit]
+            ]
+        }
+
+    def stats(self) -> dict:
+        active = self.active
+        current, peak = tracemalloc.get_traced_memory() if active else (0, 0)
+        routes = {
+            route: {
+                "samples": stats["samples"],
+                "peak_bytes_max": stats["peak_bytes_max"],
+                "peak_bytes_avg": stats["peak_bytes_total"] // stats["samples"],
+                "retained_bytes_avg": stats["retained_bytes_total"] // stats["samples"]
+            }
+            for route, stats in sorted(self.routes.items(), key=lambda item: -item[1]["peak_bytes_max"])
+        }
+        return {
+            "active": active,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "stops_in_seconds": round(self.stop_at - time.monotonic()) if active and self.stop_at else None,
+            "sample_rate": self.sample_rate,
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "snapshots": sorted(self.snapshots),
+            "routes": routes
+        }
+
+
+memory_profiler = MemoryProfiler()
+
+
+class MemorySamplingMiddleware:
+    """
+    Record the peak traced allocation of sampled requests per route while
+    memory profiling is active. Plain ASGI, so unsampled requests only pay
+    for the sampling check.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not memory_profiler.should_measure():
+            await self.app(scope, receive, send)
+            return
+
+        baseline = memory_profiler.begin()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            route_path = route.path if route is not None else scope["path"]
+            memory_profiler.end(f"{scope['method']} {route_path}", baseline)
@@ -0,0 +1,201 @@
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from bson import ObjectId
+from dotenv import load_dotenv
+from pathlib import Path
+from typing import Optional
+import asyncio
+import os
+import logging
+
+from agent_context import refresh_agent_context
+from document_search import extract_text, index_document
+from file_cleanup import document_file_names
+from job_lease import acquire_lease
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_BATCH_SIZE = int(os.environ.get("MIGRATION_BATCH_SIZE", 100))
+BACKFILL_LEASE = "document_text_backfill"
+BACKFILL_LEASE_SECONDS = 600
+
+
+async def migrate_embedded_documents(db: AsyncIOMotorDatabase, batch_size: int = MIGRATION_BATCH_SIZE) -> int:
+    """
+    Move embedded business_profiles.documents arrays into business_documents.
+
+    Businesses are processed in batches. Each document is inserted with its
+    business and owner ids; the unique (business_id, id) index makes a
+    re-run after an interruption skip what was already copied. The array is
+    only unset once its documents are in the collection. Safe to run while
+    the app is serving and from several workers at once.
+    """
+    migrated = 0
+    while True:
+        businesses = await db.business_profiles.find(
+            {"documents": {"$exists": True}},
+            {"user_id": 1, "documents": 1}
+        ).limit(batch_size).to_list(batch_size)
+        if not businesses:
+            break
+
+        operations = []
+        for business in businesses:
+            business_id = str(business["_id"])
+            for doc in business.get("documents") or []:
+                operations.append(InsertOne({**doc, "business_id": business_id, "user_id": business["user_id"]}))
+
+        if operations:
+            try:
+                await db.business_documents.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                # Duplicates were copied by an earlier or concurrent run
+                errors = [err for err in e.details["writeErrors"] if err["code"] != 11000]
+                if errors:
+                    raise
+
+        for business in businesses:
+            business_id = str(business["_id"])
+            count = await db.business_documents.count_documents({"business_id": business_id})
+            await db.business_profiles.update_one(
+                {"_id": business["_id"]},
+                {"$unset": {"documents": ""}, "$set": {"document_count": count}}
+            )
+
+        migrated += len(businesses)
+        logger.info(f"Migrated embedded documents of {migrated} businesses")
+
+    return migrated
+
+
+async def migrate_logo_ids(db: AsyncIOMotorDatabase, batch_size: int = MIGRATION_BATCH_SIZE) -> int:
+    """
+    Record the file id of logos uploaded before logo_id existed, so the
+    upload reconciler can look logos up by id.
+    """
+    migrated = 0
+    while True:
+        businesses = await db.business_profiles.find(
+            {"logo_url": {"$type": "string"}, "logo_id": None},
+            {"logo_url": 1}
+        ).limit(batch_size).to_list(batch_size)
+        if not businesses:
+            break
+
+        # Guarded by the url read, so a logo replaced meanwhile keeps its new id
+        await db.business_profiles.bulk_write([
+            UpdateOne(
+                {"_id": business["_id"], "logo_url": business["logo_url"]},
+                {"$set": {"logo_id": business["logo_url"].split("/")[-1]}}
+            )
+            for business in businesses
+        ], ordered=False)
+        migrated += len(businesses)
+
+    if migrated:
+        logger.info(f"Recorded logo ids of {migrated} businesses")
+    return migrated
+
+
+def _stored_document_path(upload_dir: Path, document: dict) -> Optional[Path]:
+    for name in document_file_names(document):
+        path = upload_dir / name
+        if path.is_file():
+            return path
+    return None
+
+
+def _extract_stored_document(upload_dir: Path, document: dict) -> str:
+    """
+    Extract the text of a stored document file. Runs in a worker thread.
+    """
+    path = _stored_document_path(upload_dir, document)
+    if path is None:
+        return ""
+    return extract_text(path, path.suffix.lower())
+
+
+async def backfill_document_texts(db: AsyncIOMotorDatabase, upload_dir: Path, batch_size: int = MIGRATION_BATCH_SIZE) -> int:
+    """
+    Extract and index the text of documents uploaded before text extraction
+    existed, i.e. business_documents without a document_texts record.
+
+    Documents are read in _id order a batch at a time. Documents whose file
+    is gone are indexed with no text so they are not retried. The agent
+    contexts of the affected businesses are rebuilt once per batch. Only
+    the worker holding the lease runs it; a re-run resumes where it stopped
+    because indexed documents are skipped.
+    """
+    backfilled = 0
+    last_id = None
+    while True:
+        if not await acquire_lease(db, BACKFILL_LEASE, BACKFILL_LEASE_SECONDS):
+            logger.info("Document text backfill is running on another worker")
+            return backfilled
+
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        documents = await db.business_documents.find(
+            query,
+            {"id": 1, "business_id": 1, "filename": 1}
+        ).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not documents:
+            break
+        last_id = documents[-1]["_id"]
+
+        indexed = await db.document_texts.find(
+            {"_id": {"$in": [document["id"] for document in documents]}},
+            {"_id": 1}
+        ).to_list(None)
+        indexed_ids = {text["_id"] for text in indexed}
+
+        businesses = set()
+        for document in documents:
+            if document["id"] in indexed_ids:
+                continue
+            text = await asyncio.to_thread(_extract_stored_document, upload_dir, document)
+            await index_document(db, document["business_id"], document["id"], document["filename"], text)
+            businesses.add(document["business_id"])
+            backfilled += 1
+
+        for business_id in businesses:
+            # Businesses created before string ids were enforced use ObjectIds
+            await refresh_agent_context(db, ObjectId(business_id) if ObjectId.is_valid(business_id) else business_id)
+
+        if businesses:
+            logger.info(f"Backfilled text of {backfilled} documents")
+
+    return backfilled
+
+
+async def run_startup_migrations(db: AsyncIOMotorDatabase, upload_dir: Path):
+    """
+    Data migrations run in the background on startup, in order.
+    """
+    try:
+        await migrate_embedded_documents(db)
+        await migrate_logo_ids(db)
+        await backfill_document_texts(db, upload_dir)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Startup migrations failed: {e}")
+
+
+async def main():
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    await db.business_documents.create_index([("business_id", 1), ("id", 1)], unique=True)
+    migrated = await migrate_embedded_documents(db)
+    print(f"Migrated {migrated} businesses")
+    logos = await migrate_logo_ids(db)
+    print(f"Recorded logo ids of {logos} businesses")
+    backfilled = await backfill_document_texts(db, Path(__file__).parent / "uploads")
+    print(f"Backfilled text of {backfilled} documents")
+    client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
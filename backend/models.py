@@ -3,6 +3,14 @@ from typing import Optional
 from datetime import datetime, timezone
 import uuid
 
+def as_utc(value: datetime) -> datetime:
+    """
+    Motor returns timezone-naive datetimes that are UTC; make them aware.
+    """
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
 class User(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), alias="_id")
     email: str
@@ -33,6 +41,20 @@ class BusinessDocument(BaseModel):
     class Config:
         json_encoders = {datetime: lambda v: v.isoformat()}
 
+BUSINESS_TYPES = [
+    "Restaurant / Cafe",
+    "Retail Store",
+    "Medical / Dental Office",
+    "Legal Services",
+    "Salon / Spa",
+    "Fitness Center / Gym",
+    "Real Estate",
+    "Accounting / Financial Services",
+    "Consulting",
+    "Home Services (Plumbing, Electrical, etc.)",
+    "Other"
+]
+
 class BusinessProfile(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), alias="_id")
     user_id: str
@@ -40,8 +62,11 @@ class BusinessProfile(BaseModel):
     business_type: str
     custom_services: list[str] = Field(default_factory=list)
     business_phone: str
+    business_phone_e164: Optional[str] = None
     logo_url: Optional[str] = None
-    documents: list[BusinessDocument] = Field(default_factory=list)
+    logo_id: Optional[str] = None
+    logo_size: Optional[int] = None
+    document_count: int = 0
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -60,3 +85,9 @@ class BusinessProfileUpdate(BaseModel):
     business_type: str
     custom_services: list[str] = Field(default_factory=list)
     business_phone: str
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int = Field(gt=0)
+    chunk_size: Optional[int] = None
+    sha256: Optional[str] = None
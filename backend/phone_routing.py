@@ -0,0 +1,120 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+from typing import Optional
+from cache_bus import bus
+import phonenumbers
+import asyncio
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Region assumed for numbers entered without a country code. The older
+# DEFAULT_PHONE_COUNTRY_CODE setting is still honoured.
+DEFAULT_PHONE_REGION = os.environ.get("DEFAULT_PHONE_REGION") or phonenumbers.region_code_for_country_code(
+    int(os.environ.get("DEFAULT_PHONE_COUNTRY_CODE", "1"))
+)
+
+
+def normalize_phone(raw: str, default_region: str = DEFAULT_PHONE_REGION) -> Optional[str]:
+    """
+    Normalize a free-form phone number to E.164 ("+15551234567").
+    Returns None unless the input is a valid number of its region
+    (length and prefixes checked against the numbering plan).
+    """
+    if not raw:
+        return None
+
+    try:
+        number = phonenumbers.parse(raw, default_region)
+    except phonenumbers.NumberParseException:
+        return None
+    if not phonenumbers.is_valid_number(number):
+        return None
+    # Extensions are dropped; calls are routed on the main number
+    return phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164)
+
+
+class PhoneRoutingTable:
+    """
+    In-memory map from normalized dialed number to business id.
+    """
+
+    def __init__(self):
+        self._by_number = {}
+        self._by_business = {}
+        self._loaded_at = time.monotonic()
+        self._reloading = None
+
+    def __len__(self):
+        return len(self._by_number)
+
+    def lookup(self, number: str) -> Optional[str]:
+        return self._by_number.get(number)
+
+    def set(self, business_id: str, number: Optional[str]):
+        self.remove(business_id)
+        if number:
+            self._by_number[number] = business_id
+            self._by_business[business_id] = number
+
+    def remove(self, business_id: str):
+        number = self._by_business.pop(business_id, None)
+        if number is not None and self._by_number.get(number) == business_id:
+            del self._by_number[number]
+
+    async def load(self, db: AsyncIOMotorDatabase):
+        """
+        Rebuild the table from business_profiles, backfilling or correcting
+        the normalized number of records stored by older versions.
+        """
+        by_number = {}
+        by_business = {}
+        cursor = db.business_profiles.find({}, {"business_phone": 1, "business_phone_e164": 1})
+        async for business in cursor:
+            business_id = str(business["_id"])
+            stored = business.get("business_phone_e164")
+            # Recomputed every time so numbers stored by an older, laxer
+            # normalization are corrected
+            number = normalize_phone(business.get("business_phone", ""))
+            if number != stored:
+                update = {"$set": {"business_phone_e164": number}} if number else {"$unset": {"business_phone_e164": ""}}
+                try:
+                    await db.business_profiles.update_one({"_id": business["_id"]}, update)
+                except DuplicateKeyError:
+                    logger.warning(f"Phone number {number} of business {business_id} is already routed")
+                    continue
+            if not number:
+                continue
+            by_number[number] = business_id
+            by_business[business_id] = number
+
+        self._by_number = by_number
+        self._by_business = by_business
+        self._loaded_at = time.monotonic()
+        logger.info(f"Phone routing table loaded: {len(by_number)} numbers")
+
+    def ensure_fresh(self, db: AsyncIOMotorDatabase):
+        """
+        Schedule a background reload when the invalidation stream is down
+        and the table is older than the fallback TTL. Lookups keep serving
+        the current table meanwhile.
+        """
+        if bus.is_fresh(self._loaded_at):
+            return
+        if self._reloading is None or self._reloading.done():
+            self._reloading = asyncio.create_task(self.load(db))
+
+    def apply_change(self, change: dict):
+        """
+        Invalidation bus callback for business_profiles changes.
+        """
+        business_id = str(change["documentKey"]["_id"])
+        if change["operationType"] == "delete":
+            self.remove(business_id)
+        elif change.get("fullDocument") is not None:
+            self.set(business_id, change["fullDocument"].get("business_phone_e164"))
+
+
+phone_routes = PhoneRoutingTable()
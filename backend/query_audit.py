@@ -0,0 +1,333 @@
+"""
+Query-plan auditing for the Mongo access patterns of the backend.
+
+With QUERY_AUDIT=1 every distinct query shape the app issues (values
+replaced by placeholders) is explained once with executionStats. Findings
+are stored in the query_audit collection and served by
+GET /api/admin/query-audit. Meant for development and benchmark runs, not
+production.
+
+Against a seeded local database:
+
+    MONGO_URL=mongodb://localhost:27017 DB_NAME=aira_audit python query_audit.py seed
+    QUERY_AUDIT=1 MONGO_URL=mongodb://localhost:27017 DB_NAME=aira_audit uvicorn server:app
+    (exercise the app, e.g. with login_benchmark.py or the frontend)
+    MONGO_URL=mongodb://localhost:27017 DB_NAME=aira_audit python query_audit.py report
+"""
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import monitoring
+from dotenv import load_dotenv
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import queue
+import uuid
+import logging
+
+from models import BUSINESS_TYPES
+from phone_routing import normalize_phone
+
+logger = logging.getLogger(__name__)
+
+QUERY_AUDIT_ENABLED = os.environ.get("QUERY_AUDIT", "").lower() in ("1", "true", "yes")
+# Flag plans that examine this many documents per document returned
+AUDIT_EXAMINED_RATIO = float(os.environ.get("QUERY_AUDIT_EXAMINED_RATIO", 10))
+AUDIT_MIN_EXAMINED = int(os.environ.get("QUERY_AUDIT_MIN_EXAMINED", 20))
+
+AUDITED_COMMANDS = {"find", "count", "distinct", "aggregate", "findAndModify", "update", "delete"}
+IGNORED_COLLECTIONS = {"query_audit"}
+# Session and transport fields that explain rejects or that do not shape the plan
+TRANSPORT_FIELDS = {
+    "lsid", "$db", "$clusterTime", "txnNumber", "$readPreference", "readConcern",
+    "writeConcern", "ordered", "batchSize", "singleBatch", "maxTimeMS", "comment", "bypassDocumentValidation"
+}
+
+_shapes = queue.SimpleQueue()
+_seen = set()
+
+
+def query_shape(value):
+    """
+    Replace every value by a placeholder while keeping field names and
+    operators, so queries that differ only in their values share a shape.
+    """
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [query_shape(value[0])] if value else []
+    return "?"
+
+
+def _explainable(command_name: str, command: dict) -> dict:
+    explainable = {key: value for key, value in command.items() if key not in TRANSPORT_FIELDS}
+    # One statement stands for the shape of a bulk write
+    for field in ("updates", "deletes"):
+        if explainable.get(field):
+            explainable[field] = explainable[field][:1]
+    if command_name == "aggregate":
+        explainable["cursor"] = {}
+    return explainable
+
+
+def _shape_key(command_name: str, command: dict) -> str:
+    shape = {key: query_shape(value) for key, value in command.items() if key != command_name}
+    return f"{command[command_name]}.{command_name} {json.dumps(shape, sort_keys=True, default=str)}"
+
+
+class QueryAuditListener(monitoring.CommandListener):
+    """
+    Captures the first command of every query shape. Explaining happens on
+    the event loop (see run_query_audit); the listener only enqueues.
+    """
+
+    def started(self, event):
+        if event.command_name not in AUDITED_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str) or collection in IGNORED_COLLECTIONS:
+            return
+        command = _explainable(event.command_name, event.command)
+        key = _shape_key(event.command_name, command)
+        if key in _seen:
+            return
+        _seen.add(key)
+        _shapes.put((key, event.database_name, event.command_name, command))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def _stages(plan: dict) -> list[dict]:
+    """
+    Flatten a plan tree into its stages, root first.
+    """
+    if "queryPlan" in plan:
+        plan = plan["queryPlan"]
+    stages = [plan]
+    for child_key in ("inputStage", "inputStages", "thenStage", "elseStage"):
+        child = plan.get(child_key)
+        if isinstance(child, dict):
+            stages.extend(_stages(child))
+        elif isinstance(child, list):
+            for item in child:
+                stages.extend(_stages(item))
+    return stages
+
+
+def _filter_fields(command_name: str, command: dict) -> list[str]:
+    if command_name == "find":
+        query = command.get("filter") or {}
+    elif command_name in ("count", "distinct", "findAndModify"):
+        query = command.get("query") or {}
+    elif command_name in ("update", "delete"):
+        statements = command.get("updates") or command.get("deletes") or [{}]
+        query = statements[0].get("q") or {}
+    elif command_name == "aggregate":
+        match = next((stage["$match"] for stage in command.get("pipeline", []) if "$match" in stage), {})
+        query = match
+    else:
+        query = {}
+    return [field for field in query if not field.startswith("$")]
+
+
+def analyze_explain(command_name: str, command: dict, explain: dict) -> dict:
+    """
+    Summarize an explain result and flag plans that will not scale.
+    """
+    planner = explain.get("queryPlanner") or {}
+    if not planner and "stages" in explain:
+        # Aggregations report the plan of their $cursor stage
+        cursor_stage = next((stage["$cursor"] for stage in explain["stages"] if "$cursor" in stage), {})
+        planner = cursor_stage.get("queryPlanner") or {}
+        explain = cursor_stage
+    stats = explain.get("executionStats") or {}
+    stages = _stages(planner.get("winningPlan") or {})
+    stage_names = [stage.get("stage") for stage in stages]
+    indexes = sorted({stage["indexName"] for stage in stages if stage.get("indexName")})
+
+    examined = stats.get("totalDocsExamined", 0)
+    returned = stats.get("nReturned", 0)
+    fields = _filter_fields(command_name, command)
+
+    flags = []
+    suggestion = None
+    if "COLLSCAN" in stage_names:
+        flags.append("collection_scan")
+        if fields:
+            flags.append("missing_index")
+            suggestion = {field: 1 for field in fields}
+    if "SORT" in stage_names:
+        flags.append("in_memory_sort")
+    if examined >= AUDIT_MIN_EXAMINED and examined > AUDIT_EXAMINED_RATIO * max(returned, 1):
+        flags.append("high_examined_ratio")
+
+    return {
+        "stages": stage_names,
+        "indexes": indexes,
+        "docs_examined": examined,
+        "keys_examined": stats.get("totalKeysExamined", 0),
+        "returned": returned,
+        "execution_ms": stats.get("executionTimeMillis"),
+        "filter_fields": fields,
+        "flags": flags,
+        "suggested_index": suggestion
+    }
+
+
+async def audit_shape(db: AsyncIOMotorDatabase, key: str, command_name: str, command: dict):
+    entry = {
+        "collection": command[command_name],
+        "command": command_name,
+        "shape": key,
+        "audited_at": datetime.now(timezone.utc)
+    }
+    try:
+        explain = await db.command({"explain": command, "verbosity": "executionStats"})
+        entry.update(analyze_explain(command_name, command, explain))
+    except Exception as e:
+        entry.update({"flags": ["explain_failed"], "error": str(e)})
+    await db.query_audit.replace_one({"_id": key}, entry, upsert=True)
+    if entry["flags"]:
+        logger.warning(f"Query audit: {key} flags={entry['flags']} suggested_index={entry.get('suggested_index')}")
+
+
+async def run_query_audit(client: AsyncIOMotorClient):
+    """
+    Background loop explaining newly seen query shapes.
+    """
+    while True:
+        try:
+            key, database_name, command_name, command = _shapes.get_nowait()
+        except queue.Empty:
+            await asyncio.sleep(1)
+            continue
+        try:
+            await audit_shape(client[database_name], key, command_name, command)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Query audit failed for {key}: {e}")
+
+
+async def audit_report(db: AsyncIOMotorDatabase) -> dict:
+    entries = await db.query_audit.find({}, {"_id": 0}).sort([("collection", 1), ("shape", 1)]).to_list(None)
+    flagged = [entry for entry in entries if entry.get("flags")]
+    return {"enabled": QUERY_AUDIT_ENABLED, "shapes": len(entries), "flagged": len(flagged), "entries": entries}
+
+
+# ==================== Seeding and CLI ====================
+
+async def seed(db: AsyncIOMotorDatabase, users: int, businesses_per_user: int, documents_per_business: int):
+    """
+    Fill a local database with realistic volumes so plans are meaningful.
+    Records pass the same validation as the API, so routed phone numbers
+    and every business type are exercised.
+    """
+    now = datetime.now(timezone.utc)
+    # Phone numbers continue after those of earlier seeds; they must be unique
+    seeded = await db.business_profiles.estimated_document_count()
+    for u in range(users):
+        user_id = str(uuid.uuid4())
+        await db.users.insert_one({
+            "_id": user_id,
+            "email": f"audit.{u}.{user_id[:8]}@example.com",
+            "name": f"Audit User {u}",
+            "picture": "https://via.placeholder.com/150",
+            "created_at": now
+        })
+        await db.user_sessions.insert_one({
+            "user_id": user_id,
+            "session_token": f"audit_{uuid.uuid4().hex}",
+            "expires_at": now + timedelta(days=7),
+            "created_at": now
+        })
+        businesses = []
+        documents = []
+        for b in range(businesses_per_user):
+            business_id = str(uuid.uuid4())
+            number = seeded + u * businesses_per_user + b
+            phone = f"+1 650 {253 + number // 10000:03d} {number % 10000:04d}"
+            businesses.append({
+                "_id": business_id,
+                "user_id": user_id,
+                "business_name": f"Audit Business {u}-{b}",
+                "business_type": BUSINESS_TYPES[number % len(BUSINESS_TYPES)],
+                "custom_services": ["Dine-in", "Takeout"],
+                "business_phone": phone,
+                "business_phone_e164": normalize_phone(phone),
+                "document_count": documents_per_business,
+                "created_at": now,
+                "updated_at": now
+            })
+            for d in range(documents_per_business):
+                doc_id = str(uuid.uuid4())
+                documents.append({
+                    "id": doc_id,
+                    "filename": f"menu-{d}.pdf",
+                    "size": 1024,
+                    "url": f"/api/business/{business_id}/document/{doc_id}",
+                    "uploaded_at": now,
+                    "business_id": business_id,
+                    "user_id": user_id
+                })
+        if businesses:
+            await db.business_profiles.insert_many(businesses)
+        if documents:
+            await db.business_documents.insert_many(documents)
+    logger.info(
+        f"Seeded {users} users, {users * businesses_per_user} businesses, "
+        f"{users * businesses_per_user * documents_per_business} documents"
+    )
+
+
+def _print_report(report: dict):
+    print(f"{report['shapes']} query shapes, {report['flagged']} flagged")
+    for entry in report["entries"]:
+        marker = "!!" if entry.get("flags") else "ok"
+        print(f"[{marker}] {entry['shape']}")
+        print(
+            f"     stages={entry.get('stages')} indexes={entry.get('indexes')} "
+            f"examined={entry.get('docs_examined')} returned={entry.get('returned')} flags={entry.get('flags')}"
+        )
+        if entry.get("suggested_index"):
+            print(f"     suggested index: {entry['suggested_index']}")
+        if entry.get("error"):
+            print(f"     error: {entry['error']}")
+
+
+async def main(args):
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    if args.command == "seed":
+        await seed(db, args.users, args.businesses, args.documents)
+    elif args.command == "report":
+        report = await audit_report(db)
+        if args.json:
+            print(json.dumps(report, default=str, indent=2))
+        else:
+            _print_report(report)
+    elif args.command == "reset":
+        await db.query_audit.delete_many({})
+    client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    seed_parser = subcommands.add_parser("seed", help="fill the database with test data")
+    seed_parser.add_argument("--users", type=int, default=500)
+    seed_parser.add_argument("--businesses", type=int, default=4, help="businesses per user")
+    seed_parser.add_argument("--documents", type=int, default=5, help="documents per business")
+    report_parser = subcommands.add_parser("report", help="print the stored audit")
+    report_parser.add_argument("--json", action="store_true")
+    subcommands.add_parser("reset", help="forget audited shapes; they are explained again after a server restart")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,191 @@
+from pymongo import monitoring
+from fastapi.routing import APIRoute
+from starlette.datastructures import MutableHeaders
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional
+import asyncio
+import functools
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+SLOW_REQUEST_THRESHOLD_MS = float(os.environ.get("SLOW_REQUEST_THRESHOLD_MS", 500))
+SLOW_REQUEST_LOG_SIZE = int(os.environ.get("SLOW_REQUEST_LOG_SIZE", 200))
+MAX_COMMANDS_PER_REQUEST = 100
+
+_current: ContextVar[Optional["RequestTimer"]] = ContextVar("request_timer", default=None)
+slow_requests = deque(maxlen=SLOW_REQUEST_LOG_SIZE)
+
+
+class RequestTimer:
+    """
+    Phase durations and Mongo commands of one request.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.commands = []
+        self.dropped_commands = 0
+        self._pending = {}
+        self._endpoint_started = None
+        self._endpoint_finished = None
+
+    def add(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds * 1000
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self, total_ms: float) -> str:
+        metrics = [f"{name};dur={ms:.1f}" for name, ms in self.phases.items()]
+        metrics.append(f"total;dur={total_ms:.1f}")
+        return ", ".join(metrics)
+
+
+def start_timer() -> RequestTimer:
+    timer = RequestTimer()
+    _current.set(timer)
+    return timer
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Time a block (awaits included) into the current request's breakdown.
+    A no-op outside a request.
+    """
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - started)
+
+
+def record_slow_request(timer: RequestTimer, method: str, path: str, status_code: int, total_ms: float):
+    entry = {
+        "at": datetime.now(timezone.utc).isoformat(),
+        "method": method,
+        "path": path,
+        "status": status_code,
+        "total_ms": round(total_ms, 1),
+        "phases": {name: round(ms, 1) for name, ms in timer.phases.items()},
+        "commands": timer.commands,
+        "dropped_commands": timer.dropped_commands
+    }
+    slow_requests.append(entry)
+    logger.warning(f"Slow request: {method} {path} {status_code} {total_ms:.0f}ms phases={entry['phases']}")
+
+
+class ServerTimingMiddleware:
+    """
+    Emit the request's phase breakdown as a Server-Timing header and keep
+    slow requests in the slow-request log. Plain ASGI: the header is added
+    to the response start message and the body passes through untouched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timer = start_timer()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                total_ms = timer.elapsed_ms()
+                MutableHeaders(scope=message)["Server-Timing"] = timer.server_timing(total_ms)
+                if total_ms >= SLOW_REQUEST_THRESHOLD_MS:
+                    record_slow_request(timer, scope["method"], scope["path"], message["status"], total_ms)
+            await send(message)
+
+        await self.app(scope, receive, send_with_timing)
+
+
+class CommandTimingListener(monitoring.CommandListener):
+    """
+    Attributes every Mongo command to the request that issued it. Motor runs
+    pymongo in its executor with a copy of the caller's context, so the
+    request timer is visible from here.
+    """
+
+    def started(self, event):
+        timer = _current.get()
+        if timer is not None:
+            collection = event.command.get(event.command_name)
+            timer._pending[event.request_id] = collection if isinstance(collection, str) else None
+
+    def succeeded(self, event):
+        self._finish(event, True)
+
+    def failed(self, event):
+        self._finish(event, False)
+
+    def _finish(self, event, ok: bool):
+        timer = _current.get()
+        if timer is None:
+            return
+        collection = timer._pending.pop(event.request_id, None)
+        duration_ms = event.duration_micros / 1000
+        timer.add("mongo", duration_ms / 1000)
+        if len(timer.commands) >= MAX_COMMANDS_PER_REQUEST:
+            timer.dropped_commands += 1
+            return
+        timer.commands.append({
+            "command": event.command_name,
+            "collection": collection,
+            "duration_ms": round(duration_ms, 2),
+            "ok": ok
+        })
+
+
+class TimedRoute(APIRoute):
+    """
+    Splits the time FastAPI spends on a request into parsing (body and
+    dependencies), the endpoint itself and response serialization.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if asyncio.iscoroutinefunction(endpoint):
+            original = endpoint
+
+            @functools.wraps(original)
+            async def endpoint(*args, **kw):
+                timer = _current.get()
+                if timer is not None:
+                    timer._endpoint_started = time.perf_counter()
+                try:
+                    return await original(*args, **kw)
+                finally:
+                    if timer is not None:
+                        timer._endpoint_finished = time.perf_counter()
+
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            timer = _current.get()
+            started = time.perf_counter()
+            response = await handler(request)
+            if timer is not None and timer._endpoint_finished is not None:
+                finished = time.perf_counter()
+                timer.add("parse", timer._endpoint_started - started)
+                timer.add("endpoint", timer._endpoint_finished - timer._endpoint_started)
+                timer.add("serialize", finished - timer._endpoint_finished)
+            return response
+
+        return timed_handler
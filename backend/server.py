@@ -1,5 +1,6 @@
-from fastapi import FastAPI, APIRouter, Request, HTTPException, status, UploadFile, File
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, APIRouter, Request, HTTPException, status, UploadFile, File, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -11,8 +12,42 @@ from typing import List, Optional
 import uuid
 from datetime import datetime, timezone
 import shutil
-from auth import get_current_user, fetch_user_from_emergent, create_or_update_user, create_session
-from models import User, BusinessProfile, BusinessProfileCreate, BusinessProfileUpdate, BusinessDocument
+import asyncio
+import hashlib
+import json
+import re
+from auth import get_current_user, fetch_user_from_emergent, create_or_update_user, create_session, verify_service_key, session_activity, SESSION_TTL
+from auth import SESSION_TOKEN_MODE, issue_signed_token, is_signed_token, decode_signed_token, revoke_signed_token, revoked_tokens
+from auth import negative_sessions, provider_breaker, authenticate_session, load_user
+from auth import configure_session_store, get_session_store, delete_session, SessionCookieMiddleware
+from session_store import create_session_store
+from models import User, BusinessProfile, BusinessProfileCreate, BusinessProfileUpdate, BusinessDocument, UploadSessionCreate, BUSINESS_TYPES
+from upload_reconciler import run_reconciler, RECONCILE_INTERVAL_SECONDS
+from file_cleanup import enqueue_file_cleanup, business_file_names, document_file_names, run_file_cleanup_worker, DOCUMENT_EXTENSIONS
+from migrations import run_startup_migrations
+from document_archive import stream_archive
+from account_transfer import export_account, AccountImporter, ImportFormatError, iter_lines
+from chunked_upload import (
+    CHUNKED_UPLOAD_MAX_BYTES, DEFAULT_CHUNK_SIZE, MIN_CHUNK_SIZE, MAX_CHUNK_SIZE, UPLOAD_SESSION_TTL, CHUNK_WRITE_LEASE,
+    ChunkSizeError, part_path, create_part_file, chunk_bounds, write_chunk, no_writes_in_flight, hash_file,
+    upload_status, run_upload_gc
+)
+from document_search import extract_text, index_document, unindex_document, drop_business_index, get_business_index, evict_business_index, apply_document_text, clear_business_indexes
+from agent_context import get_agent_context, refresh_agent_context, drop_agent_context, evict_agent_context, clear_agent_contexts
+from phone_routing import normalize_phone, phone_routes
+from service_suggestions import service_suggestions
+from cache_bus import bus
+from single_flight import SingleFlight
+from idempotency import idempotency, request_fingerprint, hash_upload
+from query_audit import QUERY_AUDIT_ENABLED, QueryAuditListener, run_query_audit, audit_report
+from memory_profiling import memory_profiler, MemorySamplingMiddleware, MEMORY_PROFILING, MEMORY_MAX_DURATION_SECONDS
+from storage_quota import (
+    QuotaExceededError, reserve_storage, release_storage, release_business_storage, get_storage_usage,
+    run_storage_repair, STORAGE_REPAIR_INTERVAL_SECONDS, USER_STORAGE_QUOTA_BYTES
+)
+from request_timing import CommandTimingListener, TimedRoute, ServerTimingMiddleware, phase, slow_requests, SLOW_REQUEST_THRESHOLD_MS
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
 
 
 ROOT_DIR = Path(__file__).parent
@@ -20,18 +55,27 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# The listener attributes Mongo commands to requests for Server-Timing
+mongo_listeners = [CommandTimingListener()]
+if QUERY_AUDIT_ENABLED:
+    mongo_listeners.append(QueryAuditListener())
+client = AsyncIOMotorClient(mongo_url, event_listeners=mongo_listeners)
 db = client[os.environ['DB_NAME']]
 
+# Opaque sessions live in the backend chosen by SESSION_STORE (mongo, redis or memory)
+configure_session_store(create_session_store(db))
+
 # Create uploads directory
 UPLOAD_DIR = ROOT_DIR / 'uploads'
 UPLOAD_DIR.mkdir(exist_ok=True)
+PARTIAL_UPLOAD_DIR = UPLOAD_DIR / 'partial'
+PARTIAL_UPLOAD_DIR.mkdir(exist_ok=True)
 
 # Create the main app without a prefix
 app = FastAPI()
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=TimedRoute)
 
 
 # Define Models
@@ -76,6 +120,26 @@ async def get_status_checks():
 
 # ==================== Authentication Routes ====================
 
+# Repeated posts of one X-Session-ID within this window reuse the first result
+login_flight = SingleFlight(memo_ttl=float(os.environ.get("LOGIN_MEMO_SECONDS", 10)))
+
+async def exchange_session_id(session_id: str):
+    """
+    Exchange an Emergent Auth session_id for a user and our session token.
+    """
+    # Fetch user data from Emergent Auth
+    emergent_user_data = await fetch_user_from_emergent(session_id)
+    
+    # Create or get existing user
+    user = await create_or_update_user(db, emergent_user_data)
+    
+    # Create session; in signed mode the token itself is the session
+    if SESSION_TOKEN_MODE == "signed":
+        return user, issue_signed_token(user)
+    
+    session = await create_session(db, user.id, emergent_user_data["session_token"])
+    return user, session.session_token
+
 @api_router.post("/auth/session")
 async def create_auth_session(request: Request):
     """
@@ -89,14 +153,8 @@ async def create_auth_session(request: Request):
         )
     
     try:
-        # Fetch user data from Emergent Auth
-        emergent_user_data = await fetch_user_from_emergent(session_id)
-        
-        # Create or get existing user
-        user = await create_or_update_user(db, emergent_user_data)
-        
-        # Create session
-        session = await create_session(db, user.id, emergent_user_data["session_token"])
+        # Concurrent or repeated posts of the same session_id share one exchange
+        user, session_token = await login_flight.do(session_id, lambda: exchange_session_id(session_id))
         
         # Create response with user data
         response = JSONResponse(content={
@@ -109,11 +167,11 @@ async def create_auth_session(request: Request):
         # Set httpOnly cookie with session token
         response.set_cookie(
             key="session_token",
-            value=emergent_user_data["session_token"],
+            value=session_token,
             httponly=True,
             secure=True,
             samesite="none",
-            max_age=7 * 24 * 60 * 60,  # 7 days
+            max_age=int(SESSION_TTL.total_seconds()),
             path="/"
         )
         
@@ -161,11 +219,15 @@ async def logout(request: Request):
             detail="No active session"
         )
     
-    # Delete session from database
-    result = await db.user_sessions.delete_one({"session_token": session_token})
-    
-    if result.deleted_count == 0:
-        logger.warning("Session not found during logout")
+    if is_signed_token(session_token):
+        # Revoke the signed token for the rest of its lifetime
+        claims = decode_signed_token(session_token)
+        if claims:
+            await revoke_signed_token(db, claims)
+    else:
+        # Delete session from the session store
+        if not await delete_session(db, session_token):
+            logger.warning("Session not found during logout")
     
     # Create response and clear cookie
     response = JSONResponse(content={"message": "Logged out successfully"})
@@ -181,24 +243,34 @@ async def logout(request: Request):
 
 # ==================== Business Profile Routes ====================
 
-BUSINESS_TYPES = [
-    "Restaurant / Cafe",
-    "Retail Store",
-    "Medical / Dental Office",
-    "Legal Services",
-    "Salon / Spa",
-    "Fitness Center / Gym",
-    "Real Estate",
-    "Accounting / Financial Services",
-    "Consulting",
-    "Home Services (Plumbing, Electrical, etc.)",
-    "Other"
-]
+# Fields a client may select with ?fields=; the id is always returned
+BUSINESS_FIELDS = set(BusinessProfile.model_fields)
+
+def business_projection(fields: Optional[str]) -> dict:
+    """
+    Translate a comma-separated `fields` parameter into a Mongo projection.
+    Without it, every field except the legacy embedded documents is returned.
+    """
+    if not fields:
+        return {"documents": 0}
+    
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    invalid = [f for f in requested if f not in BUSINESS_FIELDS]
+    if invalid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid fields: {', '.join(invalid)}. Must be among: {', '.join(sorted(BUSINESS_FIELDS))}"
+        )
+    
+    projection = {"_id": 1}
+    projection.update({f: 1 for f in requested if f != "id"})
+    return projection
 
 @api_router.get("/businesses")
-async def get_user_businesses(request: Request):
+async def get_user_businesses(request: Request, fields: Optional[str] = None):
     """
     Get all businesses for current user.
+    Pass `fields` (comma-separated) to only read and return those fields.
     """
     user = await get_current_user(request, db)
     if not user:
@@ -207,7 +279,8 @@ async def get_user_businesses(request: Request):
             detail="Not authenticated"
         )
     
-    businesses = await db.business_profiles.find({"user_id": user.id}).to_list(100)
+    projection = business_projection(fields)
+    businesses = await db.business_profiles.find({"user_id": user.id}, projection).to_list(100)
     
     # Convert _id to id for each business (handle both ObjectId and string)
     for business in businesses:
@@ -219,9 +292,10 @@ async def get_user_businesses(request: Request):
     return {"businesses": businesses}
 
 @api_router.get("/business/{business_id}")
-async def get_business(request: Request, business_id: str):
+async def get_business(request: Request, business_id: str, fields: Optional[str] = None):
     """
     Get specific business by ID.
+    Pass `fields` (comma-separated) to only read and return those fields.
     """
     user = await get_current_user(request, db)
     if not user:
@@ -238,7 +312,9 @@ async def get_business(request: Request, business_id: str):
     except:
         pass
     
-    business = await db.business_profiles.find_one({"_id": query_id, "user_id": user.id})
+    projection = business_projection(fields)
+    with phase("business-query"):
+        business = await db.business_profiles.find_one({"_id": query_id, "user_id": user.id}, projection)
     if not business:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -255,6 +331,73 @@ async def get_business_types():
     """
     return {"business_types": BUSINESS_TYPES}
 
+@api_router.get("/profile/service-suggestions")
+async def get_service_suggestions(business_type: str = Query(..., alias="type"), prefix: str = "", limit: int = 10):
+    """
+    Type-ahead suggestions of service names used by other businesses of
+    the same type, most common first. Answered from memory.
+    """
+    if business_type not in BUSINESS_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid business_type. Must be one of: {', '.join(BUSINESS_TYPES)}"
+        )
+    
+    return {"suggestions": service_suggestions.suggest(business_type, prefix, limit)}
+
+@api_router.get("/bootstrap")
+async def get_bootstrap(request: Request):
+    """
+    Everything the dashboard needs on load in one response: the current
+    user, a summary of their businesses and the business types.
+    Supports If-None-Match, so an unchanged reload costs a 304.
+    """
+    user_id, user = await authenticate_session(request, db)
+    if not user_id:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated"
+        )
+    
+    # Session is validated once; user and businesses load concurrently
+    businesses_query = db.business_profiles.find(
+        {"user_id": user_id},
+        {
+            "business_name": 1, "business_type": 1, "business_phone": 1, "custom_services": 1,
+            "logo_url": 1, "document_count": 1, "created_at": 1, "updated_at": 1
+        }
+    ).to_list(100)
+    if user:
+        businesses = await businesses_query
+    else:
+        user, businesses = await asyncio.gather(load_user(db, user_id), businesses_query)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated"
+        )
+    
+    for business in businesses:
+        business["id"] = str(business.pop("_id"))
+    
+    body = json.dumps(jsonable_encoder({
+        "user": {
+            "id": user.id,
+            "email": user.email,
+            "name": user.name,
+            "picture": user.picture,
+            "created_at": user.created_at.isoformat() if user.created_at else None
+        },
+        "businesses": businesses,
+        "business_types": BUSINESS_TYPES
+    }), separators=(",", ":")).encode("utf-8")
+    
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @api_router.post("/business")
 async def create_business(request: Request, profile_data: BusinessProfileCreate):
     """
@@ -267,6 +410,14 @@ async def create_business(request: Request, profile_data: BusinessProfileCreate)
             detail="Not authenticated"
         )
     
+    key = request.headers.get("Idempotency-Key")
+    fingerprint = request_fingerprint(request.method, request.url.path, profile_data.json()) if key else None
+    return await idempotency.run(
+        db, user.id, "create-business", key, fingerprint,
+        lambda: _create_business(user, profile_data)
+    )
+
+async def _create_business(user: User, profile_data: BusinessProfileCreate):
     # Validate business type
     if profile_data.business_type not in BUSINESS_TYPES:
         raise HTTPException(
@@ -274,9 +425,14 @@ async def create_business(request: Request, profile_data: BusinessProfileCreate)
             detail=f"Invalid business_type. Must be one of: {', '.join(BUSINESS_TYPES)}"
         )
     
+    # Normalize phone for inbound call routing; a number that is not valid
+    # in the numbering plan is kept as entered but not routed
+    phone_e164 = normalize_phone(profile_data.business_phone)
+    
     # Create business
     business = BusinessProfile(
         user_id=user.id,
+        business_phone_e164=phone_e164,
         **profile_data.dict()
     )
     
@@ -287,7 +443,16 @@ async def create_business(request: Request, profile_data: BusinessProfileCreate)
     if business_id:
         business_dict["_id"] = str(business_id)
     
-    await db.business_profiles.insert_one(business_dict)
+    try:
+        await db.business_profiles.insert_one(business_dict)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Phone number is already used by another business"
+        )
+    phone_routes.set(business_dict["_id"], phone_e164)
+    service_suggestions.set_business(business_dict["_id"], business.business_type, business.custom_services)
+    await refresh_agent_context(db, business_dict["_id"])
     
     logger.info(f"Business created for user: {user.email}, business: {business.business_name}, id: {business_id}")
     
@@ -320,11 +485,11 @@ async def update_business(request: Request, business_id: str, profile_data: Busi
         pass
     
     # Check if business exists and belongs to user
-    existing_business = await db.business_profiles.find_one({"_id": query_id, "user_id": user.id})
+    existing_business = await db.business_profiles.find_one({"_id": query_id, "user_id": user.id}, {"_id": 1})
     
     if not existing_business:
         # Log for debugging
-        all_user_businesses = await db.business_profiles.find({"user_id": user.id}).to_list(100)
+        all_user_businesses = await db.business_profiles.find({"user_id": user.id}, {"_id": 1}).to_list(100)
         logger.error(f"Business {business_id} not found. User has {len(all_user_businesses)} businesses")
         for b in all_user_businesses:
             logger.error(f"  Business _id: {b.get('_id')}, type: {type(b.get('_id'))}")
@@ -341,22 +506,36 @@ async def update_business(request: Request, business_id: str, profile_data: Busi
             detail=f"Invalid business_type. Must be one of: {', '.join(BUSINESS_TYPES)}"
         )
     
+    # Normalize phone for inbound call routing; a number that is not valid
+    # in the numbering plan is kept as entered but not routed
+    phone_e164 = normalize_phone(profile_data.business_phone)
+    
     # Update business
     update_data = profile_data.dict()
+    update_data["business_phone_e164"] = phone_e164
     update_data["updated_at"] = datetime.now(timezone.utc)
     
     logger.info(f"Update data: {update_data}")
     logger.info(f"Custom services in update: {update_data.get('custom_services')}")
     
-    result = await db.business_profiles.update_one(
-        {"_id": query_id, "user_id": user.id},
-        {"$set": update_data}
-    )
+    try:
+        result = await db.business_profiles.update_one(
+            {"_id": query_id, "user_id": user.id},
+            {"$set": update_data}
+        )
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Phone number is already used by another business"
+        )
     
     logger.info(f"Business updated: matched={result.matched_count}, modified={result.modified_count}")
+    phone_routes.set(str(existing_business["_id"]), phone_e164)
+    service_suggestions.set_business(str(existing_business["_id"]), profile_data.business_type, profile_data.custom_services)
+    await refresh_agent_context(db, query_id)
     
     # Get and return updated business
-    updated_business = await db.business_profiles.find_one({"_id": query_id})
+    updated_business = await db.business_profiles.find_one({"_id": query_id}, {"documents": 0})
     updated_business["id"] = str(updated_business.pop("_id"))
     return updated_business
 
@@ -382,8 +561,11 @@ async def delete_business(request: Request, business_id: str):
     except:
         pass
     
-    # Find business
-    business = await db.business_profiles.find_one({"_id": query_id, "user_id": user.id})
+    # Remove the record first; files are cleaned up by a background job
+    business = await db.business_profiles.find_one_and_delete(
+        {"_id": query_id, "user_id": user.id},
+        projection={"documents.id": 1, "documents.filename": 1, "logo_url": 1}
+    )
     if not business:
         logger.error(f"Business {business_id} not found for deletion")
         raise HTTPException(
@@ -391,27 +573,20 @@ async def delete_business(request: Request, business_id: str):
             detail=f"Business not found: {business_id}"
         )
     
-    # Delete all documents
+    # Embedded documents remain on businesses not yet migrated
     documents = business.get("documents", [])
-    for doc in documents:
-        doc_id = doc["id"]
-        for ext in ['.pdf', '.doc', '.docx']:
-            file_path = UPLOAD_DIR / f"{doc_id}{ext}"
-            if file_path.exists():
-                file_path.unlink()
-                break
-    
-    # Delete logo if exists
-    if business.get("logo_url"):
-        logo_id = business["logo_url"].split("/")[-1]
-        for ext in ['.png', '.jpg', '.jpeg']:
-            logo_path = UPLOAD_DIR / f"{logo_id}{ext}"
-            if logo_path.exists():
-                logo_path.unlink()
-                break
-    
-    # Delete business from database
-    await db.business_profiles.delete_one({"_id": query_id, "user_id": user.id})
+    documents += await db.business_documents.find(
+        {"business_id": str(business["_id"])},
+        {"_id": 0, "id": 1, "filename": 1}
+    ).to_list(None)
+    await db.business_documents.delete_many({"business_id": str(business["_id"])})
+    
+    await enqueue_file_cleanup(db, business_id, business_file_names(business, documents))
+    await release_business_storage(db, user.id, str(business["_id"]))
+    await drop_business_index(db, business_id)
+    await drop_agent_context(db, business_id)
+    phone_routes.remove(str(business["_id"]))
+    service_suggestions.remove_business(str(business["_id"]))
     
     logger.info(f"Business deleted for user: {user.email}, business_id: {business_id}")
     return {"message": "Business deleted successfully"}
@@ -428,6 +603,14 @@ async def upload_logo(request: Request, business_id: str, file: UploadFile = Fil
             detail="Not authenticated"
         )
     
+    key = request.headers.get("Idempotency-Key")
+    fingerprint = request_fingerprint(request.method, request.url.path, file.filename or "", await hash_upload(file)) if key else None
+    return await idempotency.run(
+        db, user.id, f"upload-logo:{business_id}", key, fingerprint,
+        lambda: _upload_logo(user, business_id, file)
+    )
+
+async def _upload_logo(user: User, business_id: str, file: UploadFile):
     # Validate file type
     allowed_extensions = ['.png', '.jpg', '.jpeg']
     file_ext = Path(file.filename).suffix.lower()
@@ -445,15 +628,6 @@ async def upload_logo(request: Request, business_id: str, file: UploadFile = Fil
             detail="File size must be less than 2MB"
         )
     
-    # Generate unique filename
-    logo_id = str(uuid.uuid4())
-    safe_filename = f"{logo_id}{file_ext}"
-    file_path = UPLOAD_DIR / safe_filename
-    
-    # Save file
-    with open(file_path, 'wb') as f:
-        f.write(content)
-    
     # Handle both string IDs and ObjectIds
     from bson import ObjectId
     query_id = business_id
@@ -462,13 +636,57 @@ async def upload_logo(request: Request, business_id: str, file: UploadFile = Fil
     except:
         pass
     
+    # Check ownership before anything is counted or written
+    business = await db.business_profiles.find_one({"_id": query_id, "user_id": user.id}, {"_id": 1})
+    if not business:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Business not found"
+        )
+    
+    try:
+        await reserve_storage(db, user.id, str(query_id), len(content))
+    except QuotaExceededError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    
+    # Generate unique filename
+    logo_id = str(uuid.uuid4())
+    safe_filename = f"{logo_id}{file_ext}"
+    file_path = UPLOAD_DIR / safe_filename
     logo_url = f"/api/business/{business_id}/logo/{logo_id}"
     
-    # Update business with logo URL
-    await db.business_profiles.update_one(
-        {"_id": query_id, "user_id": user.id},
-        {"$set": {"logo_url": logo_url, "updated_at": datetime.now(timezone.utc)}}
-    )
+    try:
+        # Save file
+        with open(file_path, 'wb') as f:
+            f.write(content)
+        
+        # Update business with logo URL; the size is kept for storage accounting
+        previous = await db.business_profiles.find_one_and_update(
+            {"_id": query_id, "user_id": user.id},
+            {"$set": {"logo_url": logo_url, "logo_id": logo_id, "logo_size": len(content), "updated_at": datetime.now(timezone.utc)}},
+            projection={"logo_url": 1, "logo_size": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+    except BaseException:
+        file_path.unlink(missing_ok=True)
+        await release_storage(db, user.id, str(query_id), len(content))
+        raise
+    
+    if not previous:
+        await release_storage(db, user.id, str(query_id), len(content))
+        file_path.unlink(missing_ok=True)
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Business not found"
+        )
+    
+    # The replaced logo no longer counts and its file goes away
+    if previous.get("logo_url"):
+        await release_storage(db, user.id, str(query_id), previous.get("logo_size") or 0)
+        await enqueue_file_cleanup(db, business_id, business_file_names({"logo_url": previous["logo_url"]}, []))
     
     logger.info(f"Logo uploaded for business: {business_id}")
     return {"logo_url": logo_url}
@@ -494,6 +712,45 @@ async def get_logo(business_id: str, logo_id: str):
     
     return FileResponse(path=file_path, media_type="image/jpeg")
 
+async def register_document(query_id, business_id: str, user_id: str, doc_id: str, filename: str, size: int, source, file_ext: str) -> BusinessDocument:
+    """
+    Record a stored document file on its business and index its text.
+    `source` is the file content or the path of the stored file.
+    """
+    # Extract text off the event loop and add it to the search index
+    text = await asyncio.to_thread(extract_text, source, file_ext)
+    await index_document(db, str(query_id), doc_id, filename, text)
+    
+    # Create document record last, so a failure before it leaves no record
+    # behind that the caller's storage release would not match
+    document = BusinessDocument(
+        id=doc_id,
+        filename=filename,
+        size=size,
+        url=f"/api/business/{business_id}/document/{doc_id}"
+    )
+    
+    inserted = False
+    try:
+        await db.business_documents.insert_one({
+            **document.dict(),
+            "business_id": str(query_id),
+            "user_id": user_id
+        })
+        inserted = True
+        await db.business_profiles.update_one(
+            {"_id": query_id, "user_id": user_id},
+            {"$inc": {"document_count": 1}, "$set": {"updated_at": datetime.now(timezone.utc)}}
+        )
+    except BaseException:
+        if inserted:
+            await db.business_documents.delete_one({"business_id": str(query_id), "id": doc_id})
+        await unindex_document(db, str(query_id), doc_id)
+        raise
+    
+    await refresh_agent_context(db, query_id)
+    return document
+
 @api_router.post("/business/{business_id}/upload-document")
 async def upload_document(request: Request, business_id: str, file: UploadFile = File(...)):
     """
@@ -506,13 +763,20 @@ async def upload_document(request: Request, business_id: str, file: UploadFile =
             detail="Not authenticated"
         )
     
+    key = request.headers.get("Idempotency-Key")
+    fingerprint = request_fingerprint(request.method, request.url.path, file.filename or "", await hash_upload(file)) if key else None
+    return await idempotency.run(
+        db, user.id, f"upload-document:{business_id}", key, fingerprint,
+        lambda: _upload_document(user, business_id, file)
+    )
+
+async def _upload_document(user: User, business_id: str, file: UploadFile):
     # Validate file type
-    allowed_extensions = ['.pdf', '.doc', '.docx']
     file_ext = Path(file.filename).suffix.lower()
-    if file_ext not in allowed_extensions:
+    if file_ext not in DOCUMENT_EXTENSIONS:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Invalid file type. Allowed: {', '.join(allowed_extensions)}"
+            detail=f"Invalid file type. Allowed: {', '.join(DOCUMENT_EXTENSIONS)}"
         )
     
     # Validate file size (5MB max)
@@ -523,23 +787,6 @@ async def upload_document(request: Request, business_id: str, file: UploadFile =
             detail="File size must be less than 5MB"
         )
     
-    # Generate unique filename
-    doc_id = str(uuid.uuid4())
-    safe_filename = f"{doc_id}{file_ext}"
-    file_path = UPLOAD_DIR / safe_filename
-    
-    # Save file
-    with open(file_path, 'wb') as f:
-        f.write(content)
-    
-    # Create document record
-    document = BusinessDocument(
-        id=doc_id,
-        filename=file.filename,
-        size=len(content),
-        url=f"/api/business/{business_id}/document/{doc_id}"
-    )
-    
     # Handle both string IDs and ObjectIds
     from bson import ObjectId
     query_id = business_id
@@ -548,23 +795,59 @@ async def upload_document(request: Request, business_id: str, file: UploadFile =
     except:
         pass
     
-    # Update business with document
-    business = await db.business_profiles.find_one({"_id": query_id, "user_id": user.id})
-    if business:
-        documents = business.get("documents", [])
-        documents.append(document.dict())
-        await db.business_profiles.update_one(
-            {"_id": query_id, "user_id": user.id},
-            {"$set": {"documents": documents, "updated_at": datetime.now(timezone.utc)}}
+    # Check ownership before anything is written
+    business = await db.business_profiles.find_one({"_id": query_id, "user_id": user.id}, {"_id": 1})
+    if not business:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Business not found"
+        )
+    
+    try:
+        await reserve_storage(db, user.id, str(query_id), len(content))
+    except QuotaExceededError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
         )
     
+    # Generate unique filename
+    doc_id = str(uuid.uuid4())
+    safe_filename = f"{doc_id}{file_ext}"
+    file_path = UPLOAD_DIR / safe_filename
+    
+    try:
+        # Save file
+        with open(file_path, 'wb') as f:
+            f.write(content)
+        
+        document = await register_document(query_id, business_id, user.id, doc_id, file.filename, len(content), content, file_ext)
+    except BaseException:
+        # No record points at the file; it would only be found by the reconciler
+        file_path.unlink(missing_ok=True)
+        await release_storage(db, user.id, str(query_id), len(content))
+        raise
+    
     logger.info(f"Document uploaded for business: {business_id}, file: {file.filename}")
     return document.dict()
 
-@api_router.get("/business/{business_id}/document/{doc_id}")
-async def get_document(request: Request, business_id: str, doc_id: str):
+# ==================== Resumable Upload Routes ====================
+
+async def get_upload_session(user_id: str, business_id: str, upload_id: str) -> dict:
+    upload = await db.upload_sessions.find_one({"_id": upload_id, "business_id": business_id, "user_id": user_id})
+    if not upload:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload not found"
+        )
+    return upload
+
+@api_router.post("/business/{business_id}/uploads")
+async def create_upload(request: Request, business_id: str, upload_data: UploadSessionCreate):
     """
-    Download a business document
+    Start a resumable document upload. Chunks are then sent with
+    PUT .../uploads/{upload_id}/chunks/{index} and the upload is finalized
+    with POST .../uploads/{upload_id}/complete.
     """
     user = await get_current_user(request, db)
     if not user:
@@ -573,6 +856,27 @@ async def get_document(request: Request, business_id: str, doc_id: str):
             detail="Not authenticated"
         )
     
+    # Validate file type
+    file_ext = Path(upload_data.filename).suffix.lower()
+    if file_ext not in DOCUMENT_EXTENSIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid file type. Allowed: {', '.join(DOCUMENT_EXTENSIONS)}"
+        )
+    
+    if upload_data.size > CHUNKED_UPLOAD_MAX_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"File size must be less than {CHUNKED_UPLOAD_MAX_BYTES // (1024 * 1024)}MB"
+        )
+    
+    chunk_size = upload_data.chunk_size or DEFAULT_CHUNK_SIZE
+    if not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"chunk_size must be between {MIN_CHUNK_SIZE} and {MAX_CHUNK_SIZE} bytes"
+        )
+    
     # Handle both string IDs and ObjectIds
     from bson import ObjectId
     query_id = business_id
@@ -581,47 +885,144 @@ async def get_document(request: Request, business_id: str, doc_id: str):
     except:
         pass
     
-    # Find document in business
-    business = await db.business_profiles.find_one({"_id": query_id, "user_id": user.id})
+    business = await db.business_profiles.find_one({"_id": query_id, "user_id": user.id}, {"_id": 1})
     if not business:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Business not found"
         )
     
-    documents = business.get("documents", [])
-    document = next((d for d in documents if d["id"] == doc_id), None)
+    # Fail early; storage is reserved when the upload completes
+    usage = await get_storage_usage(db, user.id, include_businesses=False)
+    if usage["bytes"] + upload_data.size > USER_STORAGE_QUOTA_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Storage quota exceeded"
+        )
     
-    if not document:
+    upload_id = str(uuid.uuid4())
+    await asyncio.to_thread(create_part_file, part_path(PARTIAL_UPLOAD_DIR, upload_id), upload_data.size)
+    
+    now = datetime.now(timezone.utc)
+    upload = {
+        "_id": upload_id,
+        "business_id": business_id,
+        "user_id": user.id,
+        "filename": upload_data.filename,
+        "file_ext": file_ext,
+        "size": upload_data.size,
+        "chunk_size": chunk_size,
+        "total_chunks": -(-upload_data.size // chunk_size),
+        "sha256": upload_data.sha256.lower() if upload_data.sha256 else None,
+        "received": [],
+        "writes": [],
+        "status": "open",
+        "created_at": now,
+        "expires_at": now + UPLOAD_SESSION_TTL
+    }
+    await db.upload_sessions.insert_one(upload)
+    
+    logger.info(f"Upload started for business: {business_id}, file: {upload_data.filename}, size: {upload_data.size}")
+    return upload_status(upload)
+
+@api_router.get("/business/{business_id}/uploads/{upload_id}")
+async def get_upload(request: Request, business_id: str, upload_id: str):
+    """
+    Report which chunks of an upload were received and the resume offset.
+    """
+    user = await get_current_user(request, db)
+    if not user:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Document not found"
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated"
         )
     
-    # Find file
-    file_path = None
-    for ext in ['.pdf', '.doc', '.docx']:
-        potential_path = UPLOAD_DIR / f"{doc_id}{ext}"
-        if potential_path.exists():
-            file_path = potential_path
-            break
+    upload = await get_upload_session(user.id, business_id, upload_id)
+    return upload_status(upload)
+
+@api_router.put("/business/{business_id}/uploads/{upload_id}/chunks/{index}")
+async def upload_chunk(request: Request, business_id: str, upload_id: str, index: int):
+    """
+    Store one chunk of an upload. Chunks may arrive in any order and in
+    parallel; re-sending a chunk overwrites it. Every write is registered on
+    the upload session while it runs, so completing waits for it.
+    """
+    user = await get_current_user(request, db)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated"
+        )
     
-    if not file_path:
+    upload = await get_upload_session(user.id, business_id, upload_id)
+    if upload["status"] != "open":
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Document file not found"
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Upload is being finalized"
         )
     
-    return FileResponse(
-        path=file_path,
-        filename=document["filename"],
-        media_type="application/octet-stream"
+    if not 0 <= index < upload["total_chunks"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Chunk index must be between 0 and {upload['total_chunks'] - 1}"
+        )
+    
+    offset, length = chunk_bounds(upload, index)
+    content_length = request.headers.get("Content-Length")
+    if content_length is not None and content_length != str(length):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Chunk {index} must be {length} bytes"
+        )
+    
+    # Register the write; refused once the upload is being completed
+    write_id = str(uuid.uuid4())
+    registered = await db.upload_sessions.update_one(
+        {"_id": upload_id, "status": "open"},
+        {"$push": {"writes": {"id": write_id, "until": datetime.now(timezone.utc) + CHUNK_WRITE_LEASE}}}
+    )
+    if registered.modified_count == 0:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Upload is being finalized"
+        )
+    
+    try:
+        await write_chunk(request, part_path(PARTIAL_UPLOAD_DIR, upload_id), offset, length)
+    except BaseException as e:
+        await db.upload_sessions.update_one({"_id": upload_id}, {"$pull": {"writes": {"id": write_id}}})
+        if isinstance(e, ChunkSizeError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        if isinstance(e, FileNotFoundError):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Upload not found"
+            )
+        raise
+    
+    upload = await db.upload_sessions.find_one_and_update(
+        {"_id": upload_id},
+        {
+            "$addToSet": {"received": index},
+            "$pull": {"writes": {"id": write_id}},
+            "$set": {"expires_at": datetime.now(timezone.utc) + UPLOAD_SESSION_TTL}
+        },
+        return_document=ReturnDocument.AFTER
     )
+    if not upload:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload not found"
+        )
+    return upload_status(upload)
 
-@api_router.delete("/business/{business_id}/document/{doc_id}")
-async def delete_document(request: Request, business_id: str, doc_id: str):
+@api_router.post("/business/{business_id}/uploads/{upload_id}/complete")
+async def complete_upload(request: Request, business_id: str, upload_id: str):
     """
-    Delete a business document
+    Verify an upload and register it as a business document.
     """
     user = await get_current_user(request, db)
     if not user:
@@ -630,6 +1031,8 @@ async def delete_document(request: Request, business_id: str, doc_id: str):
             detail="Not authenticated"
         )
     
+    upload = await get_upload_session(user.id, business_id, upload_id)
+    
     # Handle both string IDs and ObjectIds
     from bson import ObjectId
     query_id = business_id
@@ -638,43 +1041,590 @@ async def delete_document(request: Request, business_id: str, doc_id: str):
     except:
         pass
     
-    # Find and remove document from business
-    business = await db.business_profiles.find_one({"_id": query_id, "user_id": user.id})
+    business = await db.business_profiles.find_one({"_id": query_id, "user_id": user.id}, {"_id": 1})
     if not business:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Business not found"
         )
     
-    documents = business.get("documents", [])
-    document = next((d for d in documents if d["id"] == doc_id), None)
+    # Claim the upload so it is finalized exactly once, and only once no
+    # chunk is being written any more; chunk writes are refused from now on
+    now = datetime.now(timezone.utc)
+    upload = await db.upload_sessions.find_one_and_update(
+        {"_id": upload_id, "status": "open", **no_writes_in_flight(now)},
+        {"$set": {"status": "completing", "completing_until": now + CHUNK_WRITE_LEASE}},
+        return_document=ReturnDocument.AFTER
+    )
+    if not upload:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Upload is already being finalized or chunks are still being written"
+        )
     
-    if not document:
+    missing = upload_status(upload)["missing_chunks"]
+    if missing:
+        await db.upload_sessions.update_one({"_id": upload_id}, {"$set": {"status": "open"}})
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Document not found"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Missing chunks: {missing[:20]}"
         )
     
-    # Remove from database
-    documents = [d for d in documents if d["id"] != doc_id]
-    await db.business_profiles.update_one(
-        {"_id": query_id, "user_id": user.id},
-        {"$set": {"documents": documents, "updated_at": datetime.now(timezone.utc)}}
-    )
+    source_path = part_path(PARTIAL_UPLOAD_DIR, upload_id)
+    if upload["sha256"]:
+        digest = await asyncio.to_thread(hash_file, source_path)
+        if digest != upload["sha256"]:
+            # Some chunk is corrupt and we cannot tell which; start over
+            await db.upload_sessions.delete_one({"_id": upload_id})
+            await asyncio.to_thread(source_path.unlink, missing_ok=True)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Checksum mismatch, upload discarded"
+            )
     
-    # Delete file
-    for ext in ['.pdf', '.doc', '.docx']:
-        file_path = UPLOAD_DIR / f"{doc_id}{ext}"
-        if file_path.exists():
-            file_path.unlink()
-            break
+    try:
+        await reserve_storage(db, user.id, str(query_id), upload["size"])
+    except QuotaExceededError as e:
+        # Keep the chunks; the upload can complete once space is freed
+        await db.upload_sessions.update_one({"_id": upload_id}, {"$set": {"status": "open"}})
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
     
-    logger.info(f"Document deleted for business: {business_id}, doc_id: {doc_id}")
-    return {"message": "Document deleted successfully"}
-
-# Include the router in the main app
-app.include_router(api_router)
-
+    # The upload id becomes the document id
+    file_path = UPLOAD_DIR / f"{upload_id}{upload['file_ext']}"
+    moved = False
+    try:
+        await asyncio.to_thread(os.replace, source_path, file_path)
+        moved = True
+        # The part file keeps the mtime of its last chunk; the upload
+        # reconciler's grace period counts from completion
+        await asyncio.to_thread(os.utime, file_path)
+        document = await register_document(
+            query_id, business_id, user.id, upload_id, upload["filename"], upload["size"], file_path, upload["file_ext"]
+        )
+    except BaseException:
+        # Put the chunks back so the upload can be completed again
+        if moved:
+            await asyncio.to_thread(os.replace, file_path, source_path)
+        await release_storage(db, user.id, str(query_id), upload["size"])
+        await db.upload_sessions.update_one({"_id": upload_id}, {"$set": {"status": "open"}})
+        raise
+    await db.upload_sessions.delete_one({"_id": upload_id})
+    
+    logger.info(f"Document uploaded for business: {business_id}, file: {upload['filename']}, chunks: {upload['total_chunks']}")
+    return document.dict()
+
+@api_router.delete("/business/{business_id}/uploads/{upload_id}")
+async def abort_upload(request: Request, business_id: str, upload_id: str):
+    """
+    Abandon an upload and discard its chunks.
+    """
+    user = await get_current_user(request, db)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated"
+        )
+    
+    result = await db.upload_sessions.delete_one(
+        {"_id": upload_id, "business_id": business_id, "user_id": user.id, "status": "open"}
+    )
+    if result.deleted_count == 0:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload not found"
+        )
+    await asyncio.to_thread(part_path(PARTIAL_UPLOAD_DIR, upload_id).unlink, missing_ok=True)
+    return {"message": "Upload aborted"}
+
+@api_router.get("/business/{business_id}/documents/archive")
+async def get_documents_archive(request: Request, business_id: str):
+    """
+    Download every document of a business as one ZIP, streamed while it is built
+    """
+    user = await get_current_user(request, db)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated"
+        )
+    
+    # Handle both string IDs and ObjectIds
+    from bson import ObjectId
+    query_id = business_id
+    try:
+        query_id = ObjectId(business_id)
+    except:
+        pass
+    
+    business = await db.business_profiles.find_one({"_id": query_id, "user_id": user.id}, {"business_name": 1})
+    if not business:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Business not found"
+        )
+    
+    documents = await db.business_documents.find(
+        {"business_id": str(query_id), "user_id": user.id},
+        {"_id": 0, "id": 1, "filename": 1, "uploaded_at": 1}
+    ).sort("id", 1).to_list(None)
+    
+    archive_name = re.sub(r"[^A-Za-z0-9._-]+", "_", business["business_name"]).strip("_") or "documents"
+    return StreamingResponse(
+        stream_archive(UPLOAD_DIR, documents),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{archive_name}-documents.zip"'}
+    )
+
+@api_router.get("/business/{business_id}/document/{doc_id}")
+async def get_document(request: Request, business_id: str, doc_id: str):
+    """
+    Download a business document
+    """
+    user = await get_current_user(request, db)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated"
+        )
+    
+    # Handle both string IDs and ObjectIds
+    from bson import ObjectId
+    query_id = business_id
+    try:
+        query_id = ObjectId(business_id)
+    except:
+        pass
+    
+    # Documents carry their owner, so one indexed lookup checks both
+    document = await db.business_documents.find_one(
+        {"business_id": str(query_id), "id": doc_id, "user_id": user.id},
+        {"_id": 0, "filename": 1}
+    )
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+    
+    # Find file
+    file_path = None
+    with phase("files"):
+        for name in document_file_names({"id": doc_id, "filename": document["filename"]}):
+            potential_path = UPLOAD_DIR / name
+            if potential_path.exists():
+                file_path = potential_path
+                break
+    
+    if not file_path:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document file not found"
+        )
+    
+    return FileResponse(
+        path=file_path,
+        filename=document["filename"],
+        media_type="application/octet-stream"
+    )
+
+@api_router.delete("/business/{business_id}/document/{doc_id}")
+async def delete_document(request: Request, business_id: str, doc_id: str):
+    """
+    Delete a business document
+    """
+    user = await get_current_user(request, db)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated"
+        )
+    
+    # Handle both string IDs and ObjectIds
+    from bson import ObjectId
+    query_id = business_id
+    try:
+        query_id = ObjectId(business_id)
+    except:
+        pass
+    
+    # Remove from database
+    document = await db.business_documents.find_one_and_delete(
+        {"business_id": str(query_id), "id": doc_id, "user_id": user.id},
+        projection={"_id": 0, "filename": 1, "size": 1}
+    )
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+    
+    await db.business_profiles.update_one(
+        {"_id": query_id, "user_id": user.id},
+        {"$inc": {"document_count": -1}, "$set": {"updated_at": datetime.now(timezone.utc)}}
+    )
+    await release_storage(db, user.id, str(query_id), document.get("size", 0))
+    
+    await unindex_document(db, str(query_id), doc_id)
+    await refresh_agent_context(db, query_id)
+    
+    # Delete file
+    for name in document_file_names({"id": doc_id, "filename": document["filename"]}):
+        (UPLOAD_DIR / name).unlink(missing_ok=True)
+    
+    logger.info(f"Document deleted for business: {business_id}, doc_id: {doc_id}")
+    return {"message": "Document deleted successfully"}
+
+@api_router.get("/business/{business_id}/documents")
+async def list_documents(request: Request, business_id: str, limit: int = 50, after: Optional[str] = None):
+    """
+    List documents of a business, one page at a time.
+    Pass the returned next_cursor as `after` to get the following page.
+    """
+    user = await get_current_user(request, db)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated"
+        )
+    
+    # Handle both string IDs and ObjectIds
+    from bson import ObjectId
+    query_id = business_id
+    try:
+        query_id = ObjectId(business_id)
+    except:
+        pass
+    
+    business = await db.business_profiles.find_one({"_id": query_id, "user_id": user.id}, {"_id": 1})
+    if not business:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Business not found"
+        )
+    
+    limit = max(1, min(limit, 200))
+    query = {"business_id": str(business["_id"])}
+    if after:
+        query["id"] = {"$gt": after}
+    
+    documents = await db.business_documents.find(
+        query,
+        {"_id": 0, "business_id": 0, "user_id": 0}
+    ).sort("id", 1).limit(limit).to_list(limit)
+    
+    next_cursor = documents[-1]["id"] if len(documents) == limit else None
+    return {"documents": documents, "next_cursor": next_cursor}
+
+@api_router.get("/business/{business_id}/search")
+async def search_documents(request: Request, business_id: str, q: str, limit: int = 5):
+    """
+    Full-text search over the documents of a business. Returns ranked snippets.
+    """
+    user = await get_current_user(request, db)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated"
+        )
+    
+    # Handle both string IDs and ObjectIds
+    from bson import ObjectId
+    query_id = business_id
+    try:
+        query_id = ObjectId(business_id)
+    except:
+        pass
+    
+    business = await db.business_profiles.find_one({"_id": query_id, "user_id": user.id}, {"_id": 1})
+    if not business:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Business not found"
+        )
+    
+    index = await get_business_index(db, str(business["_id"]))
+    results = index.search(q, limit=max(1, min(limit, 20)))
+    return {"query": q, "results": results}
+
+# ==================== Account Transfer Routes ====================
+
+@api_router.get("/account/storage")
+async def get_account_storage(request: Request):
+    """
+    Storage used by the current user, in total and per business, and the quota.
+    """
+    user = await get_current_user(request, db)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated"
+        )
+    
+    return await get_storage_usage(db, user.id)
+
+@api_router.get("/account/export")
+async def export_account_data(request: Request):
+    """
+    Stream the user's record, business profiles and document metadata as NDJSON
+    """
+    user = await get_current_user(request, db)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated"
+        )
+    
+    logger.info(f"Account export started for user: {user.email}")
+    return StreamingResponse(
+        export_account(db, user.id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="account-{user.id}.ndjson"'}
+    )
+
+@api_router.post("/account/import")
+async def import_account_data(request: Request):
+    """
+    Apply an NDJSON account export to the current user's account. Records are
+    upserted, so re-running an import is safe.
+    """
+    user = await get_current_user(request, db)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated"
+        )
+    
+    importer = AccountImporter(db, user.id)
+    try:
+        async for line_number, line in iter_lines(request.stream()):
+            await importer.add_line(line_number, line)
+        report = await importer.finish()
+    except ImportFormatError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    logger.info(
+        f"Account import for user: {user.email}, businesses: {report['businesses']}, "
+        f"documents: {report['documents']}, conflicts: {report['conflicts']}, skipped: {report['skipped']}"
+    )
+    return report
+
+# ==================== Voice Agent Routes ====================
+
+@api_router.get("/agent/business/{business_id}/context")
+async def get_business_agent_context(request: Request, business_id: str):
+    """
+    Compact, precomputed business snapshot for the voice agent.
+    """
+    if not verify_service_key(request, "X-Agent-Key", "AGENT_API_KEY"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid agent key"
+        )
+    
+    # Handle both string IDs and ObjectIds
+    from bson import ObjectId
+    query_id = business_id
+    try:
+        query_id = ObjectId(business_id)
+    except:
+        pass
+    
+    context = await get_agent_context(db, business_id, query_id)
+    if not context:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Business not found"
+        )
+    
+    version, body = context
+    etag = f'"{int(version.timestamp() * 1000000)}"'
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+@api_router.get("/agent/route")
+async def route_inbound_call(request: Request, number: str):
+    """
+    Resolve a dialed number to the business that owns it.
+    """
+    if not verify_service_key(request, "X-Agent-Key", "AGENT_API_KEY"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid agent key"
+        )
+    
+    phone_routes.ensure_fresh(db)
+    phone_e164 = normalize_phone(number)
+    business_id = phone_routes.lookup(phone_e164) if phone_e164 else None
+    if not business_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No business for this number"
+        )
+    
+    return {"business_id": business_id, "number": phone_e164}
+
+# ==================== Admin Routes ====================
+
+@api_router.get("/admin/metrics")
+async def get_admin_metrics(request: Request):
+    """
+    Internal cache and resilience metrics.
+    """
+    if not verify_service_key(request, "X-Admin-Key", "ADMIN_API_KEY"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid admin key"
+        )
+    
+    return {
+        "negative_session_cache": negative_sessions.stats(),
+        "login_single_flight": login_flight.stats(),
+        "auth_provider_breaker": provider_breaker.stats(),
+        "idempotency": idempotency.stats()
+    }
+
+@api_router.get("/admin/query-audit")
+async def get_query_audit(request: Request):
+    """
+    Query plans of every query shape seen while QUERY_AUDIT is enabled,
+    with collection scans, in-memory sorts and high examined/returned
+    ratios flagged.
+    """
+    if not verify_service_key(request, "X-Admin-Key", "ADMIN_API_KEY"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid admin key"
+        )
+    
+    return await audit_report(db)
+
+@api_router.get("/admin/memory")
+async def get_memory_profile(request: Request):
+    """
+    Memory profiling status and peak traced allocation per route.
+    """
+    if not verify_service_key(request, "X-Admin-Key", "ADMIN_API_KEY"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid admin key"
+        )
+    
+    return memory_profiler.stats()
+
+@api_router.post("/admin/memory/start")
+async def start_memory_profile(request: Request, duration_seconds: int = 300, sample_rate: Optional[float] = None):
+    """
+    Start tracemalloc tracing for a limited time.
+    """
+    if not verify_service_key(request, "X-Admin-Key", "ADMIN_API_KEY"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid admin key"
+        )
+    
+    if not 0 < duration_seconds <= MEMORY_MAX_DURATION_SECONDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"duration_seconds must be between 1 and {MEMORY_MAX_DURATION_SECONDS}"
+        )
+    if sample_rate is not None and not 0 <= sample_rate <= 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="sample_rate must be between 0 and 1"
+        )
+    
+    memory_profiler.start(duration_seconds, sample_rate)
+    return memory_profiler.stats()
+
+@api_router.post("/admin/memory/stop")
+async def stop_memory_profile(request: Request):
+    """
+    Stop tracing and drop stored snapshots.
+    """
+    if not verify_service_key(request, "X-Admin-Key", "ADMIN_API_KEY"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid admin key"
+        )
+    
+    report = memory_profiler.stats()
+    memory_profiler.stop()
+    return report
+
+@api_router.post("/admin/memory/snapshots")
+async def take_memory_snapshot(request: Request):
+    """
+    Take an allocation snapshot to diff against later ones.
+    """
+    if not verify_service_key(request, "X-Admin-Key", "ADMIN_API_KEY"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid admin key"
+        )
+    
+    try:
+        return await memory_profiler.take_snapshot()
+    except RuntimeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+
+@api_router.get("/admin/memory/diff")
+async def diff_memory_snapshots(request: Request, base: int, target: Optional[int] = None, limit: int = 20, group_by: str = "lineno"):
+    """
+    Top allocation sites by growth between two snapshots (target defaults
+    to the latest one).
+    """
+    if not verify_service_key(request, "X-Admin-Key", "ADMIN_API_KEY"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid admin key"
+        )
+    
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="group_by must be one of: lineno, filename, traceback"
+        )
+    
+    try:
+        return await memory_profiler.diff(base, target, min(max(limit, 1), 200), group_by)
+    except KeyError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Snapshot not found"
+        )
+
+@api_router.get("/admin/slow-requests")
+async def get_slow_requests(request: Request):
+    """
+    Most recent requests slower than SLOW_REQUEST_THRESHOLD_MS, newest first,
+    with their phase breakdown and Mongo commands.
+    """
+    if not verify_service_key(request, "X-Admin-Key", "ADMIN_API_KEY"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid admin key"
+        )
+    
+    return {"threshold_ms": SLOW_REQUEST_THRESHOLD_MS, "requests": list(reversed(slow_requests))}
+
+# Include the router in the main app
+app.include_router(api_router)
+
+# Plain ASGI middleware, innermost first; none of them wraps the response body
+app.add_middleware(SessionCookieMiddleware)
+app.add_middleware(ServerTimingMiddleware)
+app.add_middleware(MemorySamplingMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -690,6 +1640,82 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+background_tasks = []
+
+@app.on_event("startup")
+async def start_background_tasks():
+    await db.document_texts.create_index("business_id")
+    await db.business_documents.create_index([("business_id", 1), ("id", 1)], unique=True)
+    # Upload reconciler looks files up by document and logo id
+    await db.business_documents.create_index("id")
+    await db.business_profiles.create_index("logo_id", sparse=True)
+    background_tasks.append(asyncio.create_task(run_startup_migrations(db, UPLOAD_DIR)))
+    
+    # Garbage-collect abandoned resumable uploads
+    await db.upload_sessions.create_index("expires_at")
+    await db.idempotency_keys.create_index("expires_at", expireAfterSeconds=0)
+    await db.business_profiles.create_index("user_id")
+    await db.storage_usage.create_index("user_id", sparse=True)
+    background_tasks.append(asyncio.create_task(run_upload_gc(db, PARTIAL_UPLOAD_DIR)))
+    
+    if MEMORY_PROFILING:
+        memory_profiler.start()
+    
+    if QUERY_AUDIT_ENABLED:
+        logger.warning("Query audit enabled; every new query shape is explained")
+        background_tasks.append(asyncio.create_task(run_query_audit(client)))
+    await db.business_profiles.create_index(
+        "business_phone_e164",
+        unique=True,
+        partialFilterExpression={"business_phone_e164": {"$type": "string"}}
+    )
+    await phone_routes.load(db)
+    await service_suggestions.rebuild(db)
+    await db.revoked_tokens.create_index("expires_at", expireAfterSeconds=0)
+    try:
+        await db.users.create_index("email", unique=True)
+    except OperationFailure as e:
+        # Duplicates left by the old find-then-insert login must be merged first
+        logger.error(f"Unique email index not created, duplicate users exist: {e}")
+    await get_session_store(db).setup()
+    await revoked_tokens.load(db)
+    
+    # Keep in-process caches coherent with writes handled by other workers
+    bus.subscribe("business_profiles", evict_agent_context)
+    bus.subscribe("business_profiles", evict_business_index)
+    bus.subscribe("agent_contexts", evict_agent_context)
+    bus.subscribe("document_texts", lambda change: apply_document_text(db, change))
+    bus.subscribe("business_profiles", phone_routes.apply_change)
+    bus.subscribe("business_profiles", service_suggestions.apply_change)
+    bus.subscribe("revoked_tokens", revoked_tokens.apply_change)
+    bus.subscribe("user_sessions", negative_sessions.apply_change)
+    bus.on_reset(clear_agent_contexts)
+    bus.on_reset(clear_business_indexes)
+    bus.on_reset(lambda: phone_routes.load(db))
+    bus.on_reset(lambda: service_suggestions.rebuild(db))
+    bus.on_reset(lambda: revoked_tokens.load(db))
+    bus.on_reset(negative_sessions.clear)
+    background_tasks.append(asyncio.create_task(bus.run(db)))
+    
+    # Flush sliding session expiry extensions in bulk
+    background_tasks.append(asyncio.create_task(session_activity.run(db)))
+    
+    # Drain file cleanup jobs left by delete_business
+    await db.file_cleanup_jobs.create_index([("status", 1), ("next_attempt_at", 1)])
+    background_tasks.append(asyncio.create_task(run_file_cleanup_worker(db, UPLOAD_DIR)))
+    
+    # Sweep files in UPLOAD_DIR that no business references any more
+    if RECONCILE_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(run_reconciler(db, UPLOAD_DIR)))
+    
+    # Recompute storage counters to correct drift
+    if STORAGE_REPAIR_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(run_storage_repair(db, UPLOAD_DIR)))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in background_tasks:
+        task.cancel()
+    await session_activity.flush(db)
+    await get_session_store(db).close()
     client.close()
\ No newline at end of file
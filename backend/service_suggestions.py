@@ -0,0 +1,178 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from bisect import bisect_left, insort
+from typing import Iterable
+import heapq
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A name is only suggested once this many businesses use it, so a custom
+# service of a single business is never shown to others
+SUGGESTION_MIN_BUSINESSES = int(os.environ.get("SERVICE_SUGGESTION_MIN_BUSINESSES", 2))
+SUGGESTION_MAX_LIMIT = 20
+SUGGESTION_CACHE_SIZE = 2048
+REBUILD_BATCH_SIZE = 1000
+PREFIX_RANGE_END = "\U0010ffff"
+
+
+def normalize_service(name: str) -> str:
+    return " ".join(name.split()).casefold()
+
+
+class _TypeIndex:
+    """
+    Service names of one business type: a sorted array of normalized names
+    for prefix ranges, their usage counts and a display form.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.counts = {}
+        self.display = {}
+        self.cache = {}
+
+    def add(self, key: str, name: str):
+        count = self.counts.get(key, 0)
+        if count == 0:
+            insort(self.names, key)
+            self.display[key] = name
+        self.counts[key] = count + 1
+        self._invalidate(key)
+
+    def remove(self, key: str):
+        count = self.counts.get(key, 0)
+        if count <= 1:
+            self.counts.pop(key, None)
+            self.display.pop(key, None)
+            index = bisect_left(self.names, key)
+            if index < len(self.names) and self.names[index] == key:
+                del self.names[index]
+        else:
+            self.counts[key] = count - 1
+        self._invalidate(key)
+
+    def _invalidate(self, key: str):
+        # Only cached prefixes of the changed name can have a different answer
+        for cached in [cached for cached in self.cache if key.startswith(cached[0])]:
+            del self.cache[cached]
+
+    def suggest(self, prefix: str, limit: int) -> list[dict]:
+        cached = self.cache.get((prefix, limit))
+        if cached is not None:
+            return cached
+
+        # Names with the prefix form one contiguous range of the sorted array.
+        # nlargest is stable, so equal counts keep alphabetical order.
+        start = bisect_left(self.names, prefix)
+        end = bisect_left(self.names, prefix + PREFIX_RANGE_END, start)
+        top = heapq.nlargest(limit, self.names[start:end], key=self.counts.__getitem__)
+        result = [
+            {"name": self.display[key], "count": self.counts[key]}
+            for key in top
+            if self.counts[key] >= SUGGESTION_MIN_BUSINESSES
+        ]
+        if len(self.cache) >= SUGGESTION_CACHE_SIZE:
+            self.cache.clear()
+        self.cache[(prefix, limit)] = result
+        return result
+
+
+class ServiceSuggestionIndex:
+    """
+    Prefix index of the custom_services of all businesses, per business
+    type, ranked by how many businesses offer each service.
+
+    Kept up to date incrementally from business writes of this worker and,
+    through the invalidation bus, of the others. The services last seen for
+    every business are remembered so an update only applies its difference.
+    Lookups only touch memory; repeated prefixes are answered from a small
+    per-type cache.
+    """
+
+    def __init__(self):
+        self._types = {}
+        self._by_business = {}   # business_id -> (business_type, frozenset of (key, name))
+
+    def _entries(self, services: Iterable[str]) -> frozenset:
+        entries = {}
+        for service in services or []:
+            if not isinstance(service, str):
+                continue
+            name = " ".join(service.split())
+            if name:
+                entries.setdefault(normalize_service(name), name)
+        return frozenset(entries.items())
+
+    def set_business(self, business_id: str, business_type: str, services: Iterable[str]):
+        new_type, new_entries = business_type, self._entries(services)
+        old_type, old_entries = self._by_business.get(business_id, (None, frozenset()))
+
+        if old_type == new_type:
+            removed, added = old_entries - new_entries, new_entries - old_entries
+        else:
+            removed, added = old_entries, new_entries
+
+        if old_type is not None:
+            old_index = self._types[old_type]
+            for key, _ in removed:
+                old_index.remove(key)
+        if new_type is not None:
+            new_index = self._types.setdefault(new_type, _TypeIndex())
+            for key, name in added:
+                new_index.add(key, name)
+            self._by_business[business_id] = (new_type, new_entries)
+        else:
+            self._by_business.pop(business_id, None)
+
+    def remove_business(self, business_id: str):
+        business_type, entries = self._by_business.pop(business_id, (None, frozenset()))
+        if business_type is not None:
+            index = self._types[business_type]
+            for key, _ in entries:
+                index.remove(key)
+
+    def suggest(self, business_type: str, prefix: str, limit: int = 10) -> list[dict]:
+        index = self._types.get(business_type)
+        if index is None:
+            return []
+        return index.suggest(normalize_service(prefix), max(1, min(limit, SUGGESTION_MAX_LIMIT)))
+
+    async def rebuild(self, db: AsyncIOMotorDatabase):
+        """
+        Rebuild from scratch by streaming business_profiles; the new index
+        replaces the old one only once complete.
+        """
+        fresh = ServiceSuggestionIndex()
+        cursor = db.business_profiles.find(
+            {},
+            {"business_type": 1, "custom_services": 1}
+        ).batch_size(REBUILD_BATCH_SIZE)
+        async for business in cursor:
+            fresh.set_business(str(business["_id"]), business.get("business_type"), business.get("custom_services"))
+        self._types, self._by_business = fresh._types, fresh._by_business
+        logger.info(f"Service suggestion index built from {len(self._by_business)} businesses")
+
+    def apply_change(self, change: dict):
+        """
+        Invalidation bus callback for business_profiles changes.
+        """
+        business_id = str(change["documentKey"]["_id"])
+        if change["operationType"] == "delete":
+            self.remove_business(business_id)
+            return
+        document = change.get("fullDocument")
+        if document is None:
+            # Deleted again before the lookup
+            self.remove_business(business_id)
+            return
+        self.set_business(business_id, document.get("business_type"), document.get("custom_services"))
+
+    def stats(self) -> dict:
+        return {
+            "businesses": len(self._by_business),
+            "types": {business_type: len(index.names) for business_type, index in self._types.items()}
+        }
+
+
+service_suggestions = ServiceSuggestionIndex()
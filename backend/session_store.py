@@ -0,0 +1,228 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from datetime import datetime, timezone
+from typing import Optional
+from abc import ABC, abstractmethod
+import time
+import os
+import logging
+
+from models import UserSession, as_utc
+
+logger = logging.getLogger(__name__)
+
+# "mongo" (default), "redis" or "memory"
+SESSION_STORE = os.environ.get("SESSION_STORE", "mongo")
+SESSION_REDIS_URL = os.environ.get("SESSION_REDIS_URL", "redis://localhost:6379/0")
+SESSION_REDIS_PREFIX = os.environ.get("SESSION_REDIS_PREFIX", "session:")
+MEMORY_STORE_PRUNE_EVERY = 1000
+
+
+class SessionStore(ABC):
+    """
+    Key-value storage of opaque session tokens. Every backend expires
+    sessions natively at their expires_at.
+
+    get returns {"user_id", "expires_at"} or None; create is idempotent for
+    a token; extend_many moves the expiry of many sessions in one round trip
+    and never revives a deleted session.
+    """
+
+    name = "base"
+
+    async def setup(self):
+        pass
+
+    @abstractmethod
+    async def get(self, session_token: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def create(self, session: UserSession):
+        ...
+
+    @abstractmethod
+    async def delete(self, session_token: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def extend_many(self, extensions: dict) -> int:
+        """
+        `extensions` maps session tokens to (last_seen, new_expires_at).
+        """
+
+    async def close(self):
+        pass
+
+
+class MongoSessionStore(SessionStore):
+    """
+    Sessions in the user_sessions collection, expired by a TTL index.
+    """
+
+    name = "mongo"
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+
+    async def setup(self):
+        # create relies on a unique token to store a session only once. The
+        # non-unique index of older deployments has the same name and has to
+        # be replaced.
+        indexes = await self.db.user_sessions.index_information()
+        if "session_token_1" in indexes and not indexes["session_token_1"].get("unique"):
+            await self.db.user_sessions.drop_index("session_token_1")
+        try:
+            await self.db.user_sessions.create_index("session_token", unique=True)
+        except OperationFailure as e:
+            # Keep lookups indexed until the duplicate sessions are removed
+            logger.error(f"Unique session_token index not created, duplicate sessions exist: {e}")
+            await self.db.user_sessions.create_index("session_token")
+        await self.db.user_sessions.create_index("expires_at", expireAfterSeconds=0)
+
+    async def get(self, session_token: str) -> Optional[dict]:
+        return await self.db.user_sessions.find_one(
+            {"session_token": session_token},
+            {"_id": 0, "user_id": 1, "expires_at": 1}
+        )
+
+    async def create(self, session: UserSession):
+        # Upsert so a replayed exchange never stores a second copy of the session
+        try:
+            await self.db.user_sessions.update_one(
+                {"session_token": session.session_token},
+                {"$setOnInsert": session.dict()},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # A concurrent replay inserted it first
+            pass
+
+    async def delete(self, session_token: str) -> bool:
+        result = await self.db.user_sessions.delete_one({"session_token": session_token})
+        return result.deleted_count > 0
+
+    async def extend_many(self, extensions: dict) -> int:
+        if not extensions:
+            return 0
+        operations = [
+            UpdateOne(
+                {"session_token": token, "expires_at": {"$lt": expires_at}},
+                {"$set": {"expires_at": expires_at, "last_seen_at": last_seen}}
+            )
+            for token, (last_seen, expires_at) in extensions.items()
+        ]
+        await self.db.user_sessions.bulk_write(operations, ordered=False)
+        return len(operations)
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Sessions as Redis keys holding the user id, expired by the key TTL.
+    Works with any client exposing the redis.asyncio API (a local server,
+    a Redis-compatible service, or fakeredis in tests).
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str = SESSION_REDIS_URL, client=None, prefix: str = SESSION_REDIS_PREFIX):
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise RuntimeError("SESSION_STORE=redis requires the redis package (pip install 'redis>=5')")
+            client = redis.from_url(url, decode_responses=True)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, session_token: str) -> str:
+        return f"{self.prefix}{session_token}"
+
+    async def setup(self):
+        await self.client.ping()
+
+    async def get(self, session_token: str) -> Optional[dict]:
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.get(self._key(session_token))
+            pipe.pttl(self._key(session_token))
+            user_id, ttl_ms = await pipe.execute()
+        if user_id is None or ttl_ms < 0:
+            return None
+        if isinstance(user_id, bytes):
+            user_id = user_id.decode()
+        return {"user_id": user_id, "expires_at": datetime.fromtimestamp(time.time() + ttl_ms / 1000, tz=timezone.utc)}
+
+    async def create(self, session: UserSession):
+        expire_at_ms = int(as_utc(session.expires_at).timestamp() * 1000)
+        await self.client.set(self._key(session.session_token), session.user_id, nx=True, pxat=expire_at_ms)
+
+    async def delete(self, session_token: str) -> bool:
+        return await self.client.delete(self._key(session_token)) > 0
+
+    async def extend_many(self, extensions: dict) -> int:
+        if not extensions:
+            return 0
+        # PEXPIREAT is a no-op on a missing key, so logged-out sessions stay gone
+        async with self.client.pipeline(transaction=False) as pipe:
+            for token, (_, expires_at) in extensions.items():
+                pipe.pexpireat(self._key(token), int(as_utc(expires_at).timestamp() * 1000))
+            await pipe.execute()
+        return len(extensions)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Sessions in a dict, for a single node and development. Lost on restart
+    and not shared between workers.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._sessions = {}   # token -> (user_id, expires_at)
+        self._creates = 0
+
+    async def get(self, session_token: str) -> Optional[dict]:
+        session = self._sessions.get(session_token)
+        if session is None:
+            return None
+        if session[1] <= datetime.now(timezone.utc):
+            del self._sessions[session_token]
+            return None
+        return {"user_id": session[0], "expires_at": session[1]}
+
+    async def create(self, session: UserSession):
+        self._sessions.setdefault(session.session_token, (session.user_id, as_utc(session.expires_at)))
+        self._creates += 1
+        if self._creates % MEMORY_STORE_PRUNE_EVERY == 0:
+            self.prune()
+
+    async def delete(self, session_token: str) -> bool:
+        return self._sessions.pop(session_token, None) is not None
+
+    async def extend_many(self, extensions: dict) -> int:
+        for token, (_, expires_at) in extensions.items():
+            session = self._sessions.get(token)
+            if session is not None and session[1] < expires_at:
+                self._sessions[token] = (session[0], expires_at)
+        return len(extensions)
+
+    def prune(self):
+        now = datetime.now(timezone.utc)
+        expired = [token for token, session in self._sessions.items() if session[1] <= now]
+        for token in expired:
+            del self._sessions[token]
+
+
+def create_session_store(db: AsyncIOMotorDatabase, kind: str = SESSION_STORE) -> SessionStore:
+    if kind == "mongo":
+        return MongoSessionStore(db)
+    if kind == "redis":
+        return RedisSessionStore()
+    if kind == "memory":
+        return MemorySessionStore()
+    raise ValueError(f"Unknown SESSION_STORE: {kind}")
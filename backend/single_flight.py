@@ -0,0 +1,73 @@
+from typing import Awaitable, Callable
+import asyncio
+import time
+
+
+def _retrieve_exception(task: asyncio.Task):
+    # A failure whose callers were all cancelled is not logged as unretrieved
+    if not task.cancelled():
+        task.exception()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution and
+    memoizes successful results for a short time, so immediate repeats are
+    answered without running the call again. Failures are not memoized.
+    A started call completes even if every caller waiting on it is
+    cancelled.
+    """
+
+    def __init__(self, memo_ttl: float, max_memo: int = 1000):
+        self.memo_ttl = memo_ttl
+        self.max_memo = max_memo
+        self._in_flight = {}
+        self._memo = {}
+        self.executions = 0
+        self.shared = 0
+        self.memo_hits = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable]):
+        now = time.monotonic()
+        memo = self._memo.get(key)
+        if memo is not None and memo[0] > now:
+            self.memo_hits += 1
+            return memo[1]
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            # The call runs in its own task, so cancelling the caller that
+            # started it (e.g. a client disconnect) leaves it running for
+            # the callers sharing it
+            task = asyncio.ensure_future(self._run(key, fn))
+            task.add_done_callback(_retrieve_exception)
+            self._in_flight[key] = task
+            self.executions += 1
+        return await asyncio.shield(task)
+
+    async def _run(self, key: str, fn: Callable[[], Awaitable]):
+        try:
+            result = await fn()
+            self._remember(key, result)
+            return result
+        finally:
+            del self._in_flight[key]
+
+    def _remember(self, key: str, result):
+        now = time.monotonic()
+        if len(self._memo) >= self.max_memo:
+            self._memo = {k: v for k, v in self._memo.items() if v[0] > now}
+            if len(self._memo) >= self.max_memo:
+                return
+        self._memo[key] = (now + self.memo_ttl, result)
+
+    def stats(self) -> dict:
+        return {
+            "executions": self.executions,
+            "shared": self.shared,
+            "memo_hits": self.memo_hits,
+            "in_flight": len(self._in_flight),
+            "memoized": len(self._memo)
+        }
@@ -0,0 +1,285 @@
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from dotenv import load_dotenv
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+import asyncio
+import os
+import logging
+
+from file_cleanup import LOGO_EXTENSIONS
+from models import as_utc
+from job_lease import acquire_lease
+
+logger = logging.getLogger(__name__)
+
+USER_STORAGE_QUOTA_BYTES = int(os.environ.get("USER_STORAGE_QUOTA_BYTES", 500 * 1024 * 1024))
+USER_STORAGE_QUOTA_FILES = int(os.environ.get("USER_STORAGE_QUOTA_FILES", 1000))
+STORAGE_REPAIR_BATCH_SIZE = int(os.environ.get("STORAGE_REPAIR_BATCH_SIZE", 200))
+STORAGE_REPAIR_INTERVAL_SECONDS = int(os.environ.get("STORAGE_REPAIR_INTERVAL_SECONDS", 24 * 60 * 60))
+# Counters changed this recently may belong to an upload or delete still
+# in progress (counted but not yet recorded, or the reverse); repair skips them
+STORAGE_REPAIR_GRACE_SECONDS = int(os.environ.get("STORAGE_REPAIR_GRACE_SECONDS", 10 * 60))
+STORAGE_REPAIR_LEASE = "storage_repair"
+
+
+class QuotaExceededError(Exception):
+    """
+    Raised when a reservation would take a user over their storage quota.
+    """
+
+
+def _user_key(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+def _business_key(business_id: str) -> str:
+    return f"business:{business_id}"
+
+
+async def reserve_storage(db: AsyncIOMotorDatabase, user_id: str, business_id: str, size: int, files: int = 1):
+    """
+    Count a new file against the user's quota before it is written.
+
+    The quota check and the increment are one conditional update on the
+    user's counter, so concurrent uploads cannot overshoot the quota.
+    """
+    now = datetime.now(timezone.utc)
+    user_filter = {
+        "_id": _user_key(user_id),
+        "bytes": {"$lte": USER_STORAGE_QUOTA_BYTES - size},
+        "files": {"$lte": USER_STORAGE_QUOTA_FILES - files}
+    }
+    result = await db.storage_usage.update_one(
+        user_filter,
+        {"$inc": {"bytes": size, "files": files}, "$set": {"changed_at": now}}
+    )
+    if result.matched_count == 0:
+        # Either over quota or the user has no counter yet
+        if await db.storage_usage.find_one({"_id": _user_key(user_id)}, {"_id": 1}):
+            raise QuotaExceededError("Storage quota exceeded")
+        if size > USER_STORAGE_QUOTA_BYTES or files > USER_STORAGE_QUOTA_FILES:
+            raise QuotaExceededError("Storage quota exceeded")
+        try:
+            await db.storage_usage.insert_one(
+                {"_id": _user_key(user_id), "kind": "user", "bytes": size, "files": files, "changed_at": now}
+            )
+        except DuplicateKeyError:
+            # Created concurrently; go through the conditional update again
+            return await reserve_storage(db, user_id, business_id, size, files)
+
+    await db.storage_usage.update_one(
+        {"_id": _business_key(business_id)},
+        {
+            "$inc": {"bytes": size, "files": files},
+            "$set": {"changed_at": now},
+            "$setOnInsert": {"kind": "business", "user_id": user_id}
+        },
+        upsert=True
+    )
+
+
+async def release_storage(db: AsyncIOMotorDatabase, user_id: str, business_id: str, size: int, files: int = 1):
+    """
+    Give back storage of a removed file (or of a failed upload).
+    """
+    update = {"$inc": {"bytes": -size, "files": -files}, "$set": {"changed_at": datetime.now(timezone.utc)}}
+    await db.storage_usage.update_one({"_id": _user_key(user_id)}, update)
+    await db.storage_usage.update_one({"_id": _business_key(business_id)}, update)
+
+
+async def release_business_storage(db: AsyncIOMotorDatabase, user_id: str, business_id: str):
+    """
+    Give back everything counted for a deleted business.
+    """
+    usage = await db.storage_usage.find_one_and_delete({"_id": _business_key(business_id)})
+    if usage:
+        await db.storage_usage.update_one(
+            {"_id": _user_key(user_id)},
+            {"$inc": {"bytes": -usage["bytes"], "files": -usage["files"]}, "$set": {"changed_at": datetime.now(timezone.utc)}}
+        )
+
+
+async def get_storage_usage(db: AsyncIOMotorDatabase, user_id: str, include_businesses: bool = True) -> dict:
+    """
+    Current usage of a user; a single read of their counter unless the
+    per-business breakdown is requested.
+    """
+    user_usage = await db.storage_usage.find_one({"_id": _user_key(user_id)}) or {}
+    usage = {
+        "bytes": user_usage.get("bytes", 0),
+        "files": user_usage.get("files", 0),
+        "quota_bytes": USER_STORAGE_QUOTA_BYTES,
+        "quota_files": USER_STORAGE_QUOTA_FILES
+    }
+    if include_businesses:
+        businesses = await db.storage_usage.find(
+            {"kind": "business", "user_id": user_id},
+            {"bytes": 1, "files": 1}
+        ).to_list(None)
+        usage["businesses"] = {
+            business["_id"].split(":", 1)[1]: {"bytes": business["bytes"], "files": business["files"]}
+            for business in businesses
+        }
+    return usage
+
+
+# ==================== Repair ====================
+
+def _logo_size(upload_dir: Path, logo_url: str) -> int:
+    """
+    Size of a logo uploaded before sizes were recorded. Runs in a worker thread.
+    """
+    logo_id = logo_url.split("/")[-1]
+    for ext in LOGO_EXTENSIONS:
+        try:
+            return (upload_dir / f"{logo_id}{ext}").stat().st_size
+        except FileNotFoundError:
+            continue
+    return 0
+
+
+def _correction(key: str, counter: dict, actual: dict, extra: dict) -> UpdateOne:
+    """
+    Move a counter to its actual value by the difference, and only if it
+    still holds the values the difference was computed from, so a
+    reservation landing meanwhile is never overwritten.
+    """
+    delta = {"bytes": actual["bytes"] - counter.get("bytes", 0), "files": actual["files"] - counter.get("files", 0)}
+    if counter:
+        return UpdateOne(
+            {"_id": key, "bytes": counter["bytes"], "files": counter["files"]},
+            {"$inc": delta, "$set": extra}
+        )
+    # Missing counter; inserting it loses to a concurrent first reservation
+    return UpdateOne({"_id": key, "bytes": 0, "files": 0}, {"$inc": delta, "$set": extra}, upsert=True)
+
+
+async def _repair_users(db: AsyncIOMotorDatabase, upload_dir: Path, user_ids: list[str]) -> int:
+    businesses = await db.business_profiles.find(
+        {"user_id": {"$in": user_ids}},
+        {"user_id": 1, "logo_url": 1, "logo_size": 1}
+    ).to_list(None)
+
+    document_usage = {}
+    if businesses:
+        pipeline = [
+            {"$match": {"business_id": {"$in": [str(business["_id"]) for business in businesses]}}},
+            {"$group": {"_id": "$business_id", "bytes": {"$sum": "$size"}, "files": {"$sum": 1}}}
+        ]
+        async for usage in db.business_documents.aggregate(pipeline):
+            document_usage[usage["_id"]] = usage
+
+    counters = {
+        counter["_id"]: counter
+        async for counter in db.storage_usage.find(
+            {"$or": [{"_id": {"$in": [_user_key(user_id) for user_id in user_ids]}}, {"kind": "business", "user_id": {"$in": user_ids}}]}
+        )
+    }
+    busy_since = datetime.now(timezone.utc) - timedelta(seconds=STORAGE_REPAIR_GRACE_SECONDS)
+
+    def busy(counter: dict) -> bool:
+        changed_at = counter.get("changed_at")
+        return changed_at is not None and as_utc(changed_at) > busy_since
+
+    user_totals = {user_id: {"bytes": 0, "files": 0} for user_id in user_ids}
+    operations = []
+    for business in businesses:
+        business_id = str(business["_id"])
+        usage = document_usage.get(business_id, {})
+        total = {"bytes": usage.get("bytes", 0), "files": usage.get("files", 0)}
+        if business.get("logo_url"):
+            logo_size = business.get("logo_size")
+            if logo_size is None:
+                logo_size = await asyncio.to_thread(_logo_size, upload_dir, business["logo_url"])
+                await db.business_profiles.update_one({"_id": business["_id"]}, {"$set": {"logo_size": logo_size}})
+            total["bytes"] += logo_size
+            total["files"] += 1
+        user_totals[business["user_id"]]["bytes"] += total["bytes"]
+        user_totals[business["user_id"]]["files"] += total["files"]
+
+        counter = counters.pop(_business_key(business_id), {})
+        if busy(counter) or (counter.get("bytes", 0), counter.get("files", 0)) == (total["bytes"], total["files"]):
+            continue
+        operations.append(_correction(_business_key(business_id), counter, total, {"kind": "business", "user_id": business["user_id"]}))
+
+    for user_id, total in user_totals.items():
+        counter = counters.pop(_user_key(user_id), {})
+        if busy(counter) or (counter.get("bytes", 0), counter.get("files", 0)) == (total["bytes"], total["files"]):
+            continue
+        operations.append(_correction(_user_key(user_id), counter, total, {"kind": "user"}))
+
+    # Counters left over belong to businesses that no longer exist
+    for key, counter in counters.items():
+        if not busy(counter):
+            operations.append(DeleteOne({"_id": key, "bytes": counter["bytes"], "files": counter["files"]}))
+
+    if not operations:
+        return 0
+    try:
+        result = await db.storage_usage.bulk_write(operations, ordered=False)
+        return result.modified_count + result.upserted_count + result.deleted_count
+    except BulkWriteError as e:
+        if any(err["code"] != 11000 for err in e.details["writeErrors"]):
+            raise
+        return e.details["nModified"] + e.details["nUpserted"] + e.details["nRemoved"]
+
+
+async def repair_storage_usage(db: AsyncIOMotorDatabase, upload_dir: Path, batch_size: int = STORAGE_REPAIR_BATCH_SIZE) -> int:
+    """
+    Recompute every counter from the document records and logos, a batch of
+    users at a time, to correct drift (crashes between a file operation and
+    its counter update, manual data fixes).
+
+    Corrections are applied as differences guarded by the values they were
+    computed from, and counters changed within STORAGE_REPAIR_GRACE_SECONDS
+    are left for the next run, so live reservations are never overwritten.
+    Returns the number of counters corrected.
+    """
+    repaired = 0
+    users = 0
+    batch = []
+    async for user in db.users.find({}, {"_id": 1}).batch_size(batch_size):
+        batch.append(user["_id"])
+        if len(batch) >= batch_size:
+            repaired += await _repair_users(db, upload_dir, batch)
+            users += len(batch)
+            batch = []
+    if batch:
+        repaired += await _repair_users(db, upload_dir, batch)
+        users += len(batch)
+
+    logger.info(f"Storage usage checked for {users} users, {repaired} counters corrected")
+    return repaired
+
+
+async def run_storage_repair(db: AsyncIOMotorDatabase, upload_dir: Path, interval_seconds: int = STORAGE_REPAIR_INTERVAL_SECONDS):
+    """
+    Background loop repairing the storage counters every interval. Every
+    worker runs the loop; the lease lets only one of them repair.
+    """
+    while True:
+        try:
+            if await acquire_lease(db, STORAGE_REPAIR_LEASE, 2 * interval_seconds):
+                await repair_storage_usage(db, upload_dir)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Storage usage repair failed: {e}")
+        await asyncio.sleep(interval_seconds)
+
+
+async def main():
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    await db.business_profiles.create_index("user_id")
+    repaired = await repair_storage_usage(db, Path(__file__).parent / "uploads")
+    print(f"Corrected {repaired} storage counters")
+    client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
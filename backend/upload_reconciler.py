@@ -0,0 +1,164 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+import asyncio
+import os
+import logging
+
+from job_lease import acquire_lease
+
+logger = logging.getLogger(__name__)
+
+# Files younger than this are never touched, so an upload that has written its
+# file but not yet updated the business record is not mistaken for an orphan.
+RECONCILE_GRACE_SECONDS = int(os.environ.get("UPLOAD_RECONCILE_GRACE_SECONDS", 24 * 60 * 60))
+RECONCILE_INTERVAL_SECONDS = int(os.environ.get("UPLOAD_RECONCILE_INTERVAL_SECONDS", 6 * 60 * 60))
+RECONCILE_BATCH_SIZE = int(os.environ.get("UPLOAD_RECONCILE_BATCH_SIZE", 1000))
+
+RECONCILE_LEASE = "upload_reconciler"
+
+last_report: Optional[dict] = None
+
+
+def _next_batch(entries, cutoff: float, batch_size: int) -> tuple[int, list[tuple[str, str, int]], bool]:
+    """
+    Read directory entries until batch_size files older than the cutoff are
+    found. Returns the number of files scanned, the (file id, file name,
+    size) of the old ones and whether the directory is exhausted. Runs in a
+    worker thread.
+    """
+    scanned = 0
+    batch = []
+    for entry in entries:
+        if not entry.is_file(follow_symlinks=False):
+            continue
+        scanned += 1
+        try:
+            file_stat = entry.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            continue
+        if file_stat.st_mtime > cutoff:
+            continue
+        batch.append((Path(entry.name).stem, entry.name, file_stat.st_size))
+        if len(batch) >= batch_size:
+            return scanned, batch, False
+    return scanned, batch, True
+
+
+async def _referenced_ids(db: AsyncIOMotorDatabase, file_ids: list[str]) -> set:
+    """
+    The ids among file_ids that a document record or a logo references,
+    looked up through the document id and logo id indexes.
+    """
+    referenced = set()
+    async for doc in db.business_documents.find({"id": {"$in": file_ids}}, {"_id": 0, "id": 1}):
+        referenced.add(doc["id"])
+    async for business in db.business_profiles.find({"logo_id": {"$in": file_ids}}, {"_id": 0, "logo_id": 1}):
+        referenced.add(business["logo_id"])
+    return referenced
+
+
+async def _migrations_pending(db: AsyncIOMotorDatabase) -> bool:
+    """
+    Whether some business still references uploads in a way the id lookups
+    do not see: embedded documents or a logo without a logo_id.
+    """
+    return await db.business_profiles.find_one(
+        {"$or": [
+            {"documents": {"$exists": True}},
+            {"logo_url": {"$type": "string"}, "logo_id": None}
+        ]},
+        {"_id": 1}
+    ) is not None
+
+
+def _remove(upload_dir: Path, files: list[tuple[str, int]], dry_run: bool) -> dict:
+    """
+    Remove the given (file name, size) files. Runs in a worker thread.
+    """
+    stats = {"removed": 0, "bytes_reclaimed": 0, "errors": 0}
+
+    for name, size in files:
+        try:
+            if not dry_run:
+                os.unlink(upload_dir / name)
+            stats["removed"] += 1
+            stats["bytes_reclaimed"] += size
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            stats["errors"] += 1
+            logger.error(f"Failed to remove orphaned upload {name}: {e}")
+
+    return stats
+
+
+async def reconcile_uploads(
+    db: AsyncIOMotorDatabase,
+    upload_dir: Path,
+    grace_seconds: int = RECONCILE_GRACE_SECONDS,
+    dry_run: bool = False,
+    batch_size: int = RECONCILE_BATCH_SIZE
+) -> dict:
+    """
+    Remove upload files that no business references any more.
+
+    The directory is walked a batch of files older than the grace period at
+    a time; each batch is looked up by id and its orphans are removed before
+    the next batch is read, so memory does not grow with the number of files.
+    """
+    global last_report
+
+    started_at = datetime.now(timezone.utc)
+    cutoff = started_at.timestamp() - grace_seconds
+    report = {"scanned": 0, "removed": 0, "bytes_reclaimed": 0, "errors": 0}
+
+    if await _migrations_pending(db):
+        # Startup migrations have not finished; referenced files could look orphaned
+        logger.info("Upload reconcile skipped until startup migrations have finished")
+        report["skipped"] = True
+    else:
+        entries = await asyncio.to_thread(os.scandir, upload_dir)
+        try:
+            done = False
+            while not done:
+                scanned, batch, done = await asyncio.to_thread(_next_batch, entries, cutoff, batch_size)
+                report["scanned"] += scanned
+                if not batch:
+                    continue
+                referenced = await _referenced_ids(db, [file_id for file_id, _, _ in batch])
+                orphans = [(name, size) for file_id, name, size in batch if file_id not in referenced]
+                if orphans:
+                    stats = await asyncio.to_thread(_remove, upload_dir, orphans, dry_run)
+                    for field, value in stats.items():
+                        report[field] += value
+        finally:
+            entries.close()
+
+    report["dry_run"] = dry_run
+    report["started_at"] = started_at.isoformat()
+    report["finished_at"] = datetime.now(timezone.utc).isoformat()
+    last_report = report
+
+    logger.info(
+        f"Upload reconcile finished: scanned={report['scanned']}, removed={report['removed']}, "
+        f"bytes_reclaimed={report['bytes_reclaimed']}, errors={report['errors']}, dry_run={dry_run}"
+    )
+    return report
+
+
+async def run_reconciler(db: AsyncIOMotorDatabase, upload_dir: Path, interval_seconds: int = RECONCILE_INTERVAL_SECONDS):
+    """
+    Background loop that reconciles the upload directory every interval.
+    Every worker runs the loop; the lease lets only one of them sweep.
+    """
+    while True:
+        try:
+            if await acquire_lease(db, RECONCILE_LEASE, 2 * interval_seconds):
+                await reconcile_uploads(db, upload_dir)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Upload reconcile failed: {e}")
+        await asyncio.sleep(interval_seconds)
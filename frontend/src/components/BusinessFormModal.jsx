@@ -39,11 +39,30 @@ const BusinessFormModal = ({ business, onClose }) => {
         business_phone: business.business_phone || '',
         custom_services: business.custom_services || [],
         logo_url: business.logo_url || null,
-        documents: business.documents || []
+        documents: []
       });
+      loadDocuments(business.id);
     }
   }, [business]);
 
+  const loadDocuments = async (businessId) => {
+    try {
+      const documents = [];
+      let after = null;
+      do {
+        const response = await axios.get(`${API}/business/${businessId}/documents`, {
+          params: { limit: 200, after },
+          withCredentials: true
+        });
+        documents.push(...response.data.documents);
+        after = response.data.next_cursor;
+      } while (after);
+      setFormData(prev => ({ ...prev, documents }));
+    } catch (error) {
+      console.error('Error loading documents:', error);
+    }
+  };
+
   const loadBusinessTypes = async () => {
     try {
       const response = await axios.get(`${API}/profile/business-types`, {
@@ -328,7 +347,7 @@ const BusinessFormModal = ({ business, onClose }) => {
               type="tel"
               value={formData.business_phone}
               onChange={(e) => handleInputChange('business_phone', e.target.value)}
-              placeholder="e.g., (555) 123-4567"
+              placeholder="e.g., (212) 555-0123"
               required
               className="border-gray-300"
             />
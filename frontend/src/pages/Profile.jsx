@@ -272,7 +272,7 @@ const Profile = ({ user, onSignOut }) => {
                   type="tel"
                   value={formData.business_phone}
                   onChange={(e) => handleInputChange('business_phone', e.target.value)}
-                  placeholder="e.g., (555) 123-4567"
+                  placeholder="e.g., (212) 555-0123"
                   required
                   className="bg-zinc-900 border-zinc-700 text-white placeholder:text-gray-500"
                 />
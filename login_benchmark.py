@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Login pipeline benchmark for AIRA backend
+Measures latency of the user upsert + session insert steps of
+/api/auth/session under concurrency and checks that concurrent first
+logins for the same email never create duplicate users.
+
+The auth provider call is replaced by generated payloads so only the
+database pipeline is measured. Run against a local MongoDB:
+
+    MONGO_URL=mongodb://localhost:27017 DB_NAME=login_bench python login_benchmark.py
+"""
+
+import asyncio
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).parent / 'backend'))
+
+from auth import create_or_update_user, create_session
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def login(db, email):
+    """Run one login through the pipeline and return its latency in ms"""
+    started = time.perf_counter()
+    user_data = {
+        "email": email,
+        "name": "Bench User",
+        "picture": "https://via.placeholder.com/150",
+        "session_token": f"bench_{uuid.uuid4().hex}"
+    }
+    user = await create_or_update_user(db, user_data)
+    await create_session(db, user.id, user_data["session_token"])
+    return (time.perf_counter() - started) * 1000
+
+
+async def run(args):
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    db = client[os.environ.get('DB_NAME', 'login_bench')]
+
+    await db.users.delete_many({"email": {"$regex": "^bench\\."}})
+    await db.user_sessions.delete_many({"session_token": {"$regex": "^bench_"}})
+    await db.users.create_index("email", unique=True)
+    await db.user_sessions.create_index("session_token")
+
+    # Every email is logged in `--repeat` times at once to provoke the race
+    emails = [f"bench.{i}.{int(time.time())}@example.com" for i in range(args.users)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited(email):
+        async with semaphore:
+            return await login(db, email)
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*[limited(email) for email in emails for _ in range(args.repeat)])
+    elapsed = time.perf_counter() - started
+
+    duplicates = await db.users.aggregate([
+        {"$match": {"email": {"$in": emails}}},
+        {"$group": {"_id": "$email", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ]).to_list(None)
+
+    print(f"\n=== Login pipeline: {len(latencies)} logins, concurrency {args.concurrency} ===")
+    print(f"Throughput: {len(latencies) / elapsed:.1f} logins/s")
+    print(f"Latency ms: mean={statistics.mean(latencies):.2f} p50={percentile(latencies, 50):.2f} "
+          f"p95={percentile(latencies, 95):.2f} p99={percentile(latencies, 99):.2f} max={max(latencies):.2f}")
+    status = "✅ PASS" if not duplicates else "❌ FAIL"
+    print(f"{status}: duplicate users for {len(duplicates)} of {len(emails)} emails")
+
+    await db.users.delete_many({"email": {"$in": emails}})
+    await db.user_sessions.delete_many({"session_token": {"$regex": "^bench_"}})
+    client.close()
+    return not duplicates
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200, help="distinct emails")
+    parser.add_argument("--repeat", type=int, default=3, help="concurrent logins per email")
+    parser.add_argument("--concurrency", type=int, default=100, help="max in-flight logins")
+    ok = asyncio.run(run(parser.parse_args()))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,60 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# Backend modules import each other as top-level modules
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+# server.py reads these at import; the api fixture swaps in an in-memory database
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test")
+
+
+@pytest.fixture
+def api(monkeypatch, tmp_path):
+    """
+    The app served by a TestClient on an in-memory database, with uploads
+    in a temporary directory and every request authenticated as one user
+    owning one business.
+    """
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+    from models import User, BusinessProfile
+    import server
+
+    db = mongomock_motor.AsyncMongoMockClient()["test"]
+    partial_dir = tmp_path / "partial"
+    partial_dir.mkdir()
+    user = User(email="owner@example.com", name="Owner", picture="")
+
+    async def current_user(request, db):
+        return user
+
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(server, "PARTIAL_UPLOAD_DIR", partial_dir)
+    monkeypatch.setattr(server, "get_current_user", current_user)
+
+    business = BusinessProfile(
+        user_id=user.id,
+        business_name="Trattoria",
+        business_type="Restaurant / Cafe",
+        business_phone="+1 650 253 0000"
+    )
+    asyncio.run(db.business_profiles.insert_one(business.dict(by_alias=True)))
+
+    class Api:
+        pass
+
+    api = Api()
+    api.client = TestClient(server.app)
+    api.db = db
+    api.user = user
+    api.business_id = business.id
+    api.upload_dir = tmp_path
+    api.partial_dir = partial_dir
+    return api
@@ -0,0 +1,107 @@
+import asyncio
+import json
+
+from models import User
+
+
+def _export(api):
+    response = api.client.get("/api/account/export")
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def _import(api, records):
+    body = "".join(json.dumps(record) + "\n" for record in records)
+    return api.client.post("/api/account/import", content=body.encode())
+
+
+def _upload(api, name="menu.pdf"):
+    response = api.client.post(
+        f"/api/business/{api.business_id}/upload-document",
+        files={"file": (name, b"%PDF-1.4 not really a pdf", "application/pdf")}
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_round_trip_restores_profile(api):
+    document = _upload(api)
+    records = _export(api)
+    assert [record["type"] for record in records] == ["header", "business", "document"]
+
+    business = records[1]["data"]
+    business["business_name"] = "Trattoria Roma"
+    report = _import(api, records).json()
+    assert report["businesses"] == 1
+    assert report["documents"] == 1
+    assert report["skipped"] == 0
+
+    stored = asyncio.run(api.db.business_profiles.find_one({"_id": api.business_id}))
+    assert stored["business_name"] == "Trattoria Roma"
+    assert stored["document_count"] == 1
+    assert asyncio.run(api.db.business_documents.count_documents({"id": document["id"]})) == 1
+
+
+def test_repeated_import_is_a_no_op(api):
+    _upload(api)
+    records = _export(api)
+    first = _import(api, records).json()
+    second = _import(api, records).json()
+    assert first == second
+    assert asyncio.run(api.db.business_documents.count_documents({})) == 1
+    assert asyncio.run(api.db.business_profiles.count_documents({})) == 1
+
+
+def test_documents_without_file_are_skipped(api):
+    records = _export(api)
+    records.append({"type": "document", "data": {
+        "id": "elsewhere", "filename": "menu.pdf", "size": 100, "url": "/x", "business_id": api.business_id
+    }})
+    report = _import(api, records).json()
+    assert report["documents"] == 0
+    assert report["skipped"] == 1
+    assert report["errors"][0]["line"] == 3
+    assert asyncio.run(api.db.business_documents.count_documents({})) == 0
+
+
+def test_invalid_records_are_reported(api):
+    business = _export(api)[1]["data"]
+    records = [
+        {"type": "header", "data": {"version": 1}},
+        {"type": "business", "data": {**business, "_id": "b-type", "business_type": "Restaurant"}},
+        {"type": "business", "data": {**business, "_id": "b-name", "business_name": "T"}},
+        {"type": "business", "data": {**business, "_id": "b-phone", "business_phone": "(555) 123-4567"}},
+        {"type": "document", "data": {"id": "d1", "filename": "a.pdf", "size": 1, "url": "/x", "business_id": "b-type"}},
+        {"type": "unknown", "data": {}},
+    ]
+    report = _import(api, records).json()
+    assert report["businesses"] == 1
+    assert report["skipped"] == 4
+    assert sorted(error["line"] for error in report["errors"]) == [2, 3, 5, 6]
+
+    phone_only = asyncio.run(api.db.business_profiles.find_one({"_id": "b-phone"}))
+    assert phone_only["business_phone_e164"] is None
+    assert asyncio.run(api.db.business_profiles.find_one({"_id": "b-type"})) is None
+
+
+def test_malformed_stream(api):
+    response = api.client.post("/api/account/import", content=b'{"type": "header", "data": {"version": 99}}\n')
+    assert response.status_code == 400
+
+    report = api.client.post("/api/account/import", content=b"not json\n").json()
+    assert report["skipped"] == 1
+
+
+def test_import_cannot_take_over_other_accounts(api):
+    _upload(api)
+    records = _export(api)
+    api.user.id = User(email="other@example.com", name="Other", picture="").id
+
+    report = _import(api, records).json()
+    assert report["businesses"] == 0
+    assert report["conflicts"] == 1
+    assert report["documents"] == 0
+
+    business = asyncio.run(api.db.business_profiles.find_one({"_id": api.business_id}))
+    assert business["user_id"] != api.user.id
+    assert asyncio.run(api.db.business_documents.count_documents({})) == 1
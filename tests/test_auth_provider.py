@@ -0,0 +1,82 @@
+"""
+fetch_user_from_emergent and its circuit breaker against the local auth
+provider stub (auth_provider_stub.py).
+"""
+
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+from fastapi import HTTPException
+
+import auth
+from auth_provider_stub import make_handler
+from circuit_breaker import CircuitBreaker, OPEN, HALF_OPEN
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    servers = []
+
+    def start(latency: float = 0.0, error_rate: float = 0.0):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(latency, error_rate))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        monkeypatch.setattr(auth, "EMERGENT_AUTH_SESSION_API", f"http://127.0.0.1:{server.server_port}/session-data")
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker("emergent_auth", minimum_calls=3, open_seconds=60, half_open_max_calls=1, slow_call_seconds=5)
+    monkeypatch.setattr(auth, "provider_breaker", breaker)
+    return breaker
+
+
+def test_fetch_user(stub, breaker):
+    stub()
+    user = asyncio.run(auth.fetch_user_from_emergent("abc"))
+    assert user["id"] == "stub-abc"
+    assert user["session_token"] == "stub_session_abc"
+    assert breaker.calls == 1
+    assert breaker.failures == 0
+
+
+def test_provider_errors_open_the_circuit(stub, breaker):
+    stub(error_rate=1.0)
+    for _ in range(3):
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(auth.fetch_user_from_emergent("abc"))
+        assert error.value.status_code == 503
+    assert breaker.state == OPEN
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(auth.fetch_user_from_emergent("abc"))
+    assert error.value.status_code == 503
+    assert int(error.value.headers["Retry-After"]) >= 1
+    assert breaker.rejected == 1
+
+
+def test_cancelled_probe_does_not_close_the_circuit(stub, breaker):
+    stub(latency=0.5)
+    breaker.open_seconds = 0
+    breaker._transition(OPEN)
+
+    async def scenario():
+        probe = asyncio.create_task(auth.fetch_user_from_emergent("abc"))
+        await asyncio.sleep(0.1)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+    asyncio.run(scenario())
+    assert breaker.state == HALF_OPEN
+    assert breaker.calls == 0
+    # The probe slot is free again
+    breaker.before_call()
@@ -0,0 +1,38 @@
+from datetime import datetime, timezone, timedelta
+
+from cache_bus import EvictionTracker
+from models import as_utc
+
+
+def test_mark_changes_with_its_key_only():
+    tracker = EvictionTracker()
+    mark = tracker.mark("b1")
+    other = tracker.mark("b2")
+    tracker.changed("b1")
+    assert tracker.mark("b1") != mark
+    assert tracker.mark("b2") == other
+
+
+def test_changed_all_invalidates_every_mark():
+    tracker = EvictionTracker()
+    tracker.changed("b1")
+    marks = {key: tracker.mark(key) for key in ["b1", "b2"]}
+    tracker.changed_all()
+    assert all(tracker.mark(key) != mark for key, mark in marks.items())
+
+
+def test_tracked_keys_are_bounded():
+    tracker = EvictionTracker(max_keys=3)
+    mark = tracker.mark("b0")
+    for n in range(10):
+        tracker.changed(f"b{n}")
+    assert len(tracker._changes) <= 3
+    # Forgetting counts never lets an older mark match again
+    assert tracker.mark("b0") != mark
+
+
+def test_as_utc():
+    naive = datetime(2024, 5, 1, 12, 0)
+    assert as_utc(naive) == datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+    aware = datetime(2024, 5, 1, 12, 0, tzinfo=timezone(timedelta(hours=2)))
+    assert as_utc(aware) is aware
@@ -0,0 +1,119 @@
+import asyncio
+import hashlib
+from datetime import datetime, timezone, timedelta
+
+from chunked_upload import MIN_CHUNK_SIZE, collect_expired_uploads, part_path
+
+CONTENT = bytes(range(256)) * (MIN_CHUNK_SIZE // 256) * 2 + b"tail"
+
+
+def _start(api, content=CONTENT, **extra):
+    response = api.client.post(
+        f"/api/business/{api.business_id}/uploads",
+        json={"filename": "menu.pdf", "size": len(content), "chunk_size": MIN_CHUNK_SIZE, **extra}
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _put(api, upload, index, content=CONTENT):
+    offset = index * upload["chunk_size"]
+    return api.client.put(
+        f"/api/business/{api.business_id}/uploads/{upload['upload_id']}/chunks/{index}",
+        content=content[offset:offset + upload["chunk_size"]]
+    )
+
+
+def _complete(api, upload):
+    return api.client.post(f"/api/business/{api.business_id}/uploads/{upload['upload_id']}/complete")
+
+
+def test_resume_reports_missing_chunks_and_offset(api):
+    upload = _start(api)
+    assert upload["total_chunks"] == 3
+    assert _put(api, upload, 0).status_code == 200
+    status = _put(api, upload, 2).json()
+    assert status["missing_chunks"] == [1]
+    assert status["offset"] == MIN_CHUNK_SIZE
+
+    response = _complete(api, upload)
+    assert response.status_code == 400
+
+    resumed = api.client.get(f"/api/business/{api.business_id}/uploads/{upload['upload_id']}").json()
+    assert resumed["status"] == "open"
+    assert resumed["missing_chunks"] == [1]
+
+
+def test_complete_registers_document(api):
+    upload = _start(api, sha256=hashlib.sha256(CONTENT).hexdigest())
+    for index in reversed(range(upload["total_chunks"])):
+        assert _put(api, upload, index).status_code == 200
+
+    response = _complete(api, upload)
+    assert response.status_code == 200, response.text
+    document = response.json()
+    assert document["id"] == upload["upload_id"]
+    stored = api.upload_dir / f"{upload['upload_id']}.pdf"
+    assert stored.read_bytes() == CONTENT
+    # The grace period of the upload reconciler counts from completion
+    assert stored.stat().st_mtime > datetime.now(timezone.utc).timestamp() - 60
+    assert not part_path(api.partial_dir, upload["upload_id"]).exists()
+    assert asyncio.run(api.db.upload_sessions.count_documents({})) == 0
+    assert _complete(api, upload).status_code == 404
+
+
+def test_checksum_mismatch_discards_upload(api):
+    upload = _start(api, sha256="0" * 64)
+    for index in range(upload["total_chunks"]):
+        _put(api, upload, index)
+    response = _complete(api, upload)
+    assert response.status_code == 400
+    assert not part_path(api.partial_dir, upload["upload_id"]).exists()
+
+
+def test_expired_open_upload_is_collected(api):
+    upload = _start(api)
+    _put(api, upload, 0)
+    past = datetime.now(timezone.utc) - timedelta(seconds=1)
+    asyncio.run(api.db.upload_sessions.update_one({"_id": upload["upload_id"]}, {"$set": {"expires_at": past}}))
+
+    assert asyncio.run(collect_expired_uploads(api.db, api.partial_dir)) == 1
+    assert not part_path(api.partial_dir, upload["upload_id"]).exists()
+    assert _put(api, upload, 1).status_code == 404
+
+
+def test_busy_expired_uploads_are_kept(api):
+    writing, completing = _start(api), _start(api)
+    now = datetime.now(timezone.utc)
+    past = now - timedelta(seconds=1)
+
+    async def expire():
+        await api.db.upload_sessions.update_many({}, {"$set": {"expires_at": past}})
+        await api.db.upload_sessions.update_one(
+            {"_id": writing["upload_id"]},
+            {"$push": {"writes": {"id": "w1", "until": now + timedelta(minutes=5)}}}
+        )
+        await api.db.upload_sessions.update_one(
+            {"_id": completing["upload_id"]},
+            {"$set": {"status": "completing", "completing_until": now + timedelta(minutes=5)}}
+        )
+        return await collect_expired_uploads(api.db, api.partial_dir)
+
+    assert asyncio.run(expire()) == 0
+    assert part_path(api.partial_dir, writing["upload_id"]).exists()
+    assert part_path(api.partial_dir, completing["upload_id"]).exists()
+
+
+def test_stale_completion_is_collected(api):
+    upload = _start(api)
+    past = datetime.now(timezone.utc) - timedelta(seconds=1)
+
+    async def expire():
+        await api.db.upload_sessions.update_one(
+            {"_id": upload["upload_id"]},
+            {"$set": {"expires_at": past, "status": "completing", "completing_until": past}}
+        )
+        return await collect_expired_uploads(api.db, api.partial_dir)
+
+    assert asyncio.run(expire()) == 1
+    assert not part_path(api.partial_dir, upload["upload_id"]).exists()
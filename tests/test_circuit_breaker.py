@@ -0,0 +1,99 @@
+import pytest
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+
+
+def _breaker(**overrides) -> CircuitBreaker:
+    options = {
+        "failure_rate_threshold": 0.5,
+        "slow_call_seconds": 1.0,
+        "slow_call_rate_threshold": 0.5,
+        "window_seconds": 60,
+        "minimum_calls": 4,
+        "open_seconds": 60,
+        "half_open_max_calls": 2,
+    }
+    options.update(overrides)
+    return CircuitBreaker("test", **options)
+
+
+def _call(breaker: CircuitBreaker, failed: bool = False, duration: float = 0.01):
+    breaker.before_call()
+    breaker.record(failed, duration)
+
+
+def test_stays_closed_below_minimum_calls():
+    breaker = _breaker()
+    for _ in range(3):
+        _call(breaker, failed=True)
+    assert breaker.state == CLOSED
+
+
+def test_opens_on_failure_rate():
+    breaker = _breaker()
+    _call(breaker)
+    _call(breaker)
+    _call(breaker, failed=True)
+    assert breaker.state == CLOSED
+    _call(breaker, failed=True)
+    assert breaker.state == OPEN
+
+
+def test_opens_on_slow_call_rate():
+    breaker = _breaker()
+    for _ in range(4):
+        _call(breaker, duration=2.0)
+    assert breaker.state == OPEN
+
+
+def test_open_circuit_fails_fast():
+    breaker = _breaker()
+    for _ in range(4):
+        _call(breaker, failed=True)
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before_call()
+    assert error.value.retry_after > 0
+    assert breaker.rejected == 1
+
+
+def _half_open(**overrides) -> CircuitBreaker:
+    breaker = _breaker(open_seconds=0, **overrides)
+    for _ in range(4):
+        _call(breaker, failed=True)
+    assert breaker.state == OPEN
+    return breaker
+
+
+def test_half_open_limits_probes():
+    breaker = _half_open()
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_successful_probes_close():
+    breaker = _half_open()
+    _call(breaker)
+    assert breaker.state == HALF_OPEN
+    _call(breaker)
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_reopens():
+    breaker = _half_open()
+    _call(breaker)
+    _call(breaker, failed=True)
+    assert breaker.state == OPEN
+
+
+def test_released_probe_frees_its_slot_without_closing():
+    breaker = _half_open(half_open_max_calls=1)
+    breaker.before_call()
+    breaker.release()
+    assert breaker.state == HALF_OPEN
+    assert breaker.calls == 4
+
+    _call(breaker)
+    assert breaker.state == CLOSED
@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+
+import document_search
+from document_search import (
+    BusinessSearchIndex, apply_document_text, evict_business_index, index_document, split_passages, tokenize
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_indexes():
+    document_search.clear_business_indexes()
+    yield
+    document_search.clear_business_indexes()
+
+
+@pytest.fixture
+def db():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    return mongomock_motor.AsyncMongoMockClient()["test"]
+
+
+def _load(business_id: str, doc_id: str) -> BusinessSearchIndex:
+    index = BusinessSearchIndex()
+    index.add_document(doc_id, f"{doc_id}.pdf", ["Fresh pasta every day"])
+    document_search._indexes[business_id] = index
+    return index
+
+
+def _text_event(doc_id: str, business_id: str, version: str) -> dict:
+    # Passages are kept out of the change stream
+    return {
+        "operationType": "replace",
+        "documentKey": {"_id": doc_id},
+        "fullDocument": {"_id": doc_id, "business_id": business_id, "filename": f"{doc_id}.pdf", "version": version}
+    }
+
+
+def test_business_update_keeps_index():
+    _load("b1", "d1")
+    evict_business_index({"operationType": "update", "documentKey": {"_id": "b1"}})
+    assert "b1" in document_search._indexes
+
+
+def test_business_delete_drops_index():
+    _load("b1", "d1")
+    mark = document_search._evictions.mark("b1")
+    evict_business_index({"operationType": "delete", "documentKey": {"_id": "b1"}})
+    assert "b1" not in document_search._indexes
+    assert document_search._evictions.mark("b1") != mark
+
+
+def test_text_write_of_another_worker_is_applied(db):
+    index = _load("b1", "d1")
+
+    async def scenario():
+        await db.document_texts.insert_one(
+            {"_id": "d2", "business_id": "b1", "filename": "d2.pdf", "passages": ["Wood-fired pizza"], "version": "v1"}
+        )
+        await apply_document_text(db, _text_event("d2", "b1", "v1"))
+
+    asyncio.run(scenario())
+    assert document_search._indexes["b1"] is index
+    assert index.search("pizza")[0]["document_id"] == "d2"
+    assert index.search("pasta")[0]["document_id"] == "d1"
+
+
+def test_echo_of_own_write_is_skipped(db):
+    async def scenario():
+        index = _load("b1", "d1")
+        await index_document(db, "b1", "d2", "d2.pdf", "Wood-fired pizza")
+        stored = await db.document_texts.find_one({"_id": "d2"})
+        # Reading the passages again would see this instead
+        await db.document_texts.update_one({"_id": "d2"}, {"$set": {"passages": ["Sushi"]}})
+        await apply_document_text(db, _text_event("d2", "b1", stored["version"]))
+        return index
+
+    index = asyncio.run(scenario())
+    assert index.search("pizza")[0]["document_id"] == "d2"
+    assert index.search("sushi") == []
+
+
+def test_text_write_of_unloaded_business_invalidates_builds(db):
+    mark = document_search._evictions.mark("b1")
+    asyncio.run(apply_document_text(db, _text_event("d3", "b1", "v1")))
+    assert "b1" not in document_search._indexes
+    assert document_search._evictions.mark("b1") != mark
+
+
+def test_text_delete_removes_document(db):
+    _load("b1", "d1")
+    index = _load("b2", "d2")
+    mark = document_search._evictions.mark("b1")
+    asyncio.run(apply_document_text(db, {"operationType": "delete", "documentKey": {"_id": "d2"}}))
+    assert document_search._indexes["b2"] is index
+    assert index.search("pasta") == []
+    assert document_search._indexes["b1"].search("pasta")
+    assert document_search._evictions.mark("b1") != mark
+
+
+def test_tokenize_drops_stopwords_and_folds_plurals():
+    assert tokenize("What are your Pastas and glass bowls?") == ["pasta", "glass", "bowl"]
+
+
+def test_split_passages_joins_lines_up_to_limit():
+    line = "word " * 50
+    passages = split_passages("\n".join([line] * 3) + "\n\n  short   line ")
+    assert all(len(passage) <= document_search.PASSAGE_MAX_CHARS for passage in passages)
+    assert passages[-1].endswith("short line")
+    assert split_passages("\n \n") == []
+
+
+def test_search_ranks_by_bm25():
+    index = BusinessSearchIndex()
+    index.add_document("menu", "menu.pdf", ["Fresh pasta and pasta sauces", "Wine list and desserts"])
+    index.add_document("hours", "hours.pdf", ["Open every day, pasta on Sundays only and many other things to do"])
+    results = index.search("pasta")
+    assert [result["document_id"] for result in results] == ["menu", "hours"]
+    assert results[0]["filename"] == "menu.pdf"
+    assert results[0]["snippet"] == "Fresh pasta and pasta sauces"
+    assert results[0]["score"] > results[1]["score"]
+    assert index.search("pasta", limit=1)[0]["document_id"] == "menu"
+    assert index.search("the and") == []
+    assert index.search("sushi") == []
+
+
+def test_remove_document_drops_its_postings():
+    index = BusinessSearchIndex()
+    index.add_document("menu", "menu.pdf", ["Fresh pasta"])
+    index.add_document("wine", "wine.pdf", ["Red wine"])
+    index.remove_document("menu")
+    assert index.search("pasta") == []
+    assert "pasta" not in index.postings
+    assert index.total_length == 2
+    assert [result["document_id"] for result in index.search("wine")] == ["wine"]
+
+
+def test_adding_a_document_again_replaces_it():
+    index = BusinessSearchIndex()
+    index.add_document("menu", "menu.pdf", ["Fresh pasta"])
+    index.add_document("menu", "menu.pdf", ["Pizza only"])
+    assert index.search("pasta") == []
+    assert index.search("pizza")[0]["document_id"] == "menu"
+    assert index.total_length == 2
+
+
+def test_snippet_is_cut_around_the_match():
+    text = "filler " * 60 + "lasagna " + "filler " * 60
+    index = BusinessSearchIndex()
+    index.add_document("menu", "menu.pdf", [text])
+    snippet = index.search("lasagna")[0]["snippet"]
+    assert "lasagna" in snippet
+    assert snippet.startswith("…") and snippet.endswith("…")
@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+import idempotency
+from idempotency import IdempotencyStore, request_fingerprint
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+FINGERPRINT = request_fingerprint("POST", "/api/business", '{"business_name": "Trattoria"}')
+OTHER_FINGERPRINT = request_fingerprint("POST", "/api/business", '{"business_name": "Osteria"}')
+
+
+@pytest.fixture
+def db():
+    return mongomock_motor.AsyncMongoMockClient()["test"]
+
+
+def _handler(calls: list, delay: float = 0):
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return {"id": len(calls)}
+    return handler
+
+
+def test_retry_is_replayed(db):
+    calls = []
+
+    async def scenario():
+        first = await IdempotencyStore().run(db, "u1", "create", "key", FINGERPRINT, _handler(calls))
+        # Another worker, so the replay comes from the stored record
+        second = await IdempotencyStore().run(db, "u1", "create", "key", FINGERPRINT, _handler(calls))
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == {"id": 1}
+    assert isinstance(second, JSONResponse)
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert len(calls) == 1
+
+
+def test_keys_are_scoped_to_user_and_operation(db):
+    calls = []
+
+    async def scenario():
+        store = IdempotencyStore()
+        await store.run(db, "u1", "create", "key", FINGERPRINT, _handler(calls))
+        await store.run(db, "u2", "create", "key", FINGERPRINT, _handler(calls))
+        await store.run(db, "u1", "upload", "key", FINGERPRINT, _handler(calls))
+
+    asyncio.run(scenario())
+    assert len(calls) == 3
+
+
+@pytest.mark.parametrize("same_worker", [True, False])
+def test_key_reused_for_another_request_is_refused(db, same_worker):
+    calls = []
+
+    async def scenario():
+        store = IdempotencyStore()
+        await store.run(db, "u1", "create", "key", FINGERPRINT, _handler(calls))
+        retry_store = store if same_worker else IdempotencyStore()
+        await retry_store.run(db, "u1", "create", "key", OTHER_FINGERPRINT, _handler(calls))
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(scenario())
+    assert error.value.status_code == 422
+    assert len(calls) == 1
+
+
+def test_concurrent_claims_execute_once(db, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_POLL_SECONDS", 0.01)
+    calls = []
+
+    async def scenario():
+        return await asyncio.gather(*[
+            IdempotencyStore().run(db, "u1", "create", "key", FINGERPRINT, _handler(calls, delay=0.1))
+            for _ in range(3)
+        ])
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert sum(isinstance(result, JSONResponse) for result in results) == 2
+
+
+def test_slow_handler_keeps_its_claim(db, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_LEASE_SECONDS", 0.15)
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_POLL_SECONDS", 0.01)
+    calls = []
+
+    async def scenario():
+        slow = asyncio.create_task(IdempotencyStore().run(db, "u1", "create", "key", FINGERPRINT, _handler(calls, delay=0.6)))
+        await asyncio.sleep(0.05)
+        retry = await IdempotencyStore().run(db, "u1", "create", "key", FINGERPRINT, _handler(calls))
+        return await slow, retry
+
+    first, retry = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert first == {"id": 1}
+    assert isinstance(retry, JSONResponse)
+
+
+def test_abandoned_claim_is_taken_over(db, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_LEASE_SECONDS", 0.05)
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_POLL_SECONDS", 0.01)
+    calls = []
+
+    async def scenario():
+        # A claim whose holder stopped without renewing or releasing it
+        await IdempotencyStore()._claim(db, "u1:create:key", FINGERPRINT)
+        return await IdempotencyStore().run(db, "u1", "create", "key", FINGERPRINT, _handler(calls))
+
+    assert asyncio.run(scenario()) == {"id": 1}
+    assert len(calls) == 1
+
+
+def test_failed_request_releases_its_key(db):
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        raise HTTPException(status_code=400, detail="Invalid")
+
+    async def scenario():
+        store = IdempotencyStore()
+        with pytest.raises(HTTPException):
+            await store.run(db, "u1", "create", "key", FINGERPRINT, failing)
+        return await store.run(db, "u1", "create", "key", FINGERPRINT, _handler(calls))
+
+    assert asyncio.run(scenario()) == {"id": 2}
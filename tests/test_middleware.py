@@ -0,0 +1,51 @@
+import pytest
+
+from auth import SessionCookieMiddleware
+
+
+def _client(app):
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+    return TestClient(app)
+
+
+def _extending_app(session_token):
+    from fastapi import FastAPI, Request
+
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping(request: Request):
+        request.state.extended_session_token = session_token
+        return {"ok": True}
+
+    app.add_middleware(SessionCookieMiddleware)
+    return app
+
+
+def test_server_timing_header(api):
+    response = api.client.get("/api/businesses")
+    assert response.status_code == 200
+    assert "total;dur=" in response.headers["Server-Timing"]
+
+
+def test_streamed_response_passes_through(api):
+    response = api.client.get("/api/account/export")
+    assert response.status_code == 200
+    assert "Server-Timing" in response.headers
+    assert response.text.count("\n") >= 2
+
+
+def test_extended_session_cookie_is_reissued():
+    client = _client(_extending_app("token-1"))
+    client.cookies.set("session_token", "token-1")
+    response = client.get("/ping")
+    assert response.json() == {"ok": True}
+    cookie = response.headers["set-cookie"]
+    assert cookie.startswith("session_token=token-1;")
+    assert "HttpOnly" in cookie and "Max-Age=" in cookie
+
+
+def test_header_session_gets_no_cookie():
+    client = _client(_extending_app("token-1"))
+    assert "set-cookie" not in client.get("/ping").headers
@@ -0,0 +1,58 @@
+import time
+
+from auth import NegativeSessionCache
+
+
+def test_added_token_is_a_hit():
+    cache = NegativeSessionCache(capacity=10, ttl=60)
+    assert "dead" not in cache
+    cache.add("dead")
+    assert "dead" in cache
+    assert cache.stats()["lookups"] == 2
+    assert cache.stats()["hits"] == 1
+
+
+def test_entries_decay_after_ttl():
+    cache = NegativeSessionCache(capacity=10, ttl=0.05)
+    cache.add("dead")
+    time.sleep(0.1)
+    assert "dead" not in cache
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_added_is_evicted_at_capacity():
+    cache = NegativeSessionCache(capacity=2, ttl=60)
+    cache.add("first")
+    cache.add("second")
+    cache.add("first")
+    cache.add("third")
+    assert "second" not in cache
+    assert "first" in cache
+    assert "third" in cache
+    assert cache.stats()["size"] == 2
+
+
+def test_created_session_counts_false_positive_hits():
+    cache = NegativeSessionCache(capacity=10, ttl=60)
+    cache.add("token")
+    assert "token" in cache
+    assert "token" in cache
+    cache.apply_change({"operationType": "insert", "fullDocument": {"session_token": "token"}})
+    assert "token" not in cache
+    assert cache.stats()["false_positive_hits"] == 2
+    assert cache.stats()["false_positive_rate"] == 1.0
+
+
+def test_other_changes_keep_entries():
+    cache = NegativeSessionCache(capacity=10, ttl=60)
+    cache.add("token")
+    cache.apply_change({"operationType": "delete", "documentKey": {"_id": "x"}})
+    assert "token" in cache
+
+
+def test_clear():
+    cache = NegativeSessionCache(capacity=10, ttl=60)
+    cache.add("token")
+    cache.clear()
+    assert "token" not in cache
+    assert cache.stats()["false_positive_rate"] == 0.0
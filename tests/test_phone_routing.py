@@ -0,0 +1,100 @@
+import pytest
+
+from phone_routing import normalize_phone, PhoneRoutingTable
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("(415) 555-2671", "+14155552671"),
+    ("415.555.2671", "+14155552671"),
+    ("1-415-555-2671", "+14155552671"),
+    ("+1 415 555 2671", "+14155552671"),
+    ("+1 415 555 2671 ext 12", "+14155552671"),
+    ("+44 20 7946 0958", "+442079460958"),
+    ("+44 (0)20 7946 0958", "+442079460958"),
+])
+def test_normalize_phone_valid(raw, expected):
+    assert normalize_phone(raw) == expected
+
+
+@pytest.mark.parametrize("raw", [
+    "",
+    None,
+    "not a number",
+    "555-1234",
+    "12345678",
+    "020 7946 0958",
+    "+1 415 555 26711",
+])
+def test_normalize_phone_invalid(raw):
+    assert normalize_phone(raw) is None
+
+
+def test_normalize_phone_default_region():
+    assert normalize_phone("020 7946 0958", "GB") == "+442079460958"
+
+
+def test_routing_table_set_and_move():
+    table = PhoneRoutingTable()
+    table.set("b1", "+14155552671")
+    assert table.lookup("+14155552671") == "b1"
+
+    table.set("b1", "+14155552672")
+    assert table.lookup("+14155552671") is None
+    assert table.lookup("+14155552672") == "b1"
+    assert len(table) == 1
+
+
+def test_routing_table_remove_keeps_number_taken_over():
+    table = PhoneRoutingTable()
+    table.set("b1", "+14155552671")
+    table.set("b2", "+14155552671")
+    table.remove("b1")
+    assert table.lookup("+14155552671") == "b2"
+
+
+def test_routing_table_apply_change():
+    table = PhoneRoutingTable()
+    table.apply_change({
+        "operationType": "update",
+        "documentKey": {"_id": "b1"},
+        "fullDocument": {"business_phone_e164": "+14155552671"}
+    })
+    assert table.lookup("+14155552671") == "b1"
+
+    table.apply_change({"operationType": "delete", "documentKey": {"_id": "b1"}})
+    assert table.lookup("+14155552671") is None
+
+
+def _profile(**changes):
+    return {
+        "business_name": "Trattoria",
+        "business_type": "Restaurant / Cafe",
+        "custom_services": [],
+        "business_phone": "(212) 555-0123",
+        **changes
+    }
+
+
+def test_create_routes_valid_number(api):
+    response = api.client.post("/api/business", json=_profile())
+    assert response.status_code == 200, response.text
+    business = response.json()
+    assert business["business_phone_e164"] == "+12125550123"
+
+
+def test_create_keeps_unroutable_number(api):
+    response = api.client.post("/api/business", json=_profile(business_phone="(555) 123-4567"))
+    assert response.status_code == 200, response.text
+    business = response.json()
+    assert business["business_phone"] == "(555) 123-4567"
+    assert business["business_phone_e164"] is None
+
+
+def test_name_only_edit_of_legacy_number(api):
+    business = api.client.post("/api/business", json=_profile(business_phone="+1 555 123 4567")).json()
+    response = api.client.put(
+        f"/api/business/{business['id']}",
+        json=_profile(business_name="Trattoria Roma", business_phone="+1 555 123 4567")
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()["business_name"] == "Trattoria Roma"
@@ -0,0 +1,83 @@
+import pytest
+
+import service_suggestions
+from service_suggestions import ServiceSuggestionIndex, normalize_service
+
+
+@pytest.fixture(autouse=True)
+def min_businesses(monkeypatch):
+    monkeypatch.setattr(service_suggestions, "SUGGESTION_MIN_BUSINESSES", 2)
+
+
+def _index() -> ServiceSuggestionIndex:
+    index = ServiceSuggestionIndex()
+    index.set_business("b1", "restaurant", ["Catering", "Delivery", "Private  dining"])
+    index.set_business("b2", "restaurant", ["catering", "Delivery"])
+    index.set_business("b3", "restaurant", ["Catering", "Cooking classes"])
+    return index
+
+
+def test_normalize_service():
+    assert normalize_service("  Private \t Dining ") == "private dining"
+
+
+def test_suggest_ranks_by_usage_above_threshold():
+    index = _index()
+    assert index.suggest("restaurant", "") == [
+        {"name": "Catering", "count": 3},
+        {"name": "Delivery", "count": 2}
+    ]
+    assert index.suggest("restaurant", "CAT") == [{"name": "Catering", "count": 3}]
+    assert index.suggest("restaurant", "private") == []
+    assert index.suggest("salon", "cat") == []
+    assert index.suggest("restaurant", "", limit=1) == [{"name": "Catering", "count": 3}]
+
+
+def test_duplicates_within_a_business_count_once():
+    index = ServiceSuggestionIndex()
+    index.set_business("b1", "salon", ["Nails", "nails ", "NAILS", 42, ""])
+    index.set_business("b2", "salon", ["Nails"])
+    assert index.suggest("salon", "n") == [{"name": "Nails", "count": 2}]
+
+
+def test_update_applies_only_the_difference():
+    index = _index()
+    assert index.suggest("restaurant", "d") == [{"name": "Delivery", "count": 2}]
+    index.set_business("b2", "restaurant", ["Catering"])
+    assert index.suggest("restaurant", "d") == []
+    assert index.suggest("restaurant", "c")[0] == {"name": "Catering", "count": 3}
+    index.set_business("b3", "restaurant", ["Catering", "Cooking classes", "Delivery"])
+    assert index.suggest("restaurant", "d") == [{"name": "Delivery", "count": 2}]
+
+
+def test_type_change_moves_services():
+    index = _index()
+    index.set_business("b3", "cafe", ["Catering"])
+    index.set_business("b4", "cafe", ["Catering"])
+    assert index.suggest("restaurant", "cat") == [{"name": "Catering", "count": 2}]
+    assert index.suggest("cafe", "cat") == [{"name": "Catering", "count": 2}]
+    index.set_business("b4", None, ["Catering"])
+    assert index.suggest("cafe", "cat") == []
+    assert index.stats()["businesses"] == 3
+
+
+def test_remove_business():
+    index = _index()
+    index.remove_business("b1")
+    index.remove_business("unknown")
+    assert index.suggest("restaurant", "") == [{"name": "Catering", "count": 2}]
+    assert "private dining" not in index._types["restaurant"].names
+
+
+def test_apply_change():
+    index = _index()
+    index.apply_change({
+        "operationType": "update",
+        "documentKey": {"_id": "b4"},
+        "fullDocument": {"business_type": "restaurant", "custom_services": ["Private dining"]}
+    })
+    assert index.suggest("restaurant", "priv") == [{"name": "Private dining", "count": 2}]
+    index.apply_change({"operationType": "update", "documentKey": {"_id": "b4"}, "fullDocument": None})
+    assert index.suggest("restaurant", "priv") == []
+    index.apply_change({"operationType": "delete", "documentKey": {"_id": "b2"}})
+    assert index.suggest("restaurant", "d") == []
@@ -0,0 +1,133 @@
+import asyncio
+import os
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from models import UserSession
+from session_store import MemorySessionStore, RedisSessionStore, SessionStore
+
+
+def _redis_store():
+    # A local server when SESSION_TEST_REDIS_URL is set, fakeredis otherwise
+    url = os.environ.get("SESSION_TEST_REDIS_URL")
+    if url:
+        pytest.importorskip("redis")
+        return RedisSessionStore(url, prefix="session-test:")
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisSessionStore(client=fakeredis.aioredis.FakeRedis(decode_responses=True))
+
+
+@pytest.fixture(params=["memory", "redis"])
+def make_store(request):
+    if request.param == "memory":
+        return MemorySessionStore
+    return _redis_store
+
+
+def _session(token: str, seconds: float = 3600) -> UserSession:
+    return UserSession(
+        user_id="user-1",
+        session_token=token,
+        expires_at=datetime.now(timezone.utc) + timedelta(seconds=seconds)
+    )
+
+
+def run(make_store, scenario):
+    async def main():
+        store = make_store()
+        await store.setup()
+        try:
+            return await scenario(store)
+        finally:
+            await store.close()
+
+    return asyncio.run(main())
+
+
+def test_create_and_get(make_store):
+    session = _session("token-create")
+
+    async def scenario(store):
+        await store.create(session)
+        found = await store.get("token-create")
+        missing = await store.get("token-unknown")
+        await store.delete("token-create")
+        return found, missing
+
+    found, missing = run(make_store, scenario)
+    assert found["user_id"] == "user-1"
+    assert abs((found["expires_at"] - session.expires_at).total_seconds()) < 2
+    assert missing is None
+
+
+def test_create_is_idempotent(make_store):
+    async def scenario(store):
+        await store.create(_session("token-replay"))
+        replay = _session("token-replay", seconds=7200)
+        replay.user_id = "user-2"
+        await store.create(replay)
+        found = await store.get("token-replay")
+        await store.delete("token-replay")
+        return found
+
+    found = run(make_store, scenario)
+    assert found["user_id"] == "user-1"
+    assert found["expires_at"] < datetime.now(timezone.utc) + timedelta(seconds=3700)
+
+
+def test_delete(make_store):
+    async def scenario(store):
+        await store.create(_session("token-delete"))
+        first = await store.delete("token-delete")
+        second = await store.delete("token-delete")
+        return first, second, await store.get("token-delete")
+
+    assert run(make_store, scenario) == (True, False, None)
+
+
+def test_expired_session_is_gone(make_store):
+    async def scenario(store):
+        await store.create(_session("token-expire", seconds=0.2))
+        await asyncio.sleep(0.3)
+        return await store.get("token-expire")
+
+    assert run(make_store, scenario) is None
+
+
+def test_extend_many_moves_expiry_without_reviving(make_store):
+    now = datetime.now(timezone.utc)
+    later = now + timedelta(days=2)
+
+    async def scenario(store):
+        await store.create(_session("token-extend"))
+        await store.create(_session("token-logout"))
+        await store.delete("token-logout")
+        extended = await store.extend_many({
+            "token-extend": (now, later),
+            "token-logout": (now, later)
+        })
+        found = await store.get("token-extend"), await store.get("token-logout")
+        await store.delete("token-extend")
+        return extended, found
+
+    extended, (found, revived) = run(make_store, scenario)
+    assert extended == 2
+    assert abs((found["expires_at"] - later).total_seconds()) < 2
+    assert revived is None
+
+
+def test_extend_many_empty(make_store):
+    async def scenario(store):
+        return await store.extend_many({})
+
+    assert run(make_store, scenario) == 0
+
+
+def test_incomplete_backend_cannot_be_instantiated():
+    class GetOnlyStore(SessionStore):
+        async def get(self, session_token):
+            return None
+
+    with pytest.raises(TypeError):
+        GetOnlyStore()
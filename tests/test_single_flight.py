@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flight = SingleFlight(memo_ttl=10)
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*[flight.do("key", work) for _ in range(5)])
+        return flight, calls, results
+
+    flight, calls, results = asyncio.run(scenario())
+    assert calls == 1
+    assert results == ["result"] * 5
+    assert flight.stats()["shared"] == 4
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_result_is_memoized():
+    async def scenario():
+        flight = SingleFlight(memo_ttl=10)
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            return calls
+
+        return [await flight.do("key", work), await flight.do("key", work)], flight
+
+    results, flight = asyncio.run(scenario())
+    assert results == [1, 1]
+    assert flight.memo_hits == 1
+
+
+def test_failure_is_shared_but_not_memoized():
+    async def scenario():
+        flight = SingleFlight(memo_ttl=10)
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(flight.do("key", work), flight.do("key", work), return_exceptions=True)
+        with pytest.raises(ValueError):
+            await flight.do("key", work)
+        return calls, results
+
+    calls, results = asyncio.run(scenario())
+    assert calls == 2
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def scenario():
+        flight = SingleFlight(memo_ttl=10)
+        started = asyncio.Event()
+
+        async def work():
+            started.set()
+            await asyncio.sleep(0.05)
+            return "result"
+
+        leader = asyncio.create_task(flight.do("key", work))
+        await started.wait()
+        follower = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower, flight
+
+    result, flight = asyncio.run(scenario())
+    assert result == "result"
+    assert flight.executions == 1
+
+
+def test_call_completes_when_every_caller_is_cancelled():
+    async def scenario():
+        flight = SingleFlight(memo_ttl=10)
+        done = asyncio.Event()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            done.set()
+            return "result"
+
+        caller = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0)
+        caller.cancel()
+        await asyncio.wait_for(done.wait(), 1)
+        await asyncio.sleep(0)
+        return await flight.do("key", work), flight
+
+    result, flight = asyncio.run(scenario())
+    assert result == "result"
+    assert flight.memo_hits == 1
@@ -0,0 +1,154 @@
+import asyncio
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+import server
+import storage_quota
+from storage_quota import (
+    QuotaExceededError, get_storage_usage, release_business_storage, release_storage, repair_storage_usage,
+    reserve_storage
+)
+
+
+@pytest.fixture
+def db():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    return mongomock_motor.AsyncMongoMockClient()["test"]
+
+
+@pytest.fixture(autouse=True)
+def small_quota(monkeypatch):
+    monkeypatch.setattr(storage_quota, "USER_STORAGE_QUOTA_BYTES", 1000)
+    monkeypatch.setattr(storage_quota, "USER_STORAGE_QUOTA_FILES", 3)
+
+
+def _usage(db, user_id="u1"):
+    return asyncio.run(get_storage_usage(db, user_id))
+
+
+def test_first_reservation_creates_counters(db):
+    asyncio.run(reserve_storage(db, "u1", "b1", 400))
+    usage = _usage(db)
+    assert (usage["bytes"], usage["files"]) == (400, 1)
+    assert usage["businesses"] == {"b1": {"bytes": 400, "files": 1}}
+
+
+def test_reservation_over_quota_is_refused(db):
+    async def scenario():
+        await reserve_storage(db, "u1", "b1", 600)
+        with pytest.raises(QuotaExceededError):
+            await reserve_storage(db, "u1", "b2", 500)
+        await reserve_storage(db, "u1", "b2", 400)
+        with pytest.raises(QuotaExceededError):
+            await reserve_storage(db, "u2", "b3", 1001)
+
+    asyncio.run(scenario())
+    usage = _usage(db)
+    assert (usage["bytes"], usage["files"]) == (1000, 2)
+    assert usage["businesses"]["b2"] == {"bytes": 400, "files": 1}
+    assert _usage(db, "u2")["bytes"] == 0
+
+
+def test_reservation_over_file_quota_is_refused(db):
+    async def scenario():
+        for _ in range(3):
+            await reserve_storage(db, "u1", "b1", 1)
+        with pytest.raises(QuotaExceededError):
+            await reserve_storage(db, "u1", "b1", 1)
+
+    asyncio.run(scenario())
+    assert _usage(db)["files"] == 3
+
+
+def test_release(db):
+    async def scenario():
+        await reserve_storage(db, "u1", "b1", 300)
+        await reserve_storage(db, "u1", "b2", 200)
+        await release_storage(db, "u1", "b1", 300)
+
+    asyncio.run(scenario())
+    usage = _usage(db)
+    assert (usage["bytes"], usage["files"]) == (200, 1)
+    assert usage["businesses"]["b1"] == {"bytes": 0, "files": 0}
+
+
+def test_release_business_storage(db):
+    async def scenario():
+        await reserve_storage(db, "u1", "b1", 300)
+        await reserve_storage(db, "u1", "b1", 100)
+        await reserve_storage(db, "u1", "b2", 200)
+        await release_business_storage(db, "u1", "b1")
+        # A second release finds nothing left to give back
+        await release_business_storage(db, "u1", "b1")
+
+    asyncio.run(scenario())
+    usage = _usage(db)
+    assert (usage["bytes"], usage["files"]) == (200, 1)
+    assert list(usage["businesses"]) == ["b2"]
+
+
+def _seed_repair(db, changed_at):
+    async def seed():
+        await db.users.insert_one({"_id": "u1"})
+        await db.business_profiles.insert_one(
+            {"_id": "b1", "user_id": "u1", "logo_url": "/api/business/b1/logo/l1", "logo_size": 50}
+        )
+        await db.business_documents.insert_many([
+            {"id": "d1", "business_id": "b1", "size": 100},
+            {"id": "d2", "business_id": "b1", "size": 200}
+        ])
+        # Drifted counters, and one of a business deleted meanwhile
+        await db.storage_usage.insert_many([
+            {"_id": "user:u1", "kind": "user", "bytes": 999, "files": 9, "changed_at": changed_at},
+            {"_id": "business:b1", "kind": "business", "user_id": "u1", "bytes": 100, "files": 1, "changed_at": changed_at},
+            {"_id": "business:gone", "kind": "business", "user_id": "u1", "bytes": 70, "files": 1, "changed_at": changed_at}
+        ])
+
+    asyncio.run(seed())
+
+
+def test_repair_corrects_drift(db, tmp_path):
+    _seed_repair(db, datetime.now(timezone.utc) - timedelta(days=1))
+    repaired = asyncio.run(repair_storage_usage(db, tmp_path))
+    usage = _usage(db)
+    assert repaired == 3
+    assert (usage["bytes"], usage["files"]) == (350, 3)
+    assert usage["businesses"] == {"b1": {"bytes": 350, "files": 3}}
+    assert asyncio.run(repair_storage_usage(db, tmp_path)) == 0
+
+
+def test_repair_skips_recently_changed_counters(db, tmp_path):
+    _seed_repair(db, datetime.now(timezone.utc))
+    assert asyncio.run(repair_storage_usage(db, tmp_path)) == 0
+    usage = _usage(db)
+    assert (usage["bytes"], usage["files"]) == (999, 9)
+    assert "gone" in usage["businesses"]
+
+
+def test_failed_upload_removes_its_file(api, monkeypatch):
+    def broken_extract(source, file_ext):
+        raise RuntimeError("extraction failed")
+
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(server, "extract_text", broken_extract)
+    client = TestClient(server.app, raise_server_exceptions=False)
+    response = client.post(
+        f"/api/business/{api.business_id}/upload-document",
+        files={"file": ("menu.pdf", b"%PDF-1.4 menu", "application/pdf")}
+    )
+    assert response.status_code == 500
+    assert list(api.upload_dir.glob("*.pdf")) == []
+    assert asyncio.run(api.db.business_documents.count_documents({})) == 0
+    usage = asyncio.run(get_storage_usage(api.db, api.user.id))
+    assert (usage["bytes"], usage["files"]) == (0, 0)
+
+
+def test_upload_over_quota(api):
+    response = api.client.post(
+        f"/api/business/{api.business_id}/upload-document",
+        files={"file": ("menu.pdf", b"x" * 1001, "application/pdf")}
+    )
+    assert response.status_code == 413
+    assert list(api.upload_dir.glob("*.pdf")) == []
@@ -0,0 +1,75 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from migrations import migrate_logo_ids
+from upload_reconciler import reconcile_uploads
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+def _write(directory, name, age_seconds=0):
+    path = directory / name
+    path.write_bytes(b"x" * 10)
+    if age_seconds:
+        mtime = time.time() - age_seconds
+        os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def db():
+    return mongomock_motor.AsyncMongoMockClient()["test"]
+
+
+@pytest.fixture
+def upload_dir(tmp_path):
+    for name in ["doc-a.pdf", "doc-b.docx", "logo-a.png", "orphan-a.pdf", "orphan-b.png"]:
+        _write(tmp_path, name, age_seconds=2 * 24 * 60 * 60)
+    _write(tmp_path, "recent.pdf")
+    (tmp_path / "partial").mkdir()
+    return tmp_path
+
+
+async def _seed(db):
+    await db.business_documents.insert_many([{"id": "doc-a"}, {"id": "doc-b"}])
+    await db.business_profiles.insert_one({"logo_url": "/api/business/b1/logo/logo-a", "logo_id": "logo-a"})
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 1000])
+def test_removes_only_old_unreferenced_files(db, upload_dir, batch_size):
+    async def scenario():
+        await _seed(db)
+        return await reconcile_uploads(db, upload_dir, batch_size=batch_size)
+
+    report = asyncio.run(scenario())
+    assert report["scanned"] == 6
+    assert report["removed"] == 2
+    assert report["bytes_reclaimed"] == 20
+    assert sorted(os.listdir(upload_dir)) == ["doc-a.pdf", "doc-b.docx", "logo-a.png", "partial", "recent.pdf"]
+
+
+def test_dry_run_keeps_files(db, upload_dir):
+    async def scenario():
+        await _seed(db)
+        return await reconcile_uploads(db, upload_dir, dry_run=True)
+
+    report = asyncio.run(scenario())
+    assert report["removed"] == 2
+    assert (upload_dir / "orphan-a.pdf").exists()
+
+
+def test_waits_for_logo_id_migration(db, upload_dir):
+    async def scenario():
+        await _seed(db)
+        await db.business_profiles.insert_one({"logo_url": "/api/business/b2/logo/orphan-b"})
+        skipped = await reconcile_uploads(db, upload_dir)
+        await migrate_logo_ids(db)
+        return skipped, await reconcile_uploads(db, upload_dir)
+
+    skipped, report = asyncio.run(scenario())
+    assert skipped["skipped"] and skipped["removed"] == 0
+    assert report["removed"] == 1
+    assert (upload_dir / "orphan-b.png").exists()
+    assert not (upload_dir / "orphan-a.pdf").exists()